@@ -0,0 +1,70 @@
+"""测量命令行入口的冷启动耗时，并检查是否导入了界面库
+
+用法: python benchmarks/bench_cold_start.py [--runs 10] [--budget-ms 150]
+超出预算或导入了界面库时以非零退出码结束，可用于持续集成检查。
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, "fit2gpx_cli.py")
+GUI_MODULES = ("tkinter", "ttkbootstrap", "PIL", "fit2gpx_converter")
+
+
+def measure_wall_ms(runs):
+    """多次启动 `fit2gpx_cli.py --help`，返回每次的耗时（毫秒）"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, CLI, "--help"], check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def imported_gui_modules():
+    """用 -X importtime 检查命令行启动时导入了哪些界面库"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", CLI, "--help"],
+                          check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    found = set()
+    for line in proc.stderr.splitlines():
+        name = line.rsplit("|", 1)[-1].strip()
+        if name.split(".")[0] in GUI_MODULES:
+            found.add(name.split(".")[0])
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="命令行冷启动耗时测试")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="冷启动耗时中位数预算（毫秒）")
+    args = parser.parse_args()
+
+    baseline = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        baseline.append((time.perf_counter() - start) * 1000)
+
+    timings = measure_wall_ms(args.runs)
+    median = statistics.median(timings)
+    gui = imported_gui_modules()
+
+    print(f"解释器空启动中位数: {statistics.median(baseline):.1f} ms")
+    print(f"fit2gpx_cli.py --help 中位数: {median:.1f} ms（最小 {min(timings):.1f} ms，最大 {max(timings):.1f} ms）")
+    print(f"预算: {args.budget_ms:.1f} ms")
+    if gui:
+        print(f"失败：命令行启动时导入了界面库 {', '.join(gui)}")
+        return 1
+    if median > args.budget_ms:
+        print("失败：冷启动耗时超出预算")
+        return 1
+    print("通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""测量压缩输出GPX的文件大小和耗时
+
+用法:
+    python benchmarks/bench_compress.py --records 3600 36000
+    python benchmarks/bench_compress.py --records 36000 --levels gz:1 gz:6 gz:9 zst:1 zst:3 zst:19
+
+同一个带传感器数据的文件交替进行不压缩和按各压缩格式、级别的转换（输出全部扩展字段），报告输出大小、压缩率、
+转换耗时中位数和相对不压缩的额外耗时（每轮比值的中位数，减少机器负载波动的影响），以及把不压缩的GPX
+在同一线程中一次压缩所需的时间，即压缩不与转换同时进行时会增加的耗时；并确认解压后的内容与不压缩时逐字节相同。
+压缩在后台线程中进行，只有一个CPU核心时无法与转换重叠。未安装 zstandard 时跳过 zst。
+"""
+import os
+import sys
+import gzip
+import time
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_core import EXTENSION_FIELDS, ConversionOptions, fit_to_gpx
+from fit2gpx_compress import has_zstandard
+from benchmarks.fit_synth import write_fit
+
+
+def decompress(path, compression):
+    if compression == 'gz':
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+    import zstandard
+    with open(path, 'rb') as f:
+        return zstandard.ZstdDecompressor().stream_reader(f).read()
+
+
+def compress(data, compression, level):
+    if compression == 'gz':
+        return gzip.compress(data, level, mtime=0)
+    import zstandard
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def median_seconds(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def time_rounds(fit_path, gpx_paths, options_list, repeat):
+    """每轮依次用各个选项转换一次，返回每个选项的耗时列表（秒）"""
+    times = [[] for _ in options_list]
+    for _ in range(repeat):
+        for gpx_path, options, elapsed in zip(gpx_paths, options_list, times):
+            start = time.perf_counter()
+            fit_to_gpx(fit_path, gpx_path, options)
+            elapsed.append(time.perf_counter() - start)
+    return times
+
+
+def parse_level(text):
+    compression, _, level = text.partition(':')
+    return compression, int(level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩输出GPX的大小和耗时测试")
+    parser.add_argument("--records", type=int, nargs="+", default=[3600, 36000], help="每个文件的记录数（1Hz）")
+    parser.add_argument("--levels", nargs="+", default=["gz:1", "gz:6", "gz:9", "zst:1", "zst:3", "zst:9"],
+                        metavar="FORMAT:LEVEL", help="要测量的压缩格式和级别")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    levels = [parse_level(text) for text in args.levels]
+    if not has_zstandard():
+        print("未安装zstandard，跳过 zst")
+        levels = [(compression, level) for compression, level in levels if compression != 'zst']
+    mismatched = False
+    print(f"{os.cpu_count()} 个CPU核心")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for records in args.records:
+            fit_path = write_fit(os.path.join(temp_dir, f"bench_{records}.fit"), records, sensors=True)
+            plain_path = os.path.join(temp_dir, f"bench_{records}.gpx")
+            gpx_paths = [plain_path] + [f"{plain_path}.{level}.{compression}" for compression, level in levels]
+            options_list = [ConversionOptions(extensions=EXTENSION_FIELDS)] + [
+                ConversionOptions(extensions=EXTENSION_FIELDS, compression=compression, compression_level=level)
+                for compression, level in levels]
+            times = time_rounds(fit_path, gpx_paths, options_list, args.repeat)
+            with open(plain_path, 'rb') as f:
+                plain = f.read()
+            print(f"{records:>7} 条记录  不压缩     {len(plain) / 1024:9.0f} KB          "
+                  f"转换 {statistics.median(times[0]) * 1000:8.1f} ms")
+            for (compression, level), gpx_path, elapsed in zip(levels, gpx_paths[1:], times[1:]):
+                overhead = (statistics.median(e / p for p, e in zip(times[0], elapsed)) - 1) * 100
+                inline = median_seconds(lambda: compress(plain, compression, level), args.repeat)
+                size = os.path.getsize(gpx_path)
+                identical = decompress(gpx_path, compression) == plain
+                mismatched = mismatched or not identical
+                print(f"{'':>13}  {compression + ':' + str(level):<9} {size / 1024:9.0f} KB  {len(plain) / size:5.1f}×  "
+                      f"转换 {statistics.median(elapsed) * 1000:8.1f} ms（{overhead:+6.1f}%）  "
+                      f"单独压缩 {inline * 1000:8.1f} ms  {'解压后相同' if identical else '解压后不同！'}")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
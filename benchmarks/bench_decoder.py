@@ -0,0 +1,44 @@
+"""对比record消息的快速解码器与fitparse逐字段读取的耗时
+
+用法: python benchmarks/bench_decoder.py --records 3600 36000 86400
+"""
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_decoder import RecordDecoder, FitparseRecordDecoder
+from benchmarks.fit_synth import build_fit
+
+
+def time_decode(decoder_class, data, repeat):
+    """返回多次完整解码中的最短耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _chunk in decoder_class(data):
+            pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="record解码器耗时对比")
+    parser.add_argument("--records", type=int, nargs="+", default=[3600, 36000, 86400])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for records in args.records:
+        data = build_fit(records)
+        slow = time_decode(FitparseRecordDecoder, data, 1)
+        fast = time_decode(RecordDecoder, data, args.repeat)
+        print(f"{records:>7} 条记录  fitparse {slow * 1000:9.1f} ms  快速解码器 {fast * 1000:8.1f} ms  "
+              f"加速 {slow / fast:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
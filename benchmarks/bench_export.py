@@ -0,0 +1,100 @@
+"""测量按列导出的额外耗时，以及读回整批活动各列的耗时（导出数据集 vs 解析GPX）
+
+用法:
+    python benchmarks/bench_export.py --files 40 --records 3600
+
+生成 files 个带传感器数据的活动，分别只转换GPX、转换GPX并按列导出，再比较读回全部活动的
+时间、经纬度、海拔、心率各列所需的时间：读取导出数据集（Parquet用pyarrow，CSV用csv模块），
+或用gpxpy解析GPX文件（GPX中的心率来自扩展数据）。
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_core import ConversionOptions, fit_to_gpx
+from fit2gpx_columnar import resolve_format
+from benchmarks.fit_synth import write_fit
+
+
+def convert_all(paths, output_dir, options):
+    start = time.perf_counter()
+    for path in paths:
+        fit_to_gpx(path, os.path.join(output_dir, os.path.basename(path)[:-4] + '.gpx'), options)
+    return time.perf_counter() - start
+
+
+def load_export(export_dir, export_format):
+    """读回导出数据集，返回 (耗时, 行数)"""
+    start = time.perf_counter()
+    if export_format == 'parquet':
+        import pyarrow.dataset as ds
+        table = ds.dataset(export_dir, format='parquet', partitioning='hive').to_table(
+            columns=['activity', 'time', 'latitude', 'longitude', 'altitude', 'heart_rate'])
+        rows = table.num_rows
+    else:
+        rows = 0
+        for partition in sorted(os.listdir(export_dir)):
+            with open(os.path.join(export_dir, partition, 'part-0.csv'), encoding='utf-8', newline='') as f:
+                columns = list(zip(*csv.reader(f)))
+            rows += len(columns[0]) - 1
+    return time.perf_counter() - start, rows
+
+
+def load_gpx(gpx_dir):
+    """用gpxpy解析全部GPX文件并取出同样的列，返回 (耗时, 点数)"""
+    import gpxpy
+    start = time.perf_counter()
+    rows = 0
+    for name in sorted(os.listdir(gpx_dir)):
+        with open(os.path.join(gpx_dir, name), encoding='utf-8') as f:
+            gpx = gpxpy.parse(f)
+        for track in gpx.tracks:
+            for segment in track.segments:
+                columns = [(p.time, p.latitude, p.longitude, p.elevation,
+                            [e.findtext('.//{*}hr') for e in p.extensions]) for p in segment.points]
+                rows += len(columns)
+    return time.perf_counter() - start, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按列导出耗时与读回耗时测试")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--records", type=int, default=3600)
+    parser.add_argument("--format", choices=("parquet", "csv"), help="导出格式（默认有pyarrow时为parquet）")
+    args = parser.parse_args()
+    export_format = resolve_format(args.format)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fit_dir = os.path.join(temp_dir, 'fit')
+        os.makedirs(fit_dir)
+        paths = [write_fit(os.path.join(fit_dir, f"ride_{i:03d}.fit"), args.records, sensors=True,
+                           start_time=1000000000 + i * 86400) for i in range(args.files)]
+        plain_dir = os.path.join(temp_dir, 'gpx_plain')
+        export_gpx_dir = os.path.join(temp_dir, 'gpx_export')
+        export_dir = os.path.join(temp_dir, 'export')
+        os.makedirs(plain_dir)
+        os.makedirs(export_gpx_dir)
+
+        extensions = ('heart_rate',)
+        plain = convert_all(paths, plain_dir, ConversionOptions(extensions))
+        exported = convert_all(paths, export_gpx_dir, ConversionOptions(
+            extensions, export_dir=export_dir, export_format=export_format))
+        print(f"{args.files} 个活动 × {args.records} 条记录，导出格式 {export_format}")
+        print(f"转换GPX          {plain:8.2f} 秒")
+        print(f"转换GPX并按列导出 {exported:8.2f} 秒（额外 {exported / plain - 1:+.1%}）")
+
+        export_time, export_rows = load_export(export_dir, export_format)
+        gpx_time, gpx_rows = load_gpx(plain_dir)
+        print(f"读回导出数据集    {export_time:8.3f} 秒  {export_rows} 行")
+        print(f"用gpxpy解析GPX    {gpx_time:8.3f} 秒  {gpx_rows} 点（慢 {gpx_time / export_time:.0f} 倍）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""测量输出GPX扩展数据（心率、踏频、功率、温度、速度）带来的额外耗时
+
+用法:
+    python benchmarks/bench_extensions.py --records 3600 36000
+
+同一个带传感器数据的文件交替进行只输出位置和输出全部扩展字段的转换，
+取每对转换耗时比值的中位数，减少机器负载波动的影响；额外耗时应低于 --budget（默认15%）。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_core import EXTENSION_FIELDS, ConversionOptions, fit_to_gpx
+from benchmarks.fit_synth import write_fit
+
+
+def time_pairs(fit_path, gpx_path, repeat):
+    """交替转换，返回 (仅位置耗时列表, 全部扩展耗时列表)，单位为秒"""
+    plain_options = ConversionOptions()
+    extended_options = ConversionOptions(extensions=EXTENSION_FIELDS)
+    plain, extended = [], []
+    for _ in range(repeat):
+        for options, times in ((plain_options, plain), (extended_options, extended)):
+            start = time.perf_counter()
+            fit_to_gpx(fit_path, gpx_path, options)
+            times.append(time.perf_counter() - start)
+    return plain, extended
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPX扩展数据输出耗时测试")
+    parser.add_argument("--records", type=int, nargs="+", default=[3600, 36000], help="每个文件的记录数（1Hz）")
+    parser.add_argument("--repeat", type=int, default=21)
+    parser.add_argument("--budget", type=float, default=15.0, help="允许的额外耗时百分比")
+    args = parser.parse_args()
+
+    over_budget = False
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for records in args.records:
+            fit_path = write_fit(os.path.join(temp_dir, f"bench_{records}.fit"), records, sensors=True)
+            gpx_path = os.path.join(temp_dir, f"bench_{records}.gpx")
+            plain, extended = time_pairs(fit_path, gpx_path, args.repeat)
+            overhead = (statistics.median(e / p for p, e in zip(plain, extended)) - 1) * 100
+            over_budget = over_budget or overhead > args.budget
+            print(f"{records:>7} 条记录  仅位置 {statistics.median(plain) * 1000:8.1f} ms  "
+                  f"全部扩展 {statistics.median(extended) * 1000:8.1f} ms  额外耗时 {overhead:+6.1f}%")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
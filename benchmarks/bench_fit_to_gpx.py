@@ -0,0 +1,69 @@
+"""测量单个文件 fit_to_gpx 的耗时，可与历史版本对比
+
+用法:
+    python benchmarks/bench_fit_to_gpx.py --records 3600 36000
+    python benchmarks/bench_fit_to_gpx.py --records 36000 --ref HEAD~1
+
+--ref 指定一个git版本，从该版本取出 fit2gpx_core.py 一起测量，便于比较修改前后的耗时。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fit2gpx_core
+from benchmarks.fit_synth import write_fit
+
+
+def load_core_from_git(revision, temp_dir):
+    """从git历史中取出指定版本的 fit2gpx_core.py 并作为独立模块加载"""
+    source = subprocess.run(["git", "show", f"{revision}:fit2gpx_core.py"], cwd=ROOT,
+                            check=True, stdout=subprocess.PIPE).stdout
+    path = os.path.join(temp_dir, "fit2gpx_core_ref.py")
+    with open(path, "wb") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("fit2gpx_core_ref", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_convert(core, fit_path, gpx_path, repeat):
+    """返回多次转换中的最短耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        core.fit_to_gpx(fit_path, gpx_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fit_to_gpx 单文件耗时测试")
+    parser.add_argument("--records", type=int, nargs="+", default=[3600, 36000], help="每个文件的记录数（1Hz）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ref", help="用于对比的git版本")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cores = [("当前", fit2gpx_core)]
+        if args.ref:
+            cores.append((args.ref, load_core_from_git(args.ref, temp_dir)))
+
+        for records in args.records:
+            fit_path = write_fit(os.path.join(temp_dir, f"bench_{records}.fit"), records)
+            gpx_path = os.path.join(temp_dir, f"bench_{records}.gpx")
+            for label, core in cores:
+                elapsed = time_convert(core, fit_path, gpx_path, args.repeat)
+                print(f"{records:>7} 条记录  {label:<10} {elapsed * 1000:9.1f} ms  {records / elapsed:10.0f} 记录/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""测量活动索引在大量活动下按区域、时间查询的耗时
+
+用法:
+    python benchmarks/bench_index.py --activities 10000 100000
+
+随机生成分布在约 10°×10° 范围、5年时间内的活动摘要写入临时索引，对比R-tree查询与直接扫描 activities 表
+（相同条件，不使用R-tree）的耗时中位数，并确认两者结果相同。
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from fit2gpx_index import ActivityIndex, encode_polyline
+
+BASE_TIME = 1600000000
+SPAN = 5 * 365 * 86400
+REGION = (30.0, 115.0, 40.0, 125.0)
+
+
+def synth_summary(rng, polyline_points):
+    """随机生成一个活动摘要：起点附近的随机游走"""
+    lat0 = rng.uniform(REGION[0], REGION[2])
+    lon0 = rng.uniform(REGION[1], REGION[3])
+    steps = rng.uniform(-0.002, 0.002, size=(polyline_points, 2)) * rng.uniform(1, 20)
+    path = np.cumsum(steps, axis=0) + (lat0, lon0)
+    start = BASE_TIME + int(rng.uniform(0, SPAN))
+    return {
+        'min_lat': float(path[:, 0].min()), 'min_lon': float(path[:, 1].min()),
+        'max_lat': float(path[:, 0].max()), 'max_lon': float(path[:, 1].max()),
+        'start': start, 'end': start + int(rng.uniform(1800, 6 * 3600)),
+        'points': int(rng.uniform(1000, 20000)), 'distance': float(rng.uniform(1000, 100000)),
+        'polyline': encode_polyline(path[:, 0], path[:, 1]),
+    }
+
+
+def scan_query(conn, bbox=None, start=None, end=None):
+    """不使用R-tree、与 ActivityIndex.query 条件相同的查询"""
+    conditions, params = [], []
+    if bbox is not None:
+        conditions += ["max_lat >= ?", "min_lat <= ?", "max_lon >= ?", "min_lon <= ?"]
+        params += [bbox[0], bbox[2], bbox[1], bbox[3]]
+    if start is not None:
+        conditions += ["end_time >= ?"]
+        params += [start]
+    if end is not None:
+        conditions += ["start_time <= ?"]
+        params += [end]
+    sql = "SELECT * FROM activities WHERE " + " AND ".join(conditions) + " ORDER BY start_time"
+    return [dict(row) for row in conn.execute(sql, params)]
+
+
+def median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="活动索引查询耗时测试")
+    parser.add_argument("--activities", type=int, nargs="+", default=[10000, 100000], help="索引中的活动数")
+    parser.add_argument("--polyline-points", type=int, default=20, help="每个活动抽稀轨迹的点数")
+    parser.add_argument("--repeat", type=int, default=21)
+    args = parser.parse_args()
+
+    month_start = BASE_TIME + SPAN // 2
+    queries = (
+        ("区域 0.1°×0.1°", dict(bbox=(35.0, 120.0, 35.1, 120.1))),
+        ("区域 1°×1°", dict(bbox=(35.0, 120.0, 36.0, 121.0))),
+        ("时间 1个月", dict(start=month_start, end=month_start + 30 * 86400)),
+        ("区域 1°×1° + 1个月", dict(bbox=(35.0, 120.0, 36.0, 121.0), start=month_start, end=month_start + 30 * 86400)),
+    )
+    for count in args.activities:
+        rng = np.random.default_rng(count)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "index.sqlite")
+            index = ActivityIndex(path)
+            start = time.perf_counter()
+            for i in range(count):
+                index.add(f"activity_{i}.fit", f"activity_{i}.gpx", synth_summary(rng, args.polyline_points))
+            index.commit()
+            built = time.perf_counter() - start
+            print(f"{count:>7} 个活动  建立索引 {built:6.1f} s  文件 {os.path.getsize(path) / 1024 / 1024:6.1f} MB")
+
+            conn = sqlite3.connect(path)
+            conn.row_factory = sqlite3.Row
+            for name, query in queries:
+                results = index.query(**query)
+                assert results == scan_query(conn, **query), name
+                indexed = median_ms(lambda: index.query(**query), args.repeat)
+                scanned = median_ms(lambda: scan_query(conn, **query), args.repeat)
+                print(f"    {name:<18} {len(results):>6} 个  R-tree {indexed:8.2f} ms  扫描全表 {scanned:8.2f} ms")
+            query = queries[1][1]
+            through = index.query(through=True, **query)
+            elapsed = median_ms(lambda: index.query(through=True, **query), args.repeat)
+            print(f"    {'区域 1°×1° 经过':<18} {len(through):>6} 个  R-tree {elapsed:8.2f} ms（含轨迹确认）")
+            conn.close()
+            index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""测量多文件合并的耗时和Python内存分配峰值
+
+用法:
+    python benchmarks/bench_merge.py --files 4 --hours 1 6 24
+    python benchmarks/bench_merge.py --files 2 8 32 --hours 1
+
+每组为同一设备前后相接的 files 个文件，每个文件 hours 小时（1Hz，每1000条记录一圈）。
+固定文件数、增加每个文件的时长时，合并阶段的分配峰值基本不变；增加文件数时随同时打开的文件数增长。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_merge import scan_fit_file, group_summaries, merge_group
+from benchmarks.fit_synth import build_fit
+
+
+def write_group(folder_path, files, records):
+    paths = []
+    for i in range(files):
+        path = os.path.join(folder_path, f"part_{i:03d}.fit")
+        with open(path, 'wb') as f:
+            f.write(build_fit(records, start_time=1000000000 + i * (records + 30), lap_records=1000))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多文件合并耗时与内存测试")
+    parser.add_argument("--files", type=int, nargs="+", default=[4], help="每组的文件数")
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 6, 24], help="每个文件的时长（小时）")
+    args = parser.parse_args()
+
+    for files in args.files:
+        for hours in args.hours:
+            records = int(hours * 3600)
+            with tempfile.TemporaryDirectory() as temp_dir:
+                paths = write_group(temp_dir, files, records)
+                start = time.perf_counter()
+                groups = group_summaries([scan_fit_file(path) for path in paths])
+                scanned = time.perf_counter()
+                assert len(groups) == 1
+                gpx_path = os.path.join(temp_dir, "merged.gpx")
+                info = merge_group(groups[0], gpx_path, split='lap')
+                merged = time.perf_counter()
+                # tracemalloc会明显拖慢运行，分配峰值单独再合并一次测量
+                tracemalloc.start()
+                merge_group(groups[0], gpx_path, split='lap')
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                points = info['points']
+                print(f"{files:>3} 个文件 × {hours:g} 小时  {points:>8} 点  {info['segments']:>4} 段  "
+                      f"扫描 {(scanned - start) * 1000:8.1f} ms  合并 {(merged - scanned) * 1000:8.1f} ms  "
+                      f"{points / (merged - scanned):10.0f} 点/秒  合并分配峰值 {peak / 1024:8.0f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""对比普通读取与内存映射读取FIT文件的耗时、Python内存分配峰值和read系统调用次数
+
+用法:
+    python benchmarks/bench_mmap.py --records 3600 21600 86400
+
+通过临时修改 fit2gpx_core.MMAP_MIN_SIZE 切换两种读取方式，交替转换同一文件，取中位数。
+--fallback 时使用CRC错误的文件，测量快速解码器失败后交给fitparse重新解析的路径。
+read系统调用次数来自 /proc/self/io，仅Linux可用。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fit2gpx_core
+from benchmarks.fit_synth import build_fit, corrupt_crc
+
+# (名称, MMAP_MIN_SIZE)
+MODES = (("普通读取", float('inf')), ("内存映射", 0))
+
+
+def read_syscalls():
+    """当前进程累计的read类系统调用次数，无法获取时为None"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('syscr:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def convert(fit_path, gpx_path):
+    try:
+        fit2gpx_core.fit_to_gpx(fit_path, gpx_path)
+    except Exception:
+        # --fallback 的文件预期会转换失败
+        pass
+
+
+def measure(fit_path, gpx_path, repeat):
+    """返回每种读取方式的 (耗时中位数秒, 分配峰值字节, 每次转换的read系统调用数)"""
+    times = {name: [] for name, _ in MODES}
+    for _ in range(repeat):
+        for name, limit in MODES:
+            fit2gpx_core.MMAP_MIN_SIZE = limit
+            start = time.perf_counter()
+            convert(fit_path, gpx_path)
+            times[name].append(time.perf_counter() - start)
+
+    results = {}
+    for name, limit in MODES:
+        fit2gpx_core.MMAP_MIN_SIZE = limit
+        before = read_syscalls()
+        convert(fit_path, gpx_path)
+        after = read_syscalls()
+        tracemalloc.start()
+        convert(fit_path, gpx_path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        syscalls = after - before if before is not None else None
+        results[name] = (statistics.median(times[name]), peak, syscalls)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内存映射读取的耗时与内存对比")
+    parser.add_argument("--records", type=int, nargs="+", default=[3600, 21600, 86400], help="每个文件的记录数（1Hz）")
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--fallback", action="store_true", help="使用CRC错误的文件，测量fitparse重新解析的路径")
+    args = parser.parse_args()
+
+    default_limit = fit2gpx_core.MMAP_MIN_SIZE
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for records in args.records:
+                data = build_fit(records, sensors=True)
+                if args.fallback:
+                    data = corrupt_crc(data)
+                fit_path = os.path.join(temp_dir, f"bench_{records}.fit")
+                with open(fit_path, 'wb') as f:
+                    f.write(data)
+                results = measure(fit_path, os.path.join(temp_dir, f"bench_{records}.gpx"), args.repeat)
+                for name, (elapsed, peak, syscalls) in results.items():
+                    syscall_text = "未知" if syscalls is None else str(syscalls)
+                    print(f"{records:>7} 条记录 {len(data) / 1024:8.0f} KB  {name}  {elapsed * 1000:8.1f} ms  "
+                          f"分配峰值 {peak / 1024:8.0f} KB  read调用 {syscall_text}")
+    finally:
+        fit2gpx_core.MMAP_MIN_SIZE = default_limit
+
+
+if __name__ == "__main__":
+    main()
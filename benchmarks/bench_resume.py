@@ -0,0 +1,131 @@
+"""测量转换日志与分批fsync的开销，以及中途强行结束后恢复时重复转换的文件数
+
+用法:
+    python benchmarks/bench_resume.py --files 400 --records 600
+
+1. 同一批文件分别以 --no-cache（不记录）、默认（日志 + 每 COMMIT_INTERVAL 个文件fsync一次）、
+   逐个文件fsync并提交（COMMIT_INTERVAL=1）三种方式转换，对比耗时；
+2. 用命令行转换，完成约一半时强行结束进程（相当于崩溃），再次运行同一命令，报告恢复后需要转换的文件数、
+   重复转换的文件数，并检查输出文件夹中没有写了一半的GPX和遗留的临时文件。
+每50个文件中有一个CRC错误的文件，用于检查失败列表是否记录完整。
+"""
+import os
+import sys
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fit2gpx_cli
+import fit2gpx_manifest
+from fit2gpx_core import converter_settings, ConversionOptions
+from fit2gpx_manifest import ConversionManifest
+from benchmarks.fit_synth import build_fit, corrupt_crc
+
+CLI = os.path.join(ROOT, "fit2gpx_cli.py")
+
+
+def write_inputs(folder_path, files, records):
+    os.makedirs(folder_path)
+    for i in range(files):
+        data = build_fit(records, start_time=1000000000 + i * 86400)
+        if i % 50 == 49:
+            data = corrupt_crc(data)
+        with open(os.path.join(folder_path, f"activity_{i:05d}.fit"), 'wb') as f:
+            f.write(data)
+
+
+def timed_run(argv):
+    """在当前进程中运行命令行转换（不输出日志），返回耗时"""
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        fit2gpx_cli.main(argv)
+    return time.perf_counter() - start
+
+
+def measure_overhead(input_path, work_dir, workers):
+    default_interval = fit2gpx_manifest.COMMIT_INTERVAL
+    modes = (("不记录（--no-cache）", ["--no-cache"], default_interval),
+             (f"日志 + 每{default_interval}个fsync", [], default_interval),
+             ("逐个文件fsync并提交", [], 1))
+    try:
+        for name, extra, interval in modes:
+            output_path = os.path.join(work_dir, "overhead")
+            shutil.rmtree(output_path, ignore_errors=True)
+            fit2gpx_manifest.COMMIT_INTERVAL = interval
+            elapsed = timed_run([input_path, "-o", output_path, "-j", str(workers)] + extra)
+            print(f"    {name:<20} {elapsed:7.2f} s")
+    finally:
+        fit2gpx_manifest.COMMIT_INTERVAL = default_interval
+
+
+def kill_and_resume(input_path, output_path, files, workers):
+    command = [sys.executable, CLI, input_path, "-o", output_path, "-j", str(workers)]
+    # 在单独的进程组中运行，结束时连同进程池的工作进程一起结束
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, encoding='utf-8',
+                               start_new_session=os.name != 'nt')
+    logged = 0
+    failed = 0
+    for line in process.stdout:
+        if "已转换" in line or "转换失败" in line:
+            logged += 1
+            failed += "转换失败" in line
+            if logged >= files // 2:
+                break
+    if os.name == 'nt':
+        process.kill()
+    else:
+        os.killpg(process.pid, signal.SIGKILL)
+    process.wait()
+    process.stdout.close()
+
+    temp_files = [name for name in os.listdir(output_path) if name.endswith('.tmp')]
+    partial = []
+    for name in os.listdir(output_path):
+        if name.endswith('.gpx'):
+            with open(os.path.join(output_path, name), 'rb') as f:
+                f.seek(-16, os.SEEK_END)
+                if not f.read().rstrip().endswith(b"</gpx>"):
+                    partial.append(name)
+
+    result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8')
+    remaining = None
+    for line in result.stdout.splitlines():
+        if "增量转换" in line:
+            remaining = int(line.split("需转换")[1].split()[0])
+    manifest = ConversionManifest(output_path, converter_settings(ConversionOptions()))
+    failures = len(manifest.failures())
+    manifest.close()
+    print(f"    中断前日志输出 {logged} 个结果，中断时遗留临时文件 {len(temp_files)} 个、不完整的GPX {len(partial)} 个")
+    # 失败的文件每次转换都会重试，不算重复转换
+    redone = max(0, remaining - (files - logged) - failed)
+    print(f"    恢复后需转换 {remaining} 个（含之前失败的 {failed} 个），重复转换已完成的文件 {redone} 个"
+          f"（最多为中断时正在转换的文件数），记录的失败文件 {failures} 个（应为 {files // 50} 个）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="转换日志与中断恢复测试")
+    parser.add_argument("--files", type=int, default=400, help="文件数")
+    parser.add_argument("--records", type=int, default=600, help="每个文件的记录数（1Hz）")
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_path = os.path.join(work_dir, "fit")
+        write_inputs(input_path, args.files, args.records)
+        print(f"{args.files} 个文件 × {args.records} 条记录，{args.workers} 个进程")
+        print("转换耗时：")
+        measure_overhead(input_path, work_dir, args.workers)
+        print("强行结束后恢复：")
+        kill_and_resume(input_path, os.path.join(work_dir, "resume"), args.files, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
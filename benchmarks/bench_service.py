@@ -0,0 +1,107 @@
+"""异步转换服务的负载测试：报告请求延迟的p50/p99、吞吐量和被拒绝（503）的请求数
+
+用法:
+    python benchmarks/bench_service.py --concurrency 1 4 16 64 --requests 200
+    python benchmarks/bench_service.py --concurrency 64 --max-waiting 8
+
+在同一事件循环中启动 fit2gpx_service 的HTTP服务（端口由系统分配），再用 concurrency 个并发客户端
+反复上传同一个合成FIT文件（--records 条记录，1Hz）。延迟只统计成功的请求；等待数超过 --max-waiting 的请求
+立即收到503，不计入延迟，客户端等待 --backoff 秒后再发下一个请求；用于观察背压下延迟是否保持有界。
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_service import AsyncConverter, start_server
+from benchmarks.fit_synth import build_fit
+
+
+async def post(host, port, data):
+    """上传一次，返回 (状态码, 响应体长度)"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"POST /convert HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+                     + data)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1]), len(body)
+
+
+async def load(host, port, data, concurrency, requests, backoff=0.0):
+    """concurrency 个客户端共发送 requests 个请求，返回 (成功请求的延迟列表, 各状态码计数, 总耗时)"""
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            status, _ = await post(host, port, data)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            elif status == 503:
+                await asyncio.sleep(backoff)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run(args):
+    data = build_fit(args.records, sensors=True)
+    async with AsyncConverter(workers=args.workers, max_waiting=args.max_waiting) as converter:
+        with tempfile.TemporaryDirectory() as work_dir:
+            server = await start_server(converter, work_dir, port=0)
+            host, port = server.sockets[0].getsockname()[:2]
+            async with server:
+                # 预热：启动工作进程
+                await load(host, port, data, converter.workers, converter.workers)
+                print(f"{converter.workers} 个进程，{args.records} 条记录/文件（{len(data) / 1024:.0f} KB），"
+                      f"等待数上限 {args.max_waiting}")
+                for concurrency in args.concurrency:
+                    latencies, statuses, elapsed = await load(host, port, data, concurrency, args.requests,
+                                                              args.backoff)
+                    ok = statuses.get(200, 0)
+                    rejected = statuses.get(503, 0)
+                    others = sum(count for status, count in statuses.items() if status not in (200, 503))
+                    text = (f"并发 {concurrency:>4}  成功 {ok:>5}  503 {rejected:>5}  其他 {others:>3}  "
+                            f"{ok / elapsed:7.1f} 请求/秒")
+                    if latencies:
+                        text += (f"  p50 {percentile(latencies, 50) * 1000:8.1f} ms"
+                                 f"  p99 {percentile(latencies, 99) * 1000:8.1f} ms"
+                                 f"  平均 {statistics.mean(latencies) * 1000:8.1f} ms")
+                    print(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步转换服务负载测试")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64], help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=200, help="每种并发数发送的请求数")
+    parser.add_argument("--records", type=int, default=3600, help="上传文件的记录数（1Hz）")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-waiting", type=int, default=64, help="服务的等待数上限，超过时返回503")
+    parser.add_argument("--backoff", type=float, default=0.1, help="收到503后等待的秒数")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""测量轨迹简化（RDP、最大点数）和重采样的耗时及点数缩减比例
+
+用法:
+    python benchmarks/bench_simplify.py --points 25000 50000 100000 200000
+
+使用固定随机种子生成的1Hz随机游走轨迹（GPS轨迹最难简化的情形），以及RDP拆分树深度随点数线性增长的
+等角度螺线（每次拆分只能拆下几个点，不限制深度时耗时为平方级），每种规模取多次运行的中位数。
+“每点耗时/log2(n)”一列在各规模间基本不变，说明耗时随点数按 O(n log n) 增长。
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_simplify import project_to_meters, resample_indices, simplify_indices
+
+
+def random_walk(points, seed=0):
+    """以约3米/秒行进、方向缓慢随机变化的轨迹，返回 (纬度, 经度, FIT时间戳)"""
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.2, points))
+    step = 3.0 + rng.normal(0, 0.5, points)
+    north = np.cumsum(step * np.cos(heading))
+    east = np.cumsum(step * np.sin(heading))
+    latitudes = 31.2 + np.degrees(north / 6371008.8)
+    longitudes = 121.4 + np.degrees(east / (6371008.8 * math.cos(math.radians(31.2))))
+    timestamps = 1000000000 + np.arange(points, dtype=np.int64)
+    return latitudes, longitudes, timestamps
+
+
+def spiral(points):
+    """每秒转过约11度、半径每秒增大0.05米的阿基米德螺线，返回 (纬度, 经度, FIT时间戳)"""
+    theta = 0.2 * np.arange(points)
+    radius = 10.0 + 0.05 * np.arange(points)
+    north = radius * np.cos(theta)
+    east = radius * np.sin(theta)
+    latitudes = 31.2 + np.degrees(north / 6371008.8)
+    longitudes = 121.4 + np.degrees(east / (6371008.8 * math.cos(math.radians(31.2))))
+    timestamps = 1000000000 + np.arange(points, dtype=np.int64)
+    return latitudes, longitudes, timestamps
+
+
+TRACKS = {'walk': ("随机游走", random_walk), 'spiral': ("螺线", spiral)}
+
+
+def median_time(function, repeat):
+    """多次运行，返回 (耗时中位数秒, 最后一次的结果)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="轨迹简化与重采样耗时测试")
+    parser.add_argument("--points", type=int, nargs="+", default=[25000, 50000, 100000, 200000])
+    parser.add_argument("--tolerance", type=float, default=5.0, help="RDP距离容差（米）")
+    parser.add_argument("--max-points", type=int, default=2000)
+    parser.add_argument("--interval", type=float, default=5.0, help="重采样间隔（秒）")
+    parser.add_argument("--tracks", nargs="+", choices=tuple(TRACKS), default=list(TRACKS), help="轨迹形状")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = (
+        (f"RDP {args.tolerance:g}米", lambda x, y, t: simplify_indices(x, y, tolerance=args.tolerance)),
+        (f"最多{args.max_points}点", lambda x, y, t: simplify_indices(x, y, max_points=args.max_points)),
+        (f"重采样{args.interval:g}秒", lambda x, y, t: resample_indices(t, args.interval)),
+    )
+    for track in args.tracks:
+        label, generate = TRACKS[track]
+        for points in args.points:
+            latitudes, longitudes, timestamps = generate(points)
+            x, y = project_to_meters(latitudes, longitudes)
+            for name, simplify in cases:
+                elapsed, kept = median_time(lambda: simplify(x, y, timestamps), args.repeat)
+                per_point = elapsed / points * 1e9
+                print(f"{label:<4} {points:>7} 点  {name:<12} {elapsed * 1000:8.1f} ms  保留 {len(kept):>6} 点"
+                      f"（减少 {1 - len(kept) / points:6.1%}）  每点耗时/log2(n) {per_point / math.log2(points):6.1f} ns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""转换吞吐量测试套件：合成FIT语料库、分阶段耗时、单进程与多进程吞吐量，结果保存为JSON
+
+用法:
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --durations 1min 1h --workers 4 --compare results.json
+
+语料库在本地生成（无需网络）：时长从1分钟到24小时（1Hz），包含带传感器数据、开发者字段、
+压缩时间戳的文件，以及被截断和CRC错误的文件。每种测量在独立的子进程中运行，峰值内存（RSS）互不影响。
+
+- stages：单进程逐个文件用 convert_job 转换，读取转换流程本身记录的阶段耗时（见 fit2gpx_metrics，
+  如 validate 读取并检查文件头、hash 内容哈希、decode 解码记录、build 整理坐标和时间列、serialize 生成GPX文本、
+  write 写入文件），报告中只列出实际花费了时间的阶段；
+- single：BatchConverter 单进程（workers=1），在测量进程中依次转换；
+- parallel：BatchConverter 多进程转换。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_metrics import STAGES
+from benchmarks.fit_synth import VARIANTS, write_variant_corpus
+
+try:
+    import resource
+except ImportError:
+    # Windows上没有resource模块，不报告峰值内存
+    resource = None
+
+DURATIONS = {'1min': 60, '10min': 600, '1h': 3600, '6h': 21600, '24h': 86400}
+MODES = ('stages', 'single', 'parallel')
+# CRC错误的文件会由fitparse完整重新解析一遍，长文件会占据大部分测试时间
+DAMAGED_VARIANTS = ('truncated', 'bad_crc')
+DEFAULT_DAMAGED_MAX = 3600
+
+
+def peak_rss_kb():
+    """返回 (当前进程, 已结束的子进程中最大) 的峰值RSS（KB），无法获取时为None"""
+    if resource is None:
+        return None, None
+    scale = 1024 if sys.platform == 'darwin' else 1  # macOS以字节为单位
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+    return own, children
+
+
+def measure_stages(corpus, repeat, output_dir):
+    """逐个文件用 convert_job 转换并读取其记录的阶段耗时，取多次运行的中位数"""
+    from fit2gpx_core import convert_job
+
+    files = []
+    gpx_path = os.path.join(output_dir, 'staged.gpx')
+    # 预热一次，避免首个文件计入模块导入等一次性开销
+    if corpus:
+        convert_job((corpus[0]['path'], gpx_path), metrics=True)
+    for entry in corpus:
+        runs = [convert_job((entry['path'], gpx_path), metrics=True) for _ in range(repeat)]
+        result = runs[-1]
+        stage_ms = {stage: statistics.median(run.metrics['timers'].get(stage, 0.0) for run in runs) * 1000
+                    for stage in STAGES}
+        files.append({'file': os.path.basename(entry['path']), 'variant': entry['variant'],
+                      'records': result.metrics['counters'].get('records_read', 0),
+                      'error': None if result.success else result.error_msg,
+                      'stage_ms': {stage: round(ms, 3) for stage, ms in stage_ms.items()}})
+    totals = {stage: round(sum(f['stage_ms'][stage] for f in files), 3) for stage in STAGES}
+    by_variant = {}
+    for f in files:
+        variant = by_variant.setdefault(f['variant'], dict.fromkeys(STAGES, 0.0))
+        for stage in STAGES:
+            variant[stage] = round(variant[stage] + f['stage_ms'][stage], 3)
+    own, _ = peak_rss_kb()
+    return {'files': files, 'variant_ms': by_variant, 'total_ms': totals, 'peak_rss_kb': own}
+
+
+def measure_throughput(corpus, repeat, output_dir, workers):
+    """用 BatchConverter 转换整个语料库，返回文件数/秒、记录数/秒等吞吐量指标"""
+    from fit2gpx_core import BatchConverter
+
+    jobs = [(entry['path'], os.path.join(output_dir, os.path.basename(entry['path'])[:-4] + '.gpx'))
+            for entry in corpus]
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = BatchConverter(workers=workers).run(jobs)
+        seconds.append(time.perf_counter() - start)
+    elapsed = statistics.median(seconds)
+    succeeded = [result for result in results if result.success]
+    records = sum(result.info['records'] for result in succeeded)
+    own, children = peak_rss_kb()
+    return {
+        'workers': workers,
+        'files': len(jobs),
+        'succeeded': len(succeeded),
+        'failed': len(jobs) - len(succeeded),
+        'records': records,
+        'points': sum(result.points for result in succeeded),
+        'seconds': round(elapsed, 4),
+        'files_per_s': round(len(jobs) / elapsed, 2),
+        'records_per_s': round(records / elapsed, 1),
+        'peak_rss_kb': own,
+        'worker_peak_rss_kb': children if workers > 1 else None,
+    }
+
+
+def run_measurement(mode, corpus_path, repeat, workers):
+    """在子进程中执行一种测量（--measure），把结果以JSON打印到标准输出"""
+    with open(corpus_path, encoding='utf-8') as f:
+        corpus = json.load(f)
+    with tempfile.TemporaryDirectory() as output_dir:
+        if mode == 'stages':
+            result = measure_stages(corpus, repeat, output_dir)
+        else:
+            result = measure_throughput(corpus, repeat, output_dir, 1 if mode == 'single' else workers)
+    json.dump(result, sys.stdout)
+    return 0
+
+
+def build_entries(durations, variants, damaged_max):
+    entries = []
+    for variant in variants:
+        for name in durations:
+            records = DURATIONS[name]
+            if variant in DAMAGED_VARIANTS and records > damaged_max:
+                continue
+            entries.append((variant, records))
+    return entries
+
+
+def environment_info():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def print_report(report, baseline=None):
+    """打印结果摘要，给定 baseline 时同时显示与其相比的变化"""
+    def change(current, previous):
+        if not previous:
+            return ''
+        return f"  ({(current / previous - 1) * 100:+.1f}%)"
+
+    corpus = report['corpus']
+    print(f"语料库: {len(corpus)} 个文件，{sum(e['records'] for e in corpus)} 条记录，"
+          f"{sum(e['bytes'] for e in corpus) / 1e6:.1f} MB")
+    stages = report['results'].get('stages')
+    if stages:
+        previous = (baseline or {}).get('results', {}).get('stages', {}).get('total_ms', {})
+        # 只列出实际花费了时间的阶段（未启用简化、导出、压缩等时对应阶段为0）
+        used = [stage for stage in STAGES if stages['total_ms'].get(stage)]
+        print("分阶段耗时（ms，各种类文件合计）:")
+        print(f"  {'':<12}" + "".join(f"{stage:>11}" for stage in used))
+        for variant, stage_ms in stages['variant_ms'].items():
+            print(f"  {variant:<12}" + "".join(f"{stage_ms[stage]:11.1f}" for stage in used))
+        for stage in used:
+            ms = stages['total_ms'][stage]
+            print(f"  合计 {stage:<10} {ms:10.1f} ms{change(ms, previous.get(stage))}")
+    for mode in ('single', 'parallel'):
+        result = report['results'].get(mode)
+        if not result:
+            continue
+        previous = (baseline or {}).get('results', {}).get(mode) or {}
+        rss = f"{result['peak_rss_kb'] / 1024:.0f} MB" if result['peak_rss_kb'] else "未知"
+        if result['worker_peak_rss_kb']:
+            rss += f"，工作进程 {result['worker_peak_rss_kb'] / 1024:.0f} MB"
+        print(f"{mode:<8} {result['workers']:>2} 进程  {result['files_per_s']:8.2f} 文件/秒"
+              f"{change(result['files_per_s'], previous.get('files_per_s'))}  "
+              f"{result['records_per_s']:10.0f} 记录/秒{change(result['records_per_s'], previous.get('records_per_s'))}  "
+              f"失败 {result['failed']}  峰值内存 {rss}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FIT转换吞吐量测试套件")
+    parser.add_argument("--durations", nargs="+", choices=DURATIONS, default=list(DURATIONS),
+                        help="活动时长（1Hz记录）")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS), help="文件种类")
+    parser.add_argument("--damaged-max", type=int, default=DEFAULT_DAMAGED_MAX,
+                        help="被截断和CRC错误的文件最多包含的记录数")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="parallel模式的进程数")
+    parser.add_argument("--repeat", type=int, default=3, help="每种测量的重复次数（取中位数）")
+    parser.add_argument("--corpus", help="语料库文件夹（默认使用临时文件夹，测试结束后删除）")
+    parser.add_argument("--output", default="bench_suite.json", help="结果JSON文件路径")
+    parser.add_argument("--compare", help="与之前保存的结果JSON对比")
+    parser.add_argument("--measure", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        return run_measurement(args.measure, args.corpus, args.repeat, args.workers)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_dir = args.corpus or os.path.join(temp_dir, 'corpus')
+        corpus = write_variant_corpus(corpus_dir, build_entries(args.durations, args.variants, args.damaged_max))
+        corpus_path = os.path.join(temp_dir, 'corpus.json')
+        with open(corpus_path, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f)
+
+        results = {}
+        for mode in args.modes:
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", mode,
+                                   "--corpus", corpus_path, "--repeat", str(args.repeat),
+                                   "--workers", str(args.workers)],
+                                  check=True, stdout=subprocess.PIPE, text=True)
+            results[mode] = json.loads(proc.stdout)
+
+    report = {
+        'environment': environment_info(),
+        'corpus': [{'file': os.path.basename(e['path']), 'variant': e['variant'], 'records': e['records'],
+                    'bytes': e['bytes']} for e in corpus],
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report, baseline)
+    print(f"结果已保存到 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""合成FIT测试文件生成器，用于本地性能测试（无需网络和真实设备文件）"""
+import os
+import struct
+
+from fit2gpx_core import fit_crc
+
+# FIT时间戳起点（1989-12-31 00:00 UTC）对应的Unix时间
+FIT_EPOCH_UNIX = 631065600
+SEMICIRCLES_PER_DEGREE = (2**32) / 360.0
+# sint32 字段的无效值
+INVALID_SINT32 = 0x7FFFFFFF
+
+
+def _definition(local_type, global_num, fields, dev_fields=()):
+    """生成定义消息，fields为 (字段号, 字节数, 基本类型) 列表，dev_fields为 (字段号, 字节数, 开发者数据索引) 列表"""
+    header = 0x40 | local_type | (0x20 if dev_fields else 0)
+    data = struct.pack('<BBBHB', header, 0, 0, global_num, len(fields))
+    for field in fields:
+        data += struct.pack('<BBB', *field)
+    if dev_fields:
+        data += struct.pack('<B', len(dev_fields))
+        for field in dev_fields:
+            data += struct.pack('<BBB', *field)
+    return data
+
+
+def build_fit(records, start_time=1000000000, serial_number=12345, sensors=False, developer_fields=False,
+              compressed_timestamps=False, lap_records=None, pause=None, positions=True):
+    """生成包含file_id和record消息的完整FIT文件内容（bytes）
+
+    records 为点数，以1Hz采样，轨迹从上海附近向东北方向移动。
+    sensors 为True时，record中再加入踏频、功率、温度、速度、距离等码表类设备常见的字段。
+    developer_fields 为True时加入开发者字段定义（developer_data_id、field_description），record带一个uint16开发者字段。
+    compressed_timestamps 为True时，每分钟第一条record带完整时间戳，其余使用压缩时间戳消息头。
+    lap_records 不为None时，每 lap_records 条record后写入一条lap消息，文件末尾写入session消息。
+    pause 为 (第几条record, 秒数) 时，从该条record起时间戳整体后移，模拟暂停。
+    positions 为False时经纬度均为无效值，模拟室内骑行台等没有GPS的活动。
+    """
+    body = bytearray()
+    # file_id: type, manufacturer, product, serial_number, time_created
+    body += _definition(0, 0, [(0, 1, 0x00), (1, 2, 0x84), (2, 2, 0x84), (3, 4, 0x8C), (4, 4, 0x86)])
+    body += struct.pack('<BBHHII', 0, 4, 1, 1000, serial_number, start_time)
+    dev_fields = []
+    if developer_fields:
+        # developer_data_id: developer_data_index；field_description: developer_data_index,
+        # field_definition_number, fit_base_type_id, field_name
+        body += _definition(3, 207, [(3, 1, 0x02)])
+        body += struct.pack('<BB', 3, 0)
+        body += _definition(4, 206, [(0, 1, 0x02), (1, 1, 0x02), (2, 1, 0x02), (3, 8, 0x07)])
+        body += struct.pack('<BBBB8s', 4, 0, 0, 0x84, b'Power2')
+        # (字段号, 字节数, 开发者数据索引)
+        dev_fields = [(0, 2, 0)]
+    # record: timestamp, position_lat, position_long, altitude, heart_rate
+    fields = [(0, 4, 0x85), (1, 4, 0x85), (2, 2, 0x84), (3, 1, 0x02)]
+    record_format = 'iiHB'
+    if sensors:
+        # 与码表类设备相近的记录布局：cadence, power, temperature, speed, enhanced_speed, distance,
+        # enhanced_altitude, accumulated_power, left_right_balance, fractional_cadence, gps_accuracy
+        fields += [(4, 1, 0x02), (7, 2, 0x84), (13, 1, 0x01), (6, 2, 0x84), (73, 4, 0x86), (5, 4, 0x86),
+                   (78, 4, 0x86), (29, 4, 0x86), (30, 1, 0x02), (53, 1, 0x02), (31, 1, 0x02)]
+        record_format += 'BHbHIIIIBBB'
+    if dev_fields:
+        record_format += 'H'
+    body += _definition(1, 20, [(253, 4, 0x86)] + fields, dev_fields)
+    record = struct.Struct('<BI' + record_format)
+    compressed_record = struct.Struct('<B' + record_format)
+    if compressed_timestamps:
+        # 压缩时间戳消息只能使用本地消息类型0~3，且定义中不含timestamp字段
+        body += _definition(2, 20, fields, dev_fields)
+    # lap/session: timestamp, start_time
+    lap = struct.Struct('<BII')
+    if lap_records is not None:
+        body += _definition(5, 19, [(253, 4, 0x86), (2, 4, 0x86)])
+        body += _definition(6, 18, [(253, 4, 0x86), (2, 4, 0x86)])
+    lap_start = start_time
+    for i in range(records):
+        lat = int((31.2 + i * 1e-5) * SEMICIRCLES_PER_DEGREE) if positions else INVALID_SINT32
+        lon = int((121.4 + i * 1e-5) * SEMICIRCLES_PER_DEGREE) if positions else INVALID_SINT32
+        altitude = (100 + (i % 50) + 500) * 5
+        values = (lat, lon, altitude, 120 + i % 30)
+        if sensors:
+            speed = 8000 + i % 500
+            values += (80 + i % 20, 200 + i % 100, 20 + i % 5, speed, speed, i * 800,
+                       altitude, i * 250, 0x80 | 50, 0, 3)
+        if dev_fields:
+            values += (250 + i % 40,)
+        timestamp = start_time + i
+        if pause is not None and i >= pause[0]:
+            timestamp += pause[1]
+        if compressed_timestamps and i % 60:
+            body += compressed_record.pack(0x80 | (2 << 5) | (timestamp & 0x1F), *values)
+        else:
+            body += record.pack(1, timestamp, *values)
+        if lap_records is not None and ((i + 1) % lap_records == 0 or i + 1 == records):
+            body += lap.pack(5, timestamp, lap_start)
+            lap_start = timestamp + 1
+    if lap_records is not None:
+        body += lap.pack(6, lap_start - 1, start_time)
+
+    header = struct.pack('<BBHI4s', 14, 0x10, 2132, len(body), b'.FIT')
+    header += struct.pack('<H', fit_crc(header))
+    data = header + bytes(body)
+    return data + struct.pack('<H', fit_crc(data))
+
+
+def truncate_fit(data, fraction=0.6):
+    """模拟未写完的文件：只保留前 fraction 的内容（文件头中的数据长度不变）"""
+    return data[:int(len(data) * fraction)]
+
+
+def corrupt_crc(data):
+    """模拟损坏的文件：改写末尾的文件CRC"""
+    crc = struct.unpack('<H', data[-2:])[0]
+    return data[:-2] + struct.pack('<H', crc ^ 0xFFFF)
+
+
+def write_fit(path, records, **kwargs):
+    """生成FIT文件并写入path"""
+    with open(path, 'wb') as f:
+        f.write(build_fit(records, **kwargs))
+    return path
+
+
+def write_corpus(folder_path, sizes):
+    """在folder_path中为每个点数生成一个FIT文件，返回文件路径列表"""
+    os.makedirs(folder_path, exist_ok=True)
+    paths = []
+    for i, records in enumerate(sizes):
+        path = os.path.join(folder_path, f"synthetic_{i:03d}_{records}.fit")
+        paths.append(write_fit(path, records, start_time=1000000000 + i * 86400, serial_number=12345 + i))
+    return paths
+
+
+# 语料库中的文件种类：(build_fit参数, 生成后对内容的破坏处理)
+VARIANTS = {
+    'plain': ({}, None),
+    'sensors': ({'sensors': True}, None),
+    'developer': ({'developer_fields': True}, None),
+    'compressed': ({'compressed_timestamps': True}, None),
+    'truncated': ({}, truncate_fit),
+    'bad_crc': ({}, corrupt_crc),
+}
+
+
+def write_variant_corpus(folder_path, entries):
+    """按 (种类, 点数) 列表生成FIT文件，返回 {'path', 'variant', 'records', 'bytes'} 字典列表"""
+    os.makedirs(folder_path, exist_ok=True)
+    corpus = []
+    for i, (variant, records) in enumerate(entries):
+        kwargs, damage = VARIANTS[variant]
+        data = build_fit(records, start_time=1000000000 + i * 86400, serial_number=12345 + i, **kwargs)
+        if damage is not None:
+            data = damage(data)
+        path = os.path.join(folder_path, f"{variant}_{records}.fit")
+        with open(path, 'wb') as f:
+            f.write(data)
+        corpus.append({'path': path, 'variant': variant, 'records': records, 'bytes': len(data)})
+    return corpus
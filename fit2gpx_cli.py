@@ -0,0 +1,341 @@
+"""FIT转GPX命令行入口
+
+不带参数运行时启动图形界面；界面相关的库（tkinter、ttkbootstrap、pillow）只在启动界面时才导入，
+无界面的转换服务器上可以直接使用命令行批量转换。
+"""
+import os
+import sys
+import signal
+import argparse
+import multiprocessing
+from datetime import datetime
+
+from fit2gpx_core import (STATUS_TRUNCATED, OVERWRITE_POLICIES, EXTENSION_FIELDS, find_fit_files, build_jobs,
+                          converter_settings, ConversionOptions, BatchConverter)
+from fit2gpx_manifest import ConversionManifest
+
+
+def log_message(message):
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="fit2gpx",
+        description="将文件夹中的FIT文件批量转换为GPX文件。不带参数运行时启动图形界面。",
+    )
+    parser.add_argument("input_dir", nargs="?", help="包含FIT文件的输入文件夹")
+    parser.add_argument("-o", "--output-dir", help="GPX文件输出文件夹（默认与输入文件夹相同）")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="并行进程数（默认为CPU核心数）")
+    parser.add_argument("--chunksize", type=int, default=1, help="每个进程任务包含的文件数（默认1）")
+    parser.add_argument("--ordered", action="store_true", help="按文件名顺序输出结果（默认按完成顺序）")
+    parser.add_argument("--overwrite", choices=OVERWRITE_POLICIES, default="overwrite",
+                        help="输出文件已存在时的处理方式：overwrite 覆盖（默认），skip 跳过")
+    parser.add_argument("--extensions", nargs="*", choices=EXTENSION_FIELDS, metavar="FIELD",
+                        help="在GPX扩展中输出传感器数据，可选 " + "、".join(EXTENSION_FIELDS)
+                             + "；不指定字段时输出全部")
+    parser.add_argument("--simplify", type=float, metavar="METERS",
+                        help="写入前用Douglas-Peucker算法简化轨迹，参数为距离容差（米）")
+    parser.add_argument("--resample", type=float, metavar="SECONDS",
+                        help="写入前按固定时间间隔重采样，每个间隔保留一个点")
+    parser.add_argument("--max-points", type=int, metavar="N",
+                        help="每条轨迹最多保留的点数，超出时按重要度保留")
+    parser.add_argument("--export-dir", metavar="PATH",
+                        help="同时把每个活动解码出的记录按列导出到指定文件夹（每个活动一个分区，供数据分析读取）")
+    parser.add_argument("--export-format", choices=("parquet", "csv"),
+                        help="按列导出的格式（默认安装了pyarrow时为parquet，否则为csv）")
+    parser.add_argument("--compress", choices=("gz", "zst"),
+                        help="输出压缩的 .gpx.gz 或 .gpx.zst（zst需要安装zstandard），压缩在后台线程中与转换同时进行")
+    parser.add_argument("--compress-level", type=int, metavar="LEVEL",
+                        help="整批转换使用的压缩级别：gz 为1-9（默认6），zst 为1-22（默认3）")
+    parser.add_argument("--index", action="store_true",
+                        help="同时在输出文件夹中建立活动索引（范围、时间、距离和抽稀轨迹），可用 fit2gpx_index.py 按区域和时间查询")
+    parser.add_argument("--metrics-jsonl", metavar="PATH",
+                        help="记录每个文件各阶段耗时和计数，以JSON Lines格式追加到指定文件")
+    parser.add_argument("--metrics-prom", metavar="PATH",
+                        help="把汇总的耗时和计数写成Prometheus文本格式文件（监视模式下每转换一个文件更新一次）")
+    parser.add_argument("--merge", action="store_true",
+                        help="把同一设备拆成多个FIT文件的活动按时间合并为一个GPX文件（不使用增量转换缓存）")
+    parser.add_argument("--merge-window", type=float, metavar="SECONDS",
+                        help="合并模式下同一设备的两个文件相隔不超过多少秒时合并（默认3600秒）")
+    parser.add_argument("--split", metavar="MODE",
+                        help="合并模式下按哪种消息开始新的轨迹段：lap 每圈，session 每个运动项目（默认），none 不按消息分段")
+    parser.add_argument("--split-gap", type=float, metavar="SECONDS",
+                        help="合并模式下相邻两点相隔超过多少秒时开始新的轨迹段（默认300秒，0表示不按间隔分段）")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用增量转换缓存，重新转换所有文件")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="只重试之前转换失败并记录在输出文件夹中的文件，不扫描输入文件夹")
+    parser.add_argument("--watch", action="store_true",
+                        help="持续监视输入文件夹，自动转换新增或修改的FIT文件（按 Ctrl+C 停止）")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="监视模式下文件保持不变多少秒后才转换（默认2秒）")
+    parser.add_argument("--poll-interval", type=float, default=5.0,
+                        help="监视模式下无法使用文件事件时的扫描间隔秒数（默认5秒）")
+    parser.add_argument("--gui", action="store_true", help="启动图形界面")
+    return parser
+
+
+def conversion_options(args):
+    """根据命令行参数生成转换选项"""
+    extensions = () if args.extensions is None else args.extensions or EXTENSION_FIELDS
+    return ConversionOptions(extensions=extensions, tolerance=args.simplify, interval=args.resample,
+                             max_points=args.max_points, export_dir=args.export_dir,
+                             export_format=args.export_format, summary=args.index, compression=args.compress,
+                             compression_level=args.compress_level)
+
+
+def merge_converter(args):
+    """根据命令行参数创建合并引擎，参数无效时抛出ValueError"""
+    from fit2gpx_merge import MergeConverter
+
+    settings = {}
+    if args.merge_window is not None:
+        settings['window'] = args.merge_window
+    if args.split is not None:
+        settings['split'] = args.split
+    if args.split_gap is not None:
+        settings['gap'] = args.split_gap or None
+    return MergeConverter(workers=args.workers, options=conversion_options(args), **settings)
+
+
+def metrics_collector(args):
+    """指定了指标输出文件时创建汇总器，否则返回None（不计时）"""
+    if not args.metrics_jsonl and not args.metrics_prom:
+        return None
+    from fit2gpx_metrics import MetricsCollector
+    return MetricsCollector(args.metrics_jsonl, args.metrics_prom)
+
+
+def run_conversion(args):
+    """执行命令行批量转换，返回进程退出码"""
+    folder_path = args.input_dir
+    output_folder_path = args.output_dir or folder_path
+
+    if not os.path.isdir(folder_path):
+        log_message(f"输入文件夹无效: {folder_path}")
+        return 2
+    os.makedirs(output_folder_path, exist_ok=True)
+    options = conversion_options(args)
+    manifest = None
+    skipped = []
+    unchanged = []
+
+    if args.retry_failed:
+        manifest = ConversionManifest(output_folder_path, converter_settings(options))
+        failures = manifest.failures()
+        jobs = [(fit_file_path, gpx_file_path) for fit_file_path, gpx_file_path, _ in failures
+                if os.path.exists(fit_file_path)]
+        log_message(f"重试之前失败的 {len(jobs)} 个文件（共记录 {len(failures)} 个，源文件已不存在的不重试）")
+        log_message(f"输出目录: {output_folder_path}")
+    else:
+        fit_files = find_fit_files(folder_path)
+        if not fit_files:
+            log_message("未找到FIT文件")
+            return 0
+
+        jobs, skipped = build_jobs(folder_path, output_folder_path, fit_files, overwrite=args.overwrite,
+                                   suffix=options.gpx_suffix)
+        log_message(f"找到 {len(fit_files)} 个FIT文件，开始转换...")
+        log_message(f"输出目录: {output_folder_path}")
+        if skipped:
+            log_message(f"跳过 {len(skipped)} 个已存在的GPX文件")
+
+        if not args.no_cache:
+            # 跳过自上次转换以来未变化的文件；上次中断时已完成的文件也在其中
+            manifest = ConversionManifest(output_folder_path, converter_settings(options))
+            jobs, unchanged = manifest.partition(jobs)
+            log_message(f"增量转换：跳过 {len(unchanged)} 个未变化的文件，需转换 {len(jobs)} 个")
+
+    index = None
+    if args.index:
+        from fit2gpx_index import ActivityIndex, index_path_for
+        index = ActivityIndex(index_path_for(output_folder_path))
+        # 未变化但还没有索引记录的文件（如启用索引之前转换的）需要重新转换一次
+        unindexed = index.missing(unchanged)
+        if unindexed:
+            unindexed_set = set(unindexed)
+            unchanged = [job for job in unchanged if job not in unindexed_set]
+            jobs = jobs + unindexed
+            log_message(f"活动索引：{len(unindexed)} 个未变化的文件尚未建立索引，将重新转换")
+
+    collector = metrics_collector(args)
+    if collector is not None:
+        collector.count('files_skipped', len(skipped) + len(unchanged))
+    failed_count = 0
+    done_count = 0
+
+    def on_result(done, total, result):
+        nonlocal failed_count, done_count
+        done_count = done
+        if manifest is not None:
+            manifest.record(result)
+        if index is not None:
+            index.record(result)
+        if collector is not None:
+            collector.add(result)
+        fit_file = os.path.basename(result.fit_file_path)
+        if result.success and result.status == STATUS_TRUNCATED:
+            log_message(f"[{done}/{total}] 已转换（文件被截断，仅保留已解析的 {result.input_points} 个点）: "
+                        f"{fit_file} -> {os.path.basename(result.gpx_file_path)}{result.reduction_note()}")
+        elif result.success:
+            log_message(f"[{done}/{total}] 已转换: {fit_file} -> {os.path.basename(result.gpx_file_path)}"
+                        f"{result.reduction_note()}")
+        else:
+            failed_count += 1
+            log_message(f"[{done}/{total}] 转换失败 {fit_file}: {result.error_msg}")
+
+    batch = BatchConverter(workers=args.workers, chunksize=args.chunksize, ordered=args.ordered, options=options,
+                           metrics=collector is not None)
+    interrupted = False
+    try:
+        batch.run(jobs, on_result=on_result)
+    except KeyboardInterrupt:
+        # 工作进程忽略 Ctrl+C，正在转换的文件写完后在这里结束，已完成文件的记录照常保存
+        interrupted = True
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if index is not None:
+            indexed_count = index.count()
+            index.close()
+        if collector is not None:
+            collector.close()
+
+    if interrupted:
+        log_message(f"已中断：完成 {done_count}/{len(jobs)} 个文件，其中失败 {failed_count} 个")
+        return 130
+    log_message(f"转换完成：成功 {len(jobs) - failed_count} 个，失败 {failed_count} 个，"
+                f"跳过 {len(skipped) + len(unchanged)} 个")
+    if failed_count and manifest is not None:
+        log_message("失败的文件已记录在输出文件夹中，可加 --retry-failed 只重试这些文件")
+    if index is not None:
+        log_message(f"活动索引共 {indexed_count} 个活动: {index.path}")
+    if collector is not None:
+        log_message(collector.summary())
+    return 1 if failed_count else 0
+
+
+def run_merge(args):
+    """执行合并模式：按设备和时间把FIT文件分组，每组合并为一个GPX文件，返回进程退出码"""
+    from fit2gpx_merge import merged_gpx_path
+
+    folder_path = args.input_dir
+    output_folder_path = args.output_dir or folder_path
+
+    if not os.path.isdir(folder_path):
+        log_message(f"输入文件夹无效: {folder_path}")
+        return 2
+    os.makedirs(output_folder_path, exist_ok=True)
+
+    fit_files = find_fit_files(folder_path)
+    if not fit_files:
+        log_message("未找到FIT文件")
+        return 0
+
+    converter = merge_converter(args)
+    log_message(f"找到 {len(fit_files)} 个FIT文件，正在读取设备和时间范围...")
+    groups, failed = converter.scan(os.path.join(folder_path, fit_file) for fit_file in fit_files)
+    for summary in failed:
+        log_message(f"无法合并 {os.path.basename(summary.fit_file_path)}: {summary.error_msg}")
+    log_message(f"分为 {len(groups)} 组，其中 {sum(len(group) > 1 for group in groups)} 组包含多个文件")
+    log_message(f"输出目录: {output_folder_path}")
+
+    skipped = []
+    if args.overwrite == 'skip':
+        suffix = converter.options.gpx_suffix
+        skipped = [group for group in groups
+                   if os.path.exists(merged_gpx_path(group, output_folder_path, suffix))]
+        groups = [group for group in groups if group not in skipped]
+        if skipped:
+            log_message(f"跳过 {len(skipped)} 个已存在的GPX文件")
+
+    collector = metrics_collector(args)
+    if collector is not None:
+        collector.count('files_skipped', sum(len(group) for group in skipped))
+    failed_count = 0
+
+    def on_result(done, total, result):
+        nonlocal failed_count
+        if collector is not None:
+            collector.add(result)
+        if result.success:
+            sources = "、".join(os.path.basename(path) for path in result.info['sources'])
+            note = "（文件被截断，仅保留已解析的部分）" if result.status == STATUS_TRUNCATED else ""
+            log_message(f"[{done}/{total}] 已合并{note}: {sources} -> {os.path.basename(result.gpx_file_path)}"
+                        f"（{result.points} 个点，{result.info['segments']} 段）")
+        else:
+            failed_count += 1
+            log_message(f"[{done}/{total}] 合并失败 {os.path.basename(result.gpx_file_path)}: {result.error_msg}")
+
+    try:
+        converter.run(groups, output_folder_path, on_result=on_result)
+    finally:
+        if collector is not None:
+            collector.close()
+
+    log_message(f"合并完成：成功 {len(groups) - failed_count} 组，失败 {failed_count} 组，"
+                f"无法读取 {len(failed)} 个文件，跳过 {len(skipped)} 组")
+    return 1 if failed_count or failed else 0
+
+
+def run_watch(args):
+    """运行监视文件夹模式，直到按 Ctrl+C"""
+    from fit2gpx_watch import FolderWatcher
+
+    if not os.path.isdir(args.input_dir):
+        log_message(f"输入文件夹无效: {args.input_dir}")
+        return 2
+    collector = metrics_collector(args)
+    watcher = FolderWatcher(args.input_dir, args.output_dir or args.input_dir, workers=args.workers,
+                            settle_seconds=args.settle, poll_interval=args.poll_interval,
+                            options=conversion_options(args), metrics=collector, log_message=log_message)
+    def interrupt(signum, frame):
+        # 第一次 Ctrl+C 等正在转换的文件完成后停止，再按一次立即退出
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        watcher.stop()
+
+    previous_handler = signal.signal(signal.SIGINT, interrupt)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        if collector is not None:
+            collector.close()
+            log_message(collector.summary())
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        conversion_options(args)
+        if args.merge:
+            if args.watch:
+                raise ValueError("合并模式不能与监视模式同时使用")
+            merge_converter(args)
+        if args.retry_failed and (args.no_cache or args.merge or args.watch):
+            raise ValueError("--retry-failed 不能与 --no-cache、--merge 或 --watch 同时使用")
+    except ValueError as e:
+        parser.error(str(e))
+    if args.gui or args.input_dir is None:
+        # 只有启动界面时才导入界面相关的库
+        import fit2gpx_converter
+        fit2gpx_converter.main()
+        return 0
+    if args.watch:
+        return run_watch(args)
+    if args.merge:
+        return run_merge(args)
+    return run_conversion(args)
+
+
+if __name__ == "__main__":
+    # 打包成可执行文件后，进程池的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    sys.exit(main())
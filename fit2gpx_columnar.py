@@ -0,0 +1,198 @@
+"""把解码出的record记录按列导出，数据分析可以直接读取各列，无需再解析GPX
+
+每个活动写入导出目录下的一个分区 activity=<FIT文件名>/part-0.parquet（Hive风格分区），pyarrow、pandas、
+DuckDB、Spark 都可以把整个导出目录作为一个数据集读取，activity 作为分区列。安装了 pyarrow 时输出Parquet，
+否则输出分区结构相同的CSV文件（part-0.csv）。
+
+导出的是解码出的全部record记录（含没有位置的记录），不经过轨迹简化。各列及类型：
+time（UTC时间，秒）、latitude/longitude（度）、altitude（米）、heart_rate、cadence（uint8）、power（uint16）、
+temperature（int8，摄氏度）、speed（米/秒），无效值为空。
+"""
+import os
+import importlib.util
+from urllib.parse import quote
+
+import numpy as np
+
+from fit2gpx_metrics import NULL_METRICS
+from fit2gpx_gpx import FIT_EPOCH_UNIX, format_float
+
+EXPORT_FORMATS = ('parquet', 'csv')
+# Parquet每个行组的记录数：攒够后一次写入，读取时不会因行组过小而变慢
+ROW_GROUP_SIZE = 65536
+
+# 导出的列：(列名, NumPy类型, Arrow类型名)，time 和位置列之外的都来自 RecordChunk.sensors
+COLUMNS = (
+    ('time', 'int64', 'timestamp'),
+    ('latitude', 'float64', 'float64'),
+    ('longitude', 'float64', 'float64'),
+    ('altitude', 'float64', 'float64'),
+    ('heart_rate', 'uint8', 'uint8'),
+    ('cadence', 'uint8', 'uint8'),
+    ('power', 'uint16', 'uint16'),
+    ('temperature', 'int8', 'int8'),
+    ('speed', 'float64', 'float64'),
+)
+
+
+def has_pyarrow():
+    """是否可以输出Parquet（只查找模块，不导入）"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def resolve_format(export_format=None):
+    """确定导出格式：未指定时有pyarrow则为Parquet，否则为CSV"""
+    if export_format is None:
+        return 'parquet' if has_pyarrow() else 'csv'
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"未知的导出格式: {export_format}")
+    if export_format == 'parquet' and not has_pyarrow():
+        raise ValueError("导出Parquet需要安装pyarrow（pip install pyarrow）")
+    return export_format
+
+
+def partition_path(export_dir, fit_file_path, export_format):
+    """活动对应的分区文件路径：<导出目录>/activity=<FIT文件名>/part-0.<格式>"""
+    stem = os.path.splitext(os.path.basename(fit_file_path))[0]
+    return os.path.join(export_dir, 'activity=' + quote(stem, safe=''), 'part-0.' + export_format)
+
+
+def chunk_columns(chunk):
+    """把RecordChunk转换为 {列名: (数值数组, 无效掩码)}，time 为Unix秒数"""
+    timestamps = chunk.timestamp
+    invalid_time = timestamps < 0
+    columns = {
+        'time': (np.where(invalid_time, 0, timestamps + FIT_EPOCH_UNIX), invalid_time),
+        'latitude': (chunk.latitude, np.isnan(chunk.latitude)),
+        'longitude': (chunk.longitude, np.isnan(chunk.longitude)),
+        'altitude': (chunk.altitude, np.isnan(chunk.altitude)),
+    }
+    for name, dtype, _ in COLUMNS[4:]:
+        values = chunk.sensors.get(name)
+        if values is None:
+            columns[name] = (np.zeros(len(chunk), dtype=dtype), np.ones(len(chunk), dtype=bool))
+            continue
+        invalid = np.isnan(values)
+        columns[name] = (np.where(invalid, 0, values).astype(dtype), invalid)
+    return columns
+
+
+class ColumnarWriter:
+    """把一个活动的RecordChunk逐块写入列式文件
+
+    先写入同一分区中以点开头的临时文件（数据集读取时会忽略），close() 时替换为正式文件，
+    读取方不会看到写了一半的文件。
+    """
+    def __init__(self, path, export_format, metrics=None):
+        self.path = path
+        self.export_format = export_format
+        self.rows = 0
+        self._metrics = metrics or NULL_METRICS
+        self._temp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+        self._pending = []
+        self._pending_rows = 0
+        self._writer = None
+        self._file = None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def tee(self, chunks):
+        """逐块写入并原样产出 chunks，可直接串在GPX写入之前"""
+        for chunk in chunks:
+            self.write_chunk(chunk)
+            yield chunk
+
+    def write_chunk(self, chunk):
+        if not len(chunk):
+            return
+        with self._metrics.timer('export'):
+            columns = chunk_columns(chunk)
+            if self.export_format == 'csv':
+                self._write_csv(columns)
+            else:
+                self._pending.append(columns)
+                self._pending_rows += len(chunk)
+                if self._pending_rows >= ROW_GROUP_SIZE:
+                    self._flush_parquet()
+        self.rows += len(chunk)
+
+    def close(self):
+        with self._metrics.timer('export'):
+            if self.export_format == 'csv':
+                if self._file is None:
+                    self._open_csv()
+                self._file.close()
+                self._file = None
+            else:
+                self._flush_parquet()
+                if self._writer is None:
+                    # 没有任何记录时也写入只有表结构的文件，分区列表与活动一一对应
+                    self._open_parquet()
+                self._writer.close()
+                self._writer = None
+            os.replace(self._temp_path, self.path)
+        self._metrics.count('rows_exported', self.rows)
+
+    def discard(self):
+        """转换失败时关闭并删除临时文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+        # 分区目录为空时一并删除（之前成功导出过的文件保留）
+        try:
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            pass
+
+    def _open_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        fields = [pa.field(name, pa.timestamp('s', tz='UTC') if arrow_type == 'timestamp' else getattr(pa, arrow_type)())
+                  for name, _, arrow_type in COLUMNS]
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(self._temp_path, self._schema)
+
+    def _flush_parquet(self):
+        if not self._pending:
+            return
+        import pyarrow as pa
+
+        if self._writer is None:
+            self._open_parquet()
+        arrays = []
+        for (name, _, _), field in zip(COLUMNS, self._schema):
+            values = np.concatenate([columns[name][0] for columns in self._pending])
+            invalid = np.concatenate([columns[name][1] for columns in self._pending])
+            arrays.append(pa.array(values, type=field.type, mask=invalid if invalid.any() else None))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema), row_group_size=ROW_GROUP_SIZE)
+        self._pending = []
+        self._pending_rows = 0
+
+    def _open_csv(self):
+        self._file = open(self._temp_path, 'w', encoding='utf-8', newline='')
+        self._file.write(','.join(name for name, _, _ in COLUMNS) + '\n')
+
+    def _write_csv(self, columns):
+        if self._file is None:
+            self._open_csv()
+        texts = []
+        for name, dtype, _ in COLUMNS:
+            values, invalid = columns[name]
+            if name == 'time':
+                column = np.datetime_as_string(values.astype('datetime64[s]'), unit='s').tolist()
+                column = [text + 'Z' for text in column]
+            elif dtype == 'float64':
+                column = [format_float(value) for value in values.tolist()]
+            else:
+                column = [str(value) for value in values.tolist()]
+            if invalid.any():
+                column = np.where(invalid, '', np.array(column, dtype=object)).tolist()
+            texts.append(column)
+        self._file.write(''.join(','.join(row) + '\n' for row in zip(*texts)))
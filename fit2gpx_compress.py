@@ -0,0 +1,110 @@
+"""压缩输出GPX：.gpx.gz（gzip）或 .gpx.zst（Zstandard）
+
+CompressedWriter 与文本文件一样接受 write(str)：生成GPX文本的线程只把文本块放入有界队列，
+编码、压缩和写入文件都在后台线程中进行。zlib 和 zstandard 压缩时释放GIL，压缩当前块的同时
+主线程已经在解码和格式化下一块，只有最后一块的压缩需要等待。队列已满（压缩跟不上）时写入会等待，
+内存中最多保留 QUEUE_SIZE 个文本块。
+
+解压后的内容与不压缩时的GPX逐字节相同。gzip文件头中的修改时间为0、不含文件名，相同的输入得到相同的文件。
+Zstandard 需要安装 zstandard（pip install zstandard）。
+"""
+import zlib
+import queue
+import threading
+import importlib.util
+
+COMPRESSION_FORMATS = ('gz', 'zst')
+# 各格式的默认压缩级别和允许的范围
+DEFAULT_LEVELS = {'gz': 6, 'zst': 3}
+LEVEL_RANGES = {'gz': (1, 9), 'zst': (1, 22)}
+# 等待压缩的文本块数上限
+QUEUE_SIZE = 4
+
+
+def has_zstandard():
+    """是否可以输出Zstandard（只查找模块，不导入）"""
+    return importlib.util.find_spec('zstandard') is not None
+
+
+def resolve_compression(compression=None, level=None):
+    """检查压缩格式和级别，返回 (格式, 级别)；不压缩时为 (None, None)"""
+    if compression is None:
+        if level is not None:
+            raise ValueError("指定压缩级别时需要同时指定压缩格式")
+        return None, None
+    if compression not in COMPRESSION_FORMATS:
+        raise ValueError(f"未知的压缩格式: {compression}")
+    if compression == 'zst' and not has_zstandard():
+        raise ValueError("输出 .gpx.zst 需要安装zstandard（pip install zstandard）")
+    if level is None:
+        return compression, DEFAULT_LEVELS[compression]
+    low, high = LEVEL_RANGES[compression]
+    if not low <= level <= high:
+        raise ValueError(f"{compression} 的压缩级别应在 {low} 到 {high} 之间: {level}")
+    return compression, level
+
+
+def _compressor(compression, level):
+    """返回 (compress, flush) 函数"""
+    if compression == 'gz':
+        # wbits=31 输出gzip格式
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+    import zstandard
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, compressor.flush
+
+
+class CompressedWriter:
+    """在后台线程中把文本块编码、压缩并写入文件
+
+    后台线程出错（如磁盘已满）时，之后的 write() 或 close() 抛出同一个异常。
+    """
+    def __init__(self, path, compression, level):
+        self._compress, self._flush = _compressor(compression, level)
+        self._file = open(path, 'wb')
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._error = None
+        self._discarded = False
+        self._thread = threading.Thread(target=self._run, name='fit2gpx-compress', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        compress = self._compress
+        write = self._file.write
+        while True:
+            text = self._queue.get()
+            if text is None:
+                return
+            # 出错或放弃后只取出剩余的块，使写入方不会在队列上阻塞
+            if self._error is not None or self._discarded:
+                continue
+            try:
+                data = compress(text.encode('utf-8'))
+                if data:
+                    write(data)
+            except BaseException as e:
+                self._error = e
+
+    def write(self, text):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(text)
+
+    def close(self):
+        """等待剩余的文本块压缩完成，写入压缩数据的结尾并关闭文件"""
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            if self._error is not None:
+                raise self._error
+            self._file.write(self._flush())
+        finally:
+            self._file.close()
+
+    def discard(self):
+        """放弃尚未压缩的文本块并关闭文件（文件由调用方删除）"""
+        self._discarded = True
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
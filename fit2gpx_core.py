@@ -0,0 +1,530 @@
+"""FIT转GPX转换核心，不依赖任何界面库，可在进程池中直接调用
+
+fitparse和NumPy在首次转换时才导入，命令行启动（如 --help）无需承担其导入耗时。
+"""
+import os
+import mmap
+import signal
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fit2gpx_metrics import NULL_METRICS, StageMetrics
+
+# 转换状态：完整转换，或文件被截断时只保留了已解析的部分
+STATUS_OK = 'ok'
+STATUS_TRUNCATED = 'truncated'
+
+# 转换器版本，输出格式变化时递增，使增量转换缓存失效
+CONVERTER_VERSION = 1
+
+# 可输出到GPX扩展中的传感器字段：心率、踏频、功率、温度、速度
+EXTENSION_FIELDS = ('heart_rate', 'cadence', 'power', 'temperature', 'speed')
+
+
+# FIT文件头长度（旧版12字节，新版14字节带文件头CRC），文件末尾还有2字节CRC
+FIT_HEADER_SIZES = (12, 14)
+FIT_CRC_SIZE = 2
+MIN_FIT_FILE_SIZE = 1024
+# 不小于此大小的文件使用内存映射读取；更小的文件一次read更快
+MMAP_MIN_SIZE = 256 * 1024
+
+# FIT SDK 中的4位CRC查找表
+FIT_CRC_NIBBLE_TABLE = (
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400,
+)
+
+
+def _build_crc_table():
+    """由4位查找表推导逐字节查找表：每个字节先处理低4位、再处理高4位"""
+    table = []
+    for byte in range(256):
+        crc = 0
+        for nibble in (byte & 0xF, byte >> 4):
+            tmp = FIT_CRC_NIBBLE_TABLE[crc & 0xF]
+            crc = (crc >> 4) & 0x0FFF
+            crc = crc ^ tmp ^ FIT_CRC_NIBBLE_TABLE[nibble]
+        table.append(crc)
+    return tuple(table)
+
+
+FIT_CRC_TABLE = _build_crc_table()
+
+
+def fit_crc(data, crc=0):
+    """逐字节查表计算FIT CRC-16，结果与SDK的半字节算法相同"""
+    table = FIT_CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def check_fit_header(header, file_size):
+    """检查FIT文件头和声明的数据长度，返回 (是否有效, 说明, 是否被截断)
+
+    header 为文件开头的至少14个字节（文件不足14字节时为全部内容）。
+    只检查文件头，数据区的CRC在转换时随解析一起校验，不需要再单独读一遍文件。
+    """
+    if file_size == 0:
+        return False, "文件为空", False
+    
+    # 检查文件大小是否合理（至少应该大于1KB）
+    if file_size < MIN_FIT_FILE_SIZE:
+        return False, f"文件过小（{file_size} 字节），可能不完整", False
+    
+    if len(header) < 12:
+        return False, "无法读取完整文件头，文件可能已损坏", False
+    
+    header_size = header[0]
+    if header_size not in FIT_HEADER_SIZES:
+        return False, f"文件头长度异常（{header_size} 字节），不是有效的FIT文件", False
+    if header[8:12] != b'.FIT':
+        return False, "文件头缺少.FIT标识，不是有效的FIT文件", False
+    
+    # 14字节文件头带有CRC，值为0表示未计算
+    if header_size == 14:
+        header_crc = header[12] | (header[13] << 8)
+        if header_crc != 0 and header_crc != fit_crc(header[:12]):
+            return False, "文件头CRC校验失败，文件可能已损坏", False
+    
+    # 文件头声明的数据长度超过实际文件大小时，说明文件被截断
+    data_size = int.from_bytes(header[4:8], 'little')
+    truncated = file_size < header_size + data_size + FIT_CRC_SIZE
+    if truncated:
+        return True, "文件验证通过（文件被截断，只能转换已写入的部分）", True
+    return True, "文件验证通过", False
+
+
+def validate_fit_file(file_path):
+    """验证FIT文件是否完整且可读（只读取文件头，不解析文件内容）"""
+    try:
+        # 检查文件是否存在
+        if not os.path.exists(file_path):
+            return False, "文件不存在"
+        
+        with open(file_path, 'rb') as f:
+            header = f.read(max(FIT_HEADER_SIZES))
+            file_size = os.fstat(f.fileno()).st_size
+        is_valid, validation_msg, _ = check_fit_header(header, file_size)
+        return is_valid, validation_msg
+    except Exception as e:
+        return False, f"文件验证失败: {str(e)}"
+
+
+def read_fit_data(f, file_size):
+    """读取已打开的FIT文件的全部内容
+
+    较大的文件返回只读内存映射：文件头检查、CRC、解码和内容哈希都直接在映射上进行，
+    不把文件复制到Python内存中，由系统按需分页读入。用完后调用 release_fit_data 关闭。
+    """
+    if file_size >= MMAP_MIN_SIZE:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # 某些文件系统不支持内存映射，退回普通读取
+            pass
+    return f.read()
+
+
+def release_fit_data(data):
+    """关闭 read_fit_data 返回的内存映射（Windows上映射关闭前文件不能被删除或替换）"""
+    if isinstance(data, mmap.mmap):
+        try:
+            data.close()
+        except BufferError:
+            # 仍有对象引用映射内容（如解码出错时的回溯），引用释放时映射随之关闭
+            pass
+
+
+def content_hash(data):
+    """计算文件内容哈希，用于判断源文件是否变化"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ConversionOptions:
+    """影响输出内容的转换选项，可在进程间传递
+
+    extensions 为输出到GPX扩展中的传感器字段（见 EXTENSION_FIELDS），默认不输出。
+    tolerance（米）、interval（秒）、max_points 为写入前的轨迹简化设置（见 fit2gpx_simplify），
+    为None时不启用对应的处理。
+    export_dir 不为None时，同时把解码出的记录按列导出到该目录（见 fit2gpx_columnar），
+    export_format 为 parquet 或 csv，为None时有pyarrow则为parquet。
+    summary 为True时在转换信息中附带活动摘要（见 fit2gpx_index），不影响输出内容，不计入缓存设置。
+    compression 为 gz 或 zst 时输出压缩的 .gpx.gz / .gpx.zst，compression_level 为整批转换使用的压缩级别，
+    为None时使用该格式的默认级别（见 fit2gpx_compress）。
+    """
+    def __init__(self, extensions=(), tolerance=None, interval=None, max_points=None, export_dir=None,
+                 export_format=None, summary=False, compression=None, compression_level=None):
+        unknown = [name for name in extensions if name not in EXTENSION_FIELDS]
+        if unknown:
+            raise ValueError(f"未知的扩展字段: {', '.join(unknown)}")
+        if tolerance is not None and tolerance <= 0:
+            raise ValueError(f"简化距离容差必须大于0: {tolerance}")
+        if interval is not None and interval <= 0:
+            raise ValueError(f"重采样间隔必须大于0: {interval}")
+        if max_points is not None and max_points < 2:
+            raise ValueError(f"最大点数至少为2: {max_points}")
+        # 按固定顺序保存，使相同的选择得到相同的缓存设置
+        self.extensions = tuple(name for name in EXTENSION_FIELDS if name in extensions)
+        self.tolerance = tolerance
+        self.interval = interval
+        self.max_points = max_points
+        self.export_dir = export_dir
+        self.export_format = None
+        if export_dir is not None:
+            from fit2gpx_columnar import resolve_format
+            self.export_format = resolve_format(export_format)
+        elif export_format is not None:
+            raise ValueError("指定导出格式时需要同时指定导出目录")
+        self.summary = summary
+        self.compression = None
+        self.compression_level = None
+        if compression is not None or compression_level is not None:
+            from fit2gpx_compress import resolve_compression
+            self.compression, self.compression_level = resolve_compression(compression, compression_level)
+
+    @property
+    def simplifies(self):
+        return self.tolerance is not None or self.interval is not None or self.max_points is not None
+
+    @property
+    def gpx_suffix(self):
+        """输出文件的扩展名：.gpx，压缩时为 .gpx.gz 或 .gpx.zst"""
+        return '.gpx' if self.compression is None else '.gpx.' + self.compression
+
+    @property
+    def decode_fields(self):
+        """需要解码的传感器字段：按列导出时解码全部字段"""
+        return EXTENSION_FIELDS if self.export_dir is not None else self.extensions
+
+    def export_path(self, fit_file_path):
+        """FIT文件对应的列式导出文件路径，不导出时为None"""
+        if self.export_dir is None:
+            return None
+        from fit2gpx_columnar import partition_path
+        return partition_path(self.export_dir, fit_file_path, self.export_format)
+
+    def settings(self):
+        settings = {'extensions': list(self.extensions)}
+        # 未启用简化时不写入相关设置，已有的缓存记录仍然有效
+        if self.simplifies:
+            settings['simplify'] = {'tolerance': self.tolerance, 'interval': self.interval,
+                                    'max_points': self.max_points}
+        if self.export_dir is not None:
+            settings['export'] = {'format': self.export_format, 'dir': os.path.abspath(self.export_dir)}
+        if self.compression is not None:
+            settings['compression'] = {'format': self.compression, 'level': self.compression_level}
+        return settings
+
+    def consumer(self, gpx_file_path, metrics=NULL_METRICS, export_path=None):
+        """生成交给 decode_fit_records 的处理函数，返回写入的点数、简化前的点数和活动摘要（未启用时为None）
+
+        export_path 不为None时，解码出的记录同时按列写入该文件；没有写入任何轨迹点或出错时删除导出文件。
+        """
+        def consume(decoder):
+            chunks = metrics.timed('decode', decoder)
+            summary = None
+            if self.summary:
+                from fit2gpx_index import TrackSummary
+                # 每次调用都重新创建：退回fitparse时会从头再统计一遍
+                summary = TrackSummary(metrics)
+                chunks = summary.tee(chunks)
+            if export_path is None:
+                points, input_points = write(chunks)
+            else:
+                from fit2gpx_columnar import ColumnarWriter
+                exporter = ColumnarWriter(export_path, self.export_format, metrics)
+                try:
+                    points, input_points = write(exporter.tee(chunks))
+                    if points:
+                        exporter.close()
+                    else:
+                        # 没有有效轨迹点时转换会失败，与GPX一样不留下导出文件
+                        exporter.discard()
+                except BaseException:
+                    exporter.discard()
+                    raise
+            return points, input_points, summary and summary.as_dict()
+
+        def write(chunks):
+            if not self.simplifies:
+                points = write_gpx(chunks, gpx_file_path, self.extensions, metrics, self)
+                return points, points
+            from fit2gpx_simplify import TrackSimplifier
+            # 每次调用都重新创建：退回fitparse时会从头再处理一遍
+            simplifier = TrackSimplifier(self.tolerance, self.interval, self.max_points)
+            # 简化需要整条轨迹，先解码全部记录，使解码和简化分开计时
+            chunks = list(chunks)
+            with metrics.timer('simplify'):
+                track = list(simplifier.apply(chunks))
+            points = write_gpx(track, gpx_file_path, self.extensions, metrics, self)
+            return points, simplifier.input_points
+        return consume
+
+
+def decode_fit_records(data, consume, fields=(), metrics=NULL_METRICS, markers=False):
+    """解码FIT文件中的record消息，交给 consume(decoder) 处理并返回 (consume的结果, 解码器)
+
+    fields 为需要额外解码的传感器字段。优先使用快速解码器；遇到其无法处理的文件结构时，
+    整份文件改用fitparse重新解码，consume 会以新的解码器再被调用一次，因此它必须能从头重新开始。
+    markers 为True时解码器同时记录设备和session/lap开始时间（见 fit2gpx_decoder.MARKER_MESSAGES）。
+    """
+    from fit2gpx_decoder import RecordDecoder, FitparseRecordDecoder, UnsupportedFitError
+    
+    decoder = RecordDecoder(data, fields, markers=markers)
+    try:
+        return consume(decoder), decoder
+    except UnsupportedFitError:
+        metrics.count('decode_retries')
+        decoder = FitparseRecordDecoder(data, fields, markers=markers)
+        return consume(decoder), decoder
+
+
+def write_gpx(decoder, gpx_file_path, extensions=(), metrics=NULL_METRICS, options=None):
+    """把解码器产出的记录流式写入GPX文件，返回写入的点数；失败时删除部分写入的文件
+
+    options 用于确定是否压缩输出，为None时不压缩。
+    """
+    from fit2gpx_gpx import GpxWriter
+    
+    options = options or ConversionOptions()
+    writer = GpxWriter(gpx_file_path, extensions, metrics, options.compression, options.compression_level)
+    try:
+        for chunk in decoder:
+            writer.write_chunk(chunk)
+        writer.close()
+    except BaseException:
+        writer.discard()
+        raise
+    return writer.points
+
+
+def fit_to_gpx(fit_file_path, gpx_file_path, options=None, metrics=None):
+    """转换单个FIT文件，返回转换信息字典
+
+    字典包含 status、points（写入的点数）、input_points（简化前的有效点数）、records（读取的记录数），以及源文件的
+    source_size、source_mtime_ns、source_hash 和输出文件大小 output_size，供增量转换缓存使用；
+    options.summary 为True时还有 summary（活动摘要）。
+    metrics 为 StageMetrics 时记录各阶段耗时和计数（见 fit2gpx_metrics）。
+    """
+    options = options or ConversionOptions()
+    metrics = metrics or NULL_METRICS
+    # 只打开一次文件，文件头检查、内容哈希和解析都在这份数据（或内存映射）上完成
+    with metrics.timer('validate'):
+        try:
+            with open(fit_file_path, 'rb') as f:
+                source_stat = os.fstat(f.fileno())
+                data = read_fit_data(f, source_stat.st_size)
+        except Exception as e:
+            raise Exception(f"文件验证失败: 文件访问错误: {str(e)}")
+        metrics.count('bytes_read', len(data))
+    try:
+        return _convert_fit_data(data, source_stat, gpx_file_path, options, metrics,
+                                 options.export_path(fit_file_path))
+    finally:
+        release_fit_data(data)
+
+
+def _convert_fit_data(data, source_stat, gpx_file_path, options, metrics, export_path=None):
+    """fit_to_gpx 读取文件之后的部分：检查文件头，解码并写入GPX，返回转换信息"""
+    with metrics.timer('validate'):
+        is_valid, validation_msg, truncated = check_fit_header(data[:max(FIT_HEADER_SIZES)], len(data))
+        if not is_valid:
+            raise Exception(f"文件验证失败: {validation_msg}")
+    
+    # 单次解码FIT文件中的所有记录，边解码边写入GPX；文件被截断时保留已解码的点
+    try:
+        (points_added, input_points, summary), decoder = decode_fit_records(
+            data, options.consumer(gpx_file_path, metrics, export_path), options.decode_fields, metrics)
+        decode_error = None
+    except Exception as e:
+        decode_error = str(e)
+    if decode_error is not None:
+        # 在except块之外抛出，不保留原异常的回溯：回溯中的解码器仍引用着内存映射，会使映射无法及时关闭
+        raise Exception(f"解析FIT文件记录时出错: {decode_error}")
+    status = STATUS_TRUNCATED if truncated or decoder.truncated else STATUS_OK
+    metrics.count('records_read', decoder.record_count)
+    metrics.count('points_written', points_added)
+    metrics.count('points_dropped', decoder.record_count - input_points)
+    metrics.count('points_simplified', input_points - points_added)
+    
+    # 只有当写入了点时才会生成GPX文件
+    if points_added == 0:
+        if status == STATUS_TRUNCATED:
+            raise Exception("解析FIT文件记录时出错: 文件可能已损坏或不完整，未能解析出任何轨迹点")
+        raise Exception("未找到有效的轨迹点，无法生成GPX文件")
+    
+    output_size = os.path.getsize(gpx_file_path)
+    metrics.count('bytes_written', output_size)
+    with metrics.timer('hash'):
+        source_hash = content_hash(data)
+    info = {
+        'status': status,
+        'points': points_added,
+        'input_points': input_points,
+        'records': decoder.record_count,
+        'source_size': len(data),
+        'source_mtime_ns': source_stat.st_mtime_ns,
+        'source_hash': source_hash,
+        'output_size': output_size,
+    }
+    if summary is not None:
+        info['summary'] = summary
+    return info
+
+
+def converter_settings(options=None):
+    """影响输出内容的转换设置，记录在增量转换缓存中"""
+    settings = {'version': CONVERTER_VERSION}
+    settings.update((options or ConversionOptions()).settings())
+    return settings
+
+
+OVERWRITE_POLICIES = ('overwrite', 'skip')
+
+
+def is_fit_file_name(file_name):
+    return file_name.lower().endswith('.fit')
+
+
+def find_fit_files(folder_path):
+    """获取文件夹中的所有FIT文件名（按名称排序）"""
+    return sorted(f for f in os.listdir(folder_path) if is_fit_file_name(f))
+
+
+def gpx_path_for(fit_file_path, output_folder_path, suffix='.gpx'):
+    """FIT文件对应的GPX输出路径，压缩输出时 suffix 为 ConversionOptions.gpx_suffix"""
+    return os.path.join(output_folder_path, os.path.splitext(os.path.basename(fit_file_path))[0] + suffix)
+
+
+def build_jobs(folder_path, output_folder_path, fit_files=None, overwrite='overwrite', suffix='.gpx'):
+    """为文件夹中的FIT文件生成转换任务列表，返回 (任务列表, 因已存在而跳过的文件列表)"""
+    if overwrite not in OVERWRITE_POLICIES:
+        raise ValueError(f"未知的覆盖策略: {overwrite}")
+    if fit_files is None:
+        fit_files = find_fit_files(folder_path)
+    
+    jobs = []
+    skipped = []
+    for fit_file in fit_files:
+        fit_file_path = os.path.join(folder_path, fit_file)
+        gpx_file_path = gpx_path_for(fit_file, output_folder_path, suffix)
+        if overwrite == 'skip' and os.path.exists(gpx_file_path):
+            skipped.append(fit_file)
+            continue
+        jobs.append((fit_file_path, gpx_file_path))
+    return jobs, skipped
+
+
+class ConversionResult:
+    """单个文件的转换结果，可在进程间传递"""
+    def __init__(self, fit_file_path, gpx_file_path, success, error_msg="", info=None, metrics=None):
+        self.fit_file_path = fit_file_path
+        self.gpx_file_path = gpx_file_path
+        self.success = success
+        self.error_msg = error_msg
+        # fit_to_gpx 返回的转换信息，失败时为空字典
+        self.info = info or {}
+        self.status = self.info.get('status')
+        self.points = self.info.get('points', 0)
+        self.input_points = self.info.get('input_points', self.points)
+        # StageMetrics.as_dict() 的结果，未启用计时时为None
+        self.metrics = metrics
+
+    def reduction_note(self):
+        """轨迹经过简化时返回点数变化的说明，否则返回空字符串"""
+        if not self.success or self.input_points <= self.points:
+            return ""
+        reduced = 1 - self.points / self.input_points
+        return f"（简化 {self.input_points} -> {self.points} 个点，减少 {reduced:.1%}）"
+
+
+def convert_job(job, options=None, metrics=False):
+    """转换单个任务，捕获异常并返回结果而不是抛出；metrics 为True时在结果中附带阶段耗时和计数"""
+    fit_file_path, gpx_file_path = job
+    stage_metrics = StageMetrics() if metrics else None
+    try:
+        info = fit_to_gpx(fit_file_path, gpx_file_path, options, stage_metrics)
+        result = ConversionResult(fit_file_path, gpx_file_path, True, info=info)
+    except Exception as e:
+        result = ConversionResult(fit_file_path, gpx_file_path, False, str(e))
+    if stage_metrics is not None:
+        result.metrics = stage_metrics.as_dict()
+    return result
+
+
+def convert_chunk(jobs, options=None, metrics=False):
+    """在工作进程中转换一组任务"""
+    return [convert_job(job, options, metrics) for job in jobs]
+
+
+def ignore_interrupt():
+    """进程池工作进程的初始化函数：忽略Ctrl+C
+
+    在终端中按Ctrl+C时前台的所有进程都会收到SIGINT。工作进程忽略它，由主进程处理中断、停止提交任务，
+    工作进程不会各自打印KeyboardInterrupt的回溯，正在转换的文件也能正常写完。
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class BatchConverter:
+    """批量转换引擎，将fit_to_gpx任务分发到进程池并逐个回传结果"""
+    def __init__(self, workers=None, chunksize=1, ordered=False, options=None, metrics=False):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.chunksize = max(1, chunksize)
+        self.ordered = ordered
+        self.options = options
+        self.metrics = metrics
+
+    def run(self, jobs, on_result=None):
+        """转换所有任务，每完成一个文件调用一次on_result(已完成数, 总数, 结果)"""
+        jobs = list(jobs)
+        total = len(jobs)
+        results = []
+        for result in self.iter_results(jobs):
+            results.append(result)
+            if on_result is not None:
+                on_result(len(results), total, result)
+        return results
+
+    def iter_results(self, jobs):
+        """按完成顺序（或ordered=True时按提交顺序）产出转换结果"""
+        jobs = list(jobs)
+        chunks = [jobs[i:i + self.chunksize] for i in range(0, len(jobs), self.chunksize)]
+        if not chunks:
+            return
+
+        # 单进程或只有一个分块时直接在当前进程转换，省去进程启动开销
+        if self.workers == 1 or len(chunks) == 1:
+            for chunk in chunks:
+                yield from convert_chunk(chunk, self.options, self.metrics)
+            return
+
+        # 限制同时提交的分块数量，避免上万个文件一次性全部排队
+        max_pending = self.workers * 2
+        pending_chunks = iter(chunks)
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(chunks)), initializer=ignore_interrupt) as executor:
+            try:
+                if self.ordered:
+                    pending = deque()
+                    for chunk in pending_chunks:
+                        pending.append(executor.submit(convert_chunk, chunk, self.options, self.metrics))
+                        if len(pending) >= max_pending:
+                            yield from pending.popleft().result()
+                    while pending:
+                        yield from pending.popleft().result()
+                else:
+                    pending = set()
+                    for chunk in pending_chunks:
+                        pending.add(executor.submit(convert_chunk, chunk, self.options, self.metrics))
+                        if len(pending) >= max_pending:
+                            done = next(as_completed(pending))
+                            pending.remove(done)
+                            yield from done.result()
+                    for future in as_completed(pending):
+                        yield from future.result()
+            except BaseException:
+                # 中断（Ctrl+C）或提前停止迭代时撤销尚未开始的分块，只等待正在转换的分块完成
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
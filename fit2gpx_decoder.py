@@ -0,0 +1,531 @@
+"""FIT record 消息（全局消息号20）的快速解码器
+
+快速解码器只解析消息头和定义消息来定位每条record消息，再按每个本地消息类型预先算好的
+字段偏移，用NumPy从原始字节中批量取出经纬度、时间和海拔，不为每条记录创建fitparse对象。
+遇到无法处理的文件结构时抛出 UnsupportedFitError，调用方应改用 FitparseRecordDecoder。
+
+两种解码器都按块产出 RecordChunk，数值与原先逐字段读取fitparse结果完全一致。
+"""
+import struct
+import numpy as np
+
+from fit2gpx_core import fit_crc
+
+RECORD_MESG_NUM = 20
+TIMESTAMP_FIELD_NUM = 253
+
+# 每块最多包含的记录数
+DEFAULT_CHUNK_SIZE = 4096
+
+SEMICIRCLES_PER_DEGREE = (2**32) / 360.0
+
+# 基本类型号（去掉端序标志位后）对应的字节数，未知类型按1字节处理（与fitparse一致）
+BASE_TYPE_SIZES = {
+    0x00: 1, 0x01: 1, 0x02: 1, 0x03: 2, 0x04: 2, 0x05: 4, 0x06: 4, 0x07: 1, 0x08: 4,
+    0x09: 8, 0x0A: 1, 0x0B: 2, 0x0C: 4, 0x0D: 1, 0x0E: 8, 0x0F: 8, 0x10: 8,
+}
+
+# 需要提取的record字段：名称 -> (字段号, 基本类型号, NumPy类型, 无效值)
+RECORD_FIELDS = {
+    'position_lat': (0, 0x05, 'i4', 0x7FFFFFFF),
+    'position_long': (1, 0x05, 'i4', 0x7FFFFFFF),
+    'altitude': (2, 0x04, 'u2', 0xFFFF),
+    'timestamp': (TIMESTAMP_FIELD_NUM, 0x06, 'u4', 0xFFFFFFFF),
+}
+
+# 可选的传感器字段：名称 -> (字段号, 基本类型号, NumPy类型, 无效值, 比例)
+SENSOR_FIELDS = {
+    'heart_rate': (3, 0x02, 'u1', 0xFF, None),
+    'cadence': (4, 0x02, 'u1', 0xFF, None),
+    'power': (7, 0x04, 'u2', 0xFFFF, None),
+    'temperature': (13, 0x01, 'i1', 0x7F, None),
+    'speed': (6, 0x04, 'u2', 0xFFFF, 1000),
+    'enhanced_speed': (73, 0x06, 'u4', 0xFFFFFFFF, 1000),
+}
+# 可在GPX扩展中输出的字段；speed 无效时取 enhanced_speed
+EXTENSION_FIELD_NAMES = ('heart_rate', 'cadence', 'power', 'temperature', 'speed')
+# compressed_speed_distance 的速度是位域分量，快速解码器不处理
+COMPRESSED_SPEED_DISTANCE_FIELD_NUM = 8
+
+
+def _sensor_field_names(fields):
+    """需要解码的传感器字段名（输出速度时同时解码 enhanced_speed）"""
+    names = [name for name in EXTENSION_FIELD_NAMES if name in fields]
+    if 'speed' in names:
+        names.append('enhanced_speed')
+    return names
+
+INVALID_TIMESTAMP = 0xFFFFFFFF
+
+# 合并多个文件时需要的其他消息：全局消息号 -> (消息名, {字段号: (字段名, 基本类型号, struct格式, 无效值)})
+# file_id 用于识别设备，session/lap 的开始时间用于在写入时分段
+MARKER_MESSAGES = {
+    0: ('file_id', {1: ('manufacturer', 0x04, 'H', 0xFFFF), 2: ('product', 0x04, 'H', 0xFFFF),
+                    3: ('serial_number', 0x0C, 'I', 0)}),
+    18: ('session', {2: ('start_time', 0x06, 'I', INVALID_TIMESTAMP)}),
+    19: ('lap', {2: ('start_time', 0x06, 'I', INVALID_TIMESTAMP)}),
+}
+
+
+class UnsupportedFitError(Exception):
+    """快速解码器无法处理的文件结构，应回退到fitparse"""
+
+
+class RecordChunk:
+    """一块record消息解码结果
+
+    timestamp 为FIT原始秒数（无效为-1），latitude/longitude 为度，altitude 为米，无效值为NaN。
+    """
+    def __init__(self, timestamp, latitude, longitude, altitude, sensors=None):
+        self.timestamp = timestamp
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        # 传感器字段名 -> 数值数组（无效值为NaN），只包含请求解码的字段
+        self.sensors = sensors or {}
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def valid_position_mask(self):
+        """经纬度都存在且不为0的记录（与原先的过滤条件一致）"""
+        lat = self.latitude
+        lon = self.longitude
+        return ~np.isnan(lat) & ~np.isnan(lon) & (lat != 0) & (lon != 0)
+
+    def select(self, index):
+        """按布尔掩码或下标取出部分记录，返回新的RecordChunk"""
+        return RecordChunk(
+            self.timestamp[index],
+            self.latitude[index],
+            self.longitude[index],
+            self.altitude[index],
+            {name: values[index] for name, values in self.sensors.items()},
+        )
+
+    @classmethod
+    def concatenate(cls, chunks):
+        """把多个RecordChunk按顺序合并为一个"""
+        if not chunks:
+            return cls.from_lists([], [], [], [])
+        return cls(
+            np.concatenate([chunk.timestamp for chunk in chunks]),
+            np.concatenate([chunk.latitude for chunk in chunks]),
+            np.concatenate([chunk.longitude for chunk in chunks]),
+            np.concatenate([chunk.altitude for chunk in chunks]),
+            {name: np.concatenate([chunk.sensors[name] for chunk in chunks]) for name in chunks[0].sensors},
+        )
+
+    @classmethod
+    def from_lists(cls, timestamp, latitude, longitude, altitude, sensors=None):
+        return cls(
+            np.array(timestamp, dtype=np.int64),
+            np.array(latitude, dtype=np.float64),
+            np.array(longitude, dtype=np.float64),
+            np.array(altitude, dtype=np.float64),
+            {name: np.array(values, dtype=np.float64) for name, values in (sensors or {}).items()},
+        )
+
+
+class _Definition:
+    """一个本地消息类型的定义，以及预先算好的record字段偏移"""
+    __slots__ = ('key', 'size', 'is_record', 'fields', 'timestamp_struct', 'timestamp_offset', 'marker')
+
+    def __init__(self, key, size, is_record, fields, timestamp_struct, timestamp_offset, marker=None):
+        self.key = key
+        self.size = size
+        self.is_record = is_record
+        self.fields = fields
+        self.timestamp_struct = timestamp_struct
+        self.timestamp_offset = timestamp_offset
+        # 需要记录的 MARKER_MESSAGES 消息：(消息名, [(字段名, 偏移, struct, 无效值)])，其他消息为None
+        self.marker = marker
+
+
+class _MarkerMixin:
+    """两种解码器共用：记录第一条 file_id 的设备信息，以及 session/lap 的开始时间"""
+    def _reset_markers(self):
+        # (manufacturer, product, serial_number)，无效的字段为None；文件中没有 file_id 时为None
+        self.device = None
+        self.session_starts = []
+        self.lap_starts = []
+
+    def _add_marker(self, name, values):
+        if name == 'file_id':
+            if self.device is None:
+                self.device = (values.get('manufacturer'), values.get('product'), values.get('serial_number'))
+        elif values.get('start_time') is not None:
+            starts = self.session_starts if name == 'session' else self.lap_starts
+            starts.append(values['start_time'])
+
+
+class RecordDecoder(_MarkerMixin):
+    """基于NumPy的record消息快速解码器，迭代产出 RecordChunk
+
+    fields 为需要额外解码的传感器字段名（见 EXTENSION_FIELD_NAMES），在创建解码器时确定，
+    每个定义消息只解析一次字段偏移，不会逐条记录判断字段。
+    迭代结束后 truncated 表示文件是否被截断（已解码的记录仍会全部产出）。
+    markers 为True时同时记录 device、session_starts、lap_starts（见 MARKER_MESSAGES）。
+    """
+    def __init__(self, data, fields=(), chunk_size=DEFAULT_CHUNK_SIZE, check_crc=True, markers=False):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.check_crc = check_crc
+        self.markers = markers
+        self.truncated = False
+        self.record_count = 0
+        self._reset_markers()
+        self._definitions = []
+        self._sensor_names = _sensor_field_names(fields)
+        self._field_specs = {spec[0]: (name,) + spec[1:] for name, spec in RECORD_FIELDS.items()}
+        for name in self._sensor_names:
+            spec = SENSOR_FIELDS[name]
+            self._field_specs[spec[0]] = (name,) + spec[1:4]
+
+    def __iter__(self):
+        data = self.data
+        data_len = len(data)
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        offsets = []
+        def_keys = []
+        compressed = []
+        pos = 0
+
+        # 链式FIT文件中每个子文件都有自己的文件头和CRC
+        while pos < data_len:
+            file_start = pos
+            header_size, data_size = self._parse_header(data, pos)
+            pos += header_size
+            end = pos + data_size
+            limit = min(end, data_len)
+
+            local_defs = {}
+            ts_accumulator = 0
+
+            while pos < limit:
+                header = data[pos]
+                if header & 0x80:
+                    # 压缩时间戳消息头：低5位为时间偏移
+                    definition = local_defs.get((header >> 5) & 0x3)
+                    if definition is None:
+                        raise UnsupportedFitError("数据消息引用了未定义的本地消息类型")
+                    if pos + 1 + definition.size > limit:
+                        break
+                    if definition.timestamp_struct is not None:
+                        raw = definition.timestamp_struct.unpack_from(data, pos + 1 + definition.timestamp_offset)[0]
+                        if raw != INVALID_TIMESTAMP:
+                            ts_accumulator = raw
+                    time_offset = header & 0x1F
+                    timestamp = time_offset + (ts_accumulator & ~0x1F)
+                    if time_offset < (ts_accumulator & 0x1F):
+                        timestamp += 0x20
+                    ts_accumulator = timestamp
+                    if definition.is_record:
+                        offsets.append(pos + 1)
+                        def_keys.append(definition.key)
+                        compressed.append(timestamp)
+                    elif definition.marker is not None:
+                        self._read_marker(data, pos + 1, definition.marker)
+                    pos += 1 + definition.size
+                elif header & 0x40:
+                    new_pos = self._parse_definition(data, pos, limit, local_defs)
+                    if new_pos is None:
+                        break
+                    pos = new_pos
+                else:
+                    definition = local_defs.get(header & 0xF)
+                    if definition is None:
+                        raise UnsupportedFitError("数据消息引用了未定义的本地消息类型")
+                    if pos + 1 + definition.size > limit:
+                        break
+                    if definition.timestamp_struct is not None:
+                        raw = definition.timestamp_struct.unpack_from(data, pos + 1 + definition.timestamp_offset)[0]
+                        if raw != INVALID_TIMESTAMP:
+                            ts_accumulator = raw
+                    if definition.is_record:
+                        offsets.append(pos + 1)
+                        def_keys.append(definition.key)
+                        compressed.append(-1)
+                    elif definition.marker is not None:
+                        self._read_marker(data, pos + 1, definition.marker)
+                    pos += 1 + definition.size
+
+                if len(offsets) >= self.chunk_size:
+                    yield self._extract(buffer, offsets, def_keys, compressed)
+                    offsets, def_keys, compressed = [], [], []
+
+            if pos < end or end + 2 > data_len:
+                if end + 2 <= data_len:
+                    # 文件完整但消息越过了数据区末尾，交给fitparse判断
+                    raise UnsupportedFitError("消息长度超出数据区")
+                # 数据区或末尾CRC不完整：文件被截断，保留已解码的记录
+                self.truncated = True
+                break
+
+            if self.check_crc:
+                stored_crc = data[end] | (data[end + 1] << 8)
+                if fit_crc(memoryview(data)[file_start:end]) != stored_crc:
+                    raise UnsupportedFitError("数据区CRC校验失败")
+            pos = end + 2
+
+        if offsets:
+            yield self._extract(buffer, offsets, def_keys, compressed)
+
+    @staticmethod
+    def _parse_header(data, pos):
+        if len(data) - pos < 12:
+            raise UnsupportedFitError("文件头不完整")
+        header_size = data[pos]
+        if header_size not in (12, 14) or bytes(data[pos + 8:pos + 12]) != b'.FIT':
+            raise UnsupportedFitError("无效的FIT文件头")
+        data_size = int.from_bytes(data[pos + 4:pos + 8], 'little')
+        return header_size, data_size
+
+    def _parse_definition(self, data, pos, limit, local_defs):
+        """解析定义消息，返回下一条消息的位置；消息不完整时返回None"""
+        header = data[pos]
+        if pos + 6 > limit:
+            return None
+        endian = '>' if data[pos + 2] else '<'
+        global_num = struct.unpack_from(endian + 'H', data, pos + 3)[0]
+        num_fields = data[pos + 5]
+        field_start = pos + 6
+        dev_start = field_start + num_fields * 3
+        if dev_start > limit:
+            return None
+
+        is_record = global_num == RECORD_MESG_NUM
+        marker_spec = MARKER_MESSAGES.get(global_num) if self.markers else None
+        marker_fields = []
+        fields = {}
+        timestamp_struct = None
+        timestamp_offset = 0
+        offset = 0
+        for i in range(num_fields):
+            field_num, field_size, base_type = data[field_start + i * 3:field_start + i * 3 + 3]
+            base_num = base_type & 0x1F
+            if field_size % BASE_TYPE_SIZES.get(base_num, 1) != 0:
+                raise UnsupportedFitError("字段长度与基本类型不匹配")
+
+            if field_num == TIMESTAMP_FIELD_NUM and field_size == 4:
+                timestamp_struct = struct.Struct(endian + 'I')
+                timestamp_offset = offset
+            if is_record and field_num == COMPRESSED_SPEED_DISTANCE_FIELD_NUM and 'speed' in self._sensor_names:
+                raise UnsupportedFitError("不支持压缩的速度字段")
+            if is_record and field_num in self._field_specs:
+                name, expected_base, dtype, invalid = self._field_specs[field_num]
+                if base_num != expected_base or field_size != np.dtype(dtype).itemsize:
+                    # 类型或长度与规范不同（如数组字段），交给fitparse处理
+                    raise UnsupportedFitError(f"record字段 {name} 的类型不受支持")
+                fields[name] = (offset, np.dtype(endian + dtype), invalid)
+            if marker_spec is not None and field_num in marker_spec[1]:
+                name, expected_base, fmt, invalid = marker_spec[1][field_num]
+                field_struct = struct.Struct(endian + fmt)
+                # 类型不符的字段不记录，不影响record的解码
+                if base_num == expected_base and field_size == field_struct.size:
+                    marker_fields.append((name, offset, field_struct, invalid))
+            offset += field_size
+
+        next_pos = dev_start
+        if header & 0x20:
+            # 开发者字段只需要跳过其字节
+            if dev_start + 1 > limit:
+                return None
+            num_dev_fields = data[dev_start]
+            next_pos = dev_start + 1 + num_dev_fields * 3
+            if next_pos > limit:
+                return None
+            for i in range(num_dev_fields):
+                offset += data[dev_start + 1 + i * 3 + 1]
+
+        marker = (marker_spec[0], marker_fields) if marker_spec is not None else None
+        definition = _Definition(len(self._definitions), offset, is_record, fields,
+                                 timestamp_struct, timestamp_offset, marker)
+        self._definitions.append(definition)
+        local_defs[header & 0xF] = definition
+        return next_pos
+
+    def _read_marker(self, data, start, marker):
+        name, marker_fields = marker
+        values = {}
+        for field_name, offset, field_struct, invalid in marker_fields:
+            value = field_struct.unpack_from(data, start + offset)[0]
+            if value != invalid:
+                values[field_name] = value
+        self._add_marker(name, values)
+
+    def _extract(self, buffer, offsets, def_keys, compressed):
+        """按定义分组，从原始字节中批量取出一块记录的字段值"""
+        count = len(offsets)
+        self.record_count += count
+        offsets = np.array(offsets, dtype=np.int64)
+        def_keys = np.array(def_keys, dtype=np.int64)
+        compressed = np.array(compressed, dtype=np.int64)
+
+        timestamp = np.full(count, -1, dtype=np.int64)
+        latitude = np.full(count, np.nan)
+        longitude = np.full(count, np.nan)
+        altitude = np.full(count, np.nan)
+        sensors = {name: np.full(count, np.nan) for name in self._sensor_names}
+
+        keys = np.unique(def_keys)
+        for key in keys:
+            definition = self._definitions[key]
+            # 通常整块记录都来自同一个定义，此时无需按定义筛选
+            rows = slice(None) if len(keys) == 1 else np.nonzero(def_keys == key)[0]
+            starts = offsets[rows]
+            for name, (offset, dtype, invalid) in definition.fields.items():
+                raw = _gather(buffer, starts + offset, dtype)
+                valid = raw != invalid
+                if name == 'timestamp':
+                    values = np.where(valid, raw.astype(np.int64), -1)
+                    timestamp[rows] = values
+                elif name == 'altitude':
+                    altitude[rows] = np.where(valid, raw.astype(np.float64) / 5 - 500, np.nan)
+                elif name == 'position_lat':
+                    latitude[rows] = np.where(valid, raw / SEMICIRCLES_PER_DEGREE, np.nan)
+                elif name == 'position_long':
+                    longitude[rows] = np.where(valid, raw / SEMICIRCLES_PER_DEGREE, np.nan)
+                else:
+                    scale = SENSOR_FIELDS[name][4]
+                    values = raw.astype(np.float64)
+                    if scale:
+                        values = values / scale
+                    sensors[name][rows] = np.where(valid, values, np.nan)
+
+        # 压缩时间戳消息头优先于消息内的时间戳字段（与fitparse的字段顺序一致）
+        has_compressed = compressed >= 0
+        if has_compressed.any():
+            timestamp = np.where(has_compressed, compressed, timestamp)
+
+        return RecordChunk(timestamp, latitude, longitude, altitude, _merge_speed(sensors))
+
+
+def _merge_speed(sensors):
+    """合并为一个 speed 字段：与fitparse一致，speed 有效时使用它，否则使用 enhanced_speed"""
+    enhanced = sensors.pop('enhanced_speed', None)
+    if enhanced is not None:
+        sensors['speed'] = np.where(np.isnan(sensors['speed']), enhanced, sensors['speed'])
+    return sensors
+
+
+def _gather(buffer, starts, dtype):
+    """从字节缓冲区中取出 starts 处的定长数值"""
+    size = dtype.itemsize
+    index = starts[:, None] + np.arange(size)
+    return buffer[index].view(dtype).reshape(-1)
+
+
+class _BufferReader:
+    """供fitparse读取的只读文件对象：按需从 data（bytes或内存映射）中切片，不复制整个文件
+
+    fitparse读到文件末尾时会调用 close()，这里只释放对 data 的引用，不关闭内存映射。
+    """
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def read(self, size=-1):
+        start = self._pos
+        end = len(self._view) if size is None or size < 0 else min(start + size, len(self._view))
+        self._pos = max(start, end)
+        return bytes(self._view[start:end])
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._view.release()
+
+
+class FitparseRecordDecoder(_MarkerMixin):
+    """基于fitparse的通用解码器，快速解码器无法处理的文件使用此解码器"""
+    def __init__(self, data, fields=(), chunk_size=DEFAULT_CHUNK_SIZE, markers=False):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.markers = markers
+        self.truncated = False
+        self.record_count = 0
+        self._sensor_names = _sensor_field_names(fields)
+        self._reset_markers()
+
+    def __iter__(self):
+        import fitparse
+        from fitparse.utils import FitEOFError
+
+        # 数据区CRC由fitparse在解析过程中顺带校验
+        try:
+            fitfile = fitparse.FitFile(_BufferReader(self.data))
+        except Exception as e:
+            raise Exception(f"无法解析FIT文件: {str(e)}")
+
+        # 传感器字段名到列表下标的映射，每个文件只建立一次
+        sensor_index = {name: i for i, name in enumerate(self._sensor_names)}
+        timestamps, latitudes, longitudes, altitudes = [], [], [], []
+        sensors = [[] for _ in self._sensor_names]
+        names = ['record']
+        if self.markers:
+            names += [name for name, _ in MARKER_MESSAGES.values()]
+        try:
+            for record in fitfile.get_messages(names):
+                if record.name != 'record':
+                    self._read_marker(record)
+                    continue
+                self.record_count += 1
+                latitude = longitude = altitude = np.nan
+                timestamp = -1
+                sensor_values = [np.nan] * len(sensors)
+                for data in record:
+                    if data.value is None:
+                        continue
+                    if data.name == 'position_lat':
+                        latitude = data.value / SEMICIRCLES_PER_DEGREE
+                    elif data.name == 'position_long':
+                        longitude = data.value / SEMICIRCLES_PER_DEGREE
+                    elif data.name == 'timestamp':
+                        timestamp = data.raw_value
+                    elif data.name == 'altitude':
+                        altitude = data.value
+                    elif data.name in sensor_index:
+                        sensor_values[sensor_index[data.name]] = data.value
+                timestamps.append(timestamp)
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+                altitudes.append(altitude)
+                for values, value in zip(sensors, sensor_values):
+                    values.append(value)
+
+                if len(timestamps) >= self.chunk_size:
+                    yield self._chunk(timestamps, latitudes, longitudes, altitudes, sensors)
+                    timestamps, latitudes, longitudes, altitudes = [], [], [], []
+                    sensors = [[] for _ in self._sensor_names]
+        except FitEOFError:
+            # 文件被截断：保留已解析的记录
+            self.truncated = True
+
+        if timestamps:
+            yield self._chunk(timestamps, latitudes, longitudes, altitudes, sensors)
+
+    def _read_marker(self, message):
+        # 按字段号取原始数值，与快速解码器一致（product 会被fitparse解析为 garmin_product 等子字段）
+        marker_fields = MARKER_MESSAGES[message.mesg_num][1]
+        values = {}
+        for data in message:
+            def_num = data.field_def.def_num if data.field_def else data.def_num
+            if def_num in marker_fields and data.raw_value is not None:
+                values[marker_fields[def_num][0]] = data.raw_value
+        self._add_marker(message.name, values)
+
+    def _chunk(self, timestamps, latitudes, longitudes, altitudes, sensors):
+        chunk = RecordChunk.from_lists(timestamps, latitudes, longitudes, altitudes,
+                                       dict(zip(self._sensor_names, sensors)))
+        _merge_speed(chunk.sensors)
+        return chunk
@@ -0,0 +1,337 @@
+"""流式GPX 1.1写入器
+
+按块把轨迹点直接写入输出文件，不构建gpxpy对象树，也不在内存中拼接整个文档，
+内存占用与活动时长无关。不输出扩展数据时，结果与 gpxpy 的 GPX.to_xml() 逐字节一致。
+
+可选输出 Garmin TrackPointExtension v2（温度、心率、踏频、速度）和 PowerExtension v1（功率）。
+扩展数据按列生成：每个字段只格式化出现过的不同取值，按下标取回各点的文本后整列放入输出，不逐点拼接。
+
+也可以输出为 .gpx.gz 或 .gpx.zst，压缩在后台线程中与生成文本同时进行（见 fit2gpx_compress）。
+"""
+import os
+import numpy as np
+
+from fit2gpx_metrics import NULL_METRICS
+
+# FIT时间戳起点（1989-12-31 00:00 UTC）对应的Unix时间
+FIT_EPOCH_UNIX = 631065600
+# 小于此值的FIT时间戳表示设备相对时间，gpxpy输出时带Z后缀
+FIT_SYSTEM_TIME_LIMIT = 0x10000000
+
+GPX_SCHEMA_LOCATION = 'http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd'
+TRACKPOINT_EXTENSION_NS = 'http://www.garmin.com/xmlschemas/TrackPointExtension/v2'
+TRACKPOINT_EXTENSION_XSD = 'https://www8.garmin.com/xmlschemas/TrackPointExtensionv2.xsd'
+POWER_EXTENSION_NS = 'http://www.garmin.com/xmlschemas/PowerExtension/v1'
+POWER_EXTENSION_XSD = 'https://www8.garmin.com/xmlschemas/PowerExtensionv1.xsd'
+
+# 扩展字段按schema要求的顺序输出：(字段名, 元素名, 格式)
+TRACKPOINT_EXTENSION_FIELDS = (
+    ('temperature', 'gpxtpx:atemp', '%d'),
+    ('heart_rate', 'gpxtpx:hr', '%d'),
+    ('cadence', 'gpxtpx:cad', '%d'),
+    ('speed', 'gpxtpx:speed', '%s'),
+)
+POWER_EXTENSION_FIELDS = (
+    ('power', 'pwr:PowerInWatts', '%d'),
+)
+
+
+def gpx_header(extensions=()):
+    """GPX文档开头，只在输出对应扩展时声明其命名空间"""
+    namespaces = ''
+    schema_location = GPX_SCHEMA_LOCATION
+    if any(field[0] in extensions for field in TRACKPOINT_EXTENSION_FIELDS):
+        namespaces += f'xmlns:gpxtpx="{TRACKPOINT_EXTENSION_NS}" '
+        schema_location += f' {TRACKPOINT_EXTENSION_NS} {TRACKPOINT_EXTENSION_XSD}'
+    if any(field[0] in extensions for field in POWER_EXTENSION_FIELDS):
+        namespaces += f'xmlns:pwr="{POWER_EXTENSION_NS}" '
+        schema_location += f' {POWER_EXTENSION_NS} {POWER_EXTENSION_XSD}'
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx xmlns="http://www.topografix.com/GPX/1/1" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        f'{namespaces}'
+        f'xsi:schemaLocation="{schema_location}" '
+        'version="1.1" creator="gpx.py -- https://github.com/tkrajina/gpxpy">\n'
+        '  <trk>\n'
+        '    <trkseg>\n'
+    )
+
+
+TRKPT_END = '      </trkpt>\n'
+# 结束当前轨迹段并开始新的轨迹段
+SEGMENT_BREAK = '    </trkseg>\n    <trkseg>\n'
+EXTENSIONS_START = '        <extensions>\n'
+EXTENSIONS_END = '        </extensions>\n'
+# 每次生成并写入的点数：文本块较小时，每块的字符串和编码结果可以复用已释放的内存，
+# 不会每块都向系统重新申请（输出扩展数据时整块文本有数MB，缺页的开销与格式化相当）
+TEXT_BLOCK_POINTS = 256
+# 整数扩展字段取值跨度小于此值时按取值直接建表
+RANGE_TABLE_LIMIT = 4096
+GPX_FOOTER = (
+    '    </trkseg>\n'
+    '  </trk>\n'
+    '</gpx>'
+)
+
+
+def format_float(value):
+    """与gpxpy相同的浮点数格式：GPX 1.1 不允许科学计数法"""
+    result = str(value)
+    if 'e' not in result:
+        return result
+    return format(value, '.10f').rstrip('0').rstrip('.')
+
+
+def format_times(timestamps):
+    """批量将FIT原始时间戳格式化为gpxpy的时间字符串，无效时间戳为None"""
+    valid = timestamps >= 0
+    seconds = np.where(valid, timestamps, 0) + FIT_EPOCH_UNIX
+    texts = np.datetime_as_string(seconds.astype('datetime64[s]'), unit='s').tolist()
+    # 相对时间在原先的转换中是带时区的datetime，gpxpy输出为 ...Z
+    relative = (valid & (timestamps < FIT_SYSTEM_TIME_LIMIT)).tolist()
+    return [
+        None if not is_valid else (text + 'Z' if is_relative else text)
+        for text, is_valid, is_relative in zip(texts, valid.tolist(), relative)
+    ]
+
+
+def format_trkpts(latitudes, longitudes, elevations, times, endings=(TRKPT_END,)):
+    """生成一组 <trkpt> 元素的文本，elevations中NaN表示无海拔，times中None表示无时间
+
+    endings 为每个点 <time> 之后依次输出的文本列（扩展数据和 </trkpt>），每列为逐点文本的列表，
+    或所有点都相同的字符串。各列按固定间隔放入同一个列表后一次拼接，不逐点拼接扩展数据。
+    """
+    heads = []
+    append = heads.append
+    for lat, lon, ele, time in zip(latitudes, longitudes, elevations, times):
+        head = f'      <trkpt lat="{format_float(lat)}" lon="{format_float(lon)}">\n'
+        if ele == ele:
+            head = f'{head}        <ele>{format_float(ele)}</ele>\n'
+        if time is not None:
+            head = f'{head}        <time>{time}</time>\n'
+        append(head)
+    count = len(heads)
+    stride = len(endings) + 1
+    parts = [None] * (count * stride)
+    parts[::stride] = heads
+    for offset, column in enumerate(endings, 1):
+        parts[offset::stride] = [column] * count if isinstance(column, str) else column
+    return ''.join(parts)
+
+
+class _LineTable:
+    """一个扩展字段的取值表：每个不同取值的文本，以及各点在表中的下标
+
+    同一活动中心率、踏频、功率等取值重复很多，只格式化出现过的不同取值。
+    prefix 和 suffix 为取值前后的固定文本（元素标签，所有点都有值时还包括相邻的固定标签），
+    在 expand() 时与每个不同取值拼成一次。
+    """
+    __slots__ = ('texts', 'index', 'valid', 'complete', 'prefix', 'suffix')
+
+    def __init__(self, values, valid, fmt, prefix, suffix):
+        present = values[valid]
+        if fmt == '%d':
+            # 整数字段的取值范围通常很小，直接按取值建表，省去排序
+            integers = present.astype(np.int64)
+            low = int(integers.min())
+            high = int(integers.max())
+            if high - low < RANGE_TABLE_LIMIT:
+                texts = list(map(str, range(low, high + 1)))
+                index = integers - low
+            else:
+                unique, index = np.unique(integers, return_inverse=True)
+                texts = list(map(str, unique.tolist()))
+        else:
+            unique, index = np.unique(present, return_inverse=True)
+            texts = list(map(str, unique.tolist()))
+            # 极小或极大的值才会出现科学计数法，此时按 format_float 重新格式化
+            if any('e' in text for text in texts):
+                texts = [format_float(value) for value in unique.tolist()]
+        self.texts = texts
+        self.index = index.reshape(-1)
+        self.valid = valid
+        # 所有点都有值时，相邻的固定文本可以直接并入取值表
+        self.complete = bool(valid.all())
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def expand(self):
+        """按下标取回每个点的文本，无值的点为空字符串"""
+        prefix = self.prefix
+        suffix = self.suffix
+        lines = np.array([f'{prefix}{text}{suffix}' for text in self.texts], dtype=object)
+        texts = lines[self.index]
+        if not self.complete:
+            column = np.full(len(self.valid), '', dtype=object)
+            column[self.valid] = texts
+            texts = column
+        return texts.tolist()
+
+
+def _tag(tag, present):
+    """只在 present 为True的点输出的固定标签：全部输出时为字符串，否则为逐点文本"""
+    if present.all():
+        return tag
+    if not present.any():
+        return ''
+    return np.where(present, tag, '').tolist()
+
+
+def extension_groups(extensions):
+    """按选择的扩展字段确定输出结构：(字段列表, 开始标签, 结束标签)，没有选择任何字段的组不输出
+
+    字段列表中每项为 (字段名, 格式, 取值前的文本, 取值后的文本)，标签和缩进在创建写入器时一次拼好。
+    """
+    groups = (
+        (TRACKPOINT_EXTENSION_FIELDS, ' ' * 12,
+         '          <gpxtpx:TrackPointExtension>\n', '          </gpxtpx:TrackPointExtension>\n'),
+        (POWER_EXTENSION_FIELDS, ' ' * 10, '', ''),
+    )
+    result = []
+    for fields, indent, open_tag, close_tag in groups:
+        selected = [(name, fmt, f'{indent}<{element}>', f'</{element}>\n')
+                    for name, element, fmt in fields if name in extensions]
+        if selected:
+            result.append((selected, open_tag, close_tag))
+    return result
+
+
+def format_extensions(sensors, groups):
+    """生成每个点 <time> 之后的文本列（见 format_trkpts）：<extensions> 和 </trkpt>，所有扩展字段都无值的点只有 </trkpt>
+
+    groups 由 extension_groups() 在创建写入器时确定；本块中全部无值的字段直接跳过。
+    """
+    count = len(next(iter(sensors.values())))
+    pieces = []
+    any_present = np.zeros(count, dtype=bool)
+    for fields, open_tag, close_tag in groups:
+        tables = []
+        present = np.zeros(count, dtype=bool)
+        for name, fmt, prefix, suffix in fields:
+            values = sensors[name]
+            valid = ~np.isnan(values)
+            if valid.any():
+                tables.append(_LineTable(values, valid, fmt, prefix, suffix))
+                present |= valid
+        if tables:
+            pieces += [_tag(open_tag, present)] + tables + [_tag(close_tag, present)]
+            any_present |= present
+    pieces = [_tag(EXTENSIONS_START, any_present)] + pieces + [_tag(EXTENSIONS_END, any_present), TRKPT_END]
+
+    # 固定文本并入其后（末尾的并入其前）所有点都有值的取值表，减少每个点的文本片段数
+    columns = []
+    text = ''
+    for piece in pieces:
+        if isinstance(piece, str):
+            text += piece
+            continue
+        if isinstance(piece, _LineTable) and piece.complete:
+            piece.prefix = text + piece.prefix
+        elif text:
+            columns.append(text)
+        text = ''
+        columns.append(piece)
+    if text:
+        if columns and isinstance(columns[-1], _LineTable) and columns[-1].complete:
+            columns[-1].suffix += text
+        else:
+            columns.append(text)
+    return [column.expand() if isinstance(column, _LineTable) else column for column in columns]
+
+
+class GpxWriter:
+    """把RecordChunk中的有效轨迹点流式写入GPX文件
+
+    extensions 为需要输出的传感器字段名，在创建时确定输出哪些扩展元素。
+    在写入第一个有效点时才创建文件，没有有效点时不会留下空文件。
+    先写入同一文件夹中以点开头的临时文件，close() 时再替换为正式文件：转换中途失败或程序崩溃时
+    不会留下写了一半的GPX，已有的同名文件也保持不变。
+    close() 不逐个文件fsync，断电后的完整性由转换缓存（fit2gpx_manifest）批量fsync和记录的输出大小保证。
+    start_segment() 之后写入的点放入新的轨迹段（不会产生空的轨迹段）。
+    compression 为 gz 或 zst 时压缩输出，level 为压缩级别（由 fit2gpx_compress.resolve_compression 检查）。
+    metrics 用于分别记录整理数据（build）、生成文本（serialize）和写入文件（write）的耗时；压缩输出时
+    write 为把文本交给压缩线程的耗时，compress 为关闭时等待剩余部分压缩完成的耗时。
+    """
+    def __init__(self, gpx_file_path, extensions=(), metrics=None, compression=None, level=None):
+        self.gpx_file_path = gpx_file_path
+        self.compression = compression
+        self.level = level
+        self._temp_path = os.path.join(os.path.dirname(gpx_file_path), '.' + os.path.basename(gpx_file_path) + '.tmp')
+        self.extensions = tuple(extensions)
+        self._metrics = metrics or NULL_METRICS
+        self.points = 0
+        self.segments = 0
+        self._file = None
+        self._new_segment = False
+        self._extension_groups = extension_groups(self.extensions)
+
+    def write_chunk(self, chunk):
+        metrics = self._metrics
+        with metrics.timer('build'):
+            # 只有当有有效的经纬度时才写入点
+            mask = chunk.valid_position_mask()
+            count = int(np.count_nonzero(mask))
+            if count == 0:
+                return
+            endings = (TRKPT_END,)
+            if self._extension_groups:
+                sensors = {name: values[mask] for name, values in chunk.sensors.items()}
+                endings = format_extensions(sensors, self._extension_groups)
+            columns = (
+                chunk.latitude[mask].tolist(),
+                chunk.longitude[mask].tolist(),
+                chunk.altitude[mask].tolist(),
+                format_times(chunk.timestamp[mask]),
+            )
+        with metrics.timer('write'):
+            if self._file is None:
+                self._file = self._open()
+                self._file.write(gpx_header(self.extensions))
+                self.segments = 1
+            elif self._new_segment:
+                self._file.write(SEGMENT_BREAK)
+                self.segments += 1
+            self._new_segment = False
+        for start in range(0, count, TEXT_BLOCK_POINTS):
+            stop = start + TEXT_BLOCK_POINTS
+            with metrics.timer('serialize'):
+                text = format_trkpts(*[column[start:stop] for column in columns],
+                                     [ending if isinstance(ending, str) else ending[start:stop] for ending in endings])
+            with metrics.timer('write'):
+                self._file.write(text)
+        self.points += count
+
+    def _open(self):
+        if self.compression is None:
+            return open(self._temp_path, 'w', encoding='utf-8')
+        from fit2gpx_compress import CompressedWriter
+        return CompressedWriter(self._temp_path, self.compression, self.level)
+
+    def start_segment(self):
+        """之后写入的点放入新的轨迹段；还没有写入任何点时不起作用"""
+        if self._file is not None:
+            self._new_segment = True
+
+    def close(self):
+        """写入文档结尾并关闭文件"""
+        if self._file is not None:
+            with self._metrics.timer('write'):
+                self._file.write(GPX_FOOTER)
+            with self._metrics.timer('compress' if self.compression else 'write'):
+                self._file.close()
+            os.replace(self._temp_path, self.gpx_file_path)
+            self._file = None
+
+    def discard(self):
+        """转换失败时关闭并删除临时文件"""
+        if self._file is not None:
+            if self.compression is None:
+                self._file.close()
+            else:
+                self._file.discard()
+            self._file = None
+            try:
+                os.remove(self._temp_path)
+            except OSError:
+                pass
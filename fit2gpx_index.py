@@ -0,0 +1,383 @@
+"""已转换活动的空间与时间索引
+
+转换时在工作进程中随解码顺带计算每个活动的摘要（TrackSummary，不需要再读一遍文件）：经纬度范围、
+起止时间、轨迹点数、距离和抽稀后的轨迹（Google编码折线）。主进程把摘要写入SQLite索引
+（默认为输出文件夹中的 .fit2gpx_index.sqlite）：activities 表保存摘要，activity_space 和
+activity_time 两个R-tree虚表分别保存经纬度范围和起止时间，按区域、时间查询时由R-tree直接定位，十万个活动的
+查询也只需几毫秒。
+
+查询示例：
+    python fit2gpx_index.py 输出文件夹/.fit2gpx_index.sqlite --bbox 31.1 121.3 31.3 121.5 --start 2024-03-01 --end 2024-04-01
+"""
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+
+from fit2gpx_metrics import NULL_METRICS
+from fit2gpx_gpx import FIT_EPOCH_UNIX
+from fit2gpx_simplify import EARTH_RADIUS, project_to_meters, simplify_indices
+
+INDEX_FILE_NAME = '.fit2gpx_index.sqlite'
+# 摘要中抽稀轨迹的最多点数
+POLYLINE_POINTS = 100
+# 解码过程中最多缓存的采样点数，超过时采样间隔加倍
+SAMPLE_LIMIT = POLYLINE_POINTS * 8
+# 每累计多少条更新提交一次事务
+COMMIT_INTERVAL = 200
+
+
+def encode_polyline(latitudes, longitudes):
+    """Google编码折线（精度1e-5度），常见地图库都可以直接解码"""
+    values = np.round(np.column_stack((latitudes, longitudes)) * 1e5).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    parts = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            parts.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        parts.append(chr(value + 63))
+    return ''.join(parts)
+
+
+def decode_polyline(text):
+    """解码 encode_polyline 的结果，返回 (纬度数组, 经度数组)"""
+    values = []
+    value = shift = 0
+    for char in text:
+        byte = ord(char) - 63
+        value |= (byte & 0x1F) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    coordinates = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 1e5
+    return coordinates[:, 0], coordinates[:, 1]
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """两组经纬度之间的大圆距离（米）"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def polyline_intersects(latitudes, longitudes, bbox):
+    """折线是否经过范围 bbox=(最小纬度, 最小经度, 最大纬度, 最大经度)：有点在范围内，或有线段穿过范围"""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    inside = (latitudes >= min_lat) & (latitudes <= max_lat) & (longitudes >= min_lon) & (longitudes <= max_lon)
+    if inside.any():
+        return True
+    if len(latitudes) < 2:
+        return False
+    # Liang–Barsky 线段裁剪，所有线段一起计算
+    x0, y0 = longitudes[:-1], latitudes[:-1]
+    dx, dy = np.diff(longitudes), np.diff(latitudes)
+    t0 = np.zeros(len(dx))
+    t1 = np.ones(len(dx))
+    possible = np.ones(len(dx), dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for p, q in ((-dx, x0 - min_lon), (dx, max_lon - x0), (-dy, y0 - min_lat), (dy, max_lat - y0)):
+            possible &= ~((p == 0) & (q < 0))
+            ratio = q / p
+            t0 = np.where(p < 0, np.maximum(t0, ratio), t0)
+            t1 = np.where(p > 0, np.minimum(t1, ratio), t1)
+    return bool((possible & (t0 <= t1)).any())
+
+
+class TrackSummary:
+    """在解码过程中逐块累计一个活动的摘要，只统计经纬度有效的点
+
+    抽稀轨迹先按固定间隔采样（缓存超过 SAMPLE_LIMIT 个点时间隔加倍），结束时再用RDP保留最能体现
+    轨迹形状的 POLYLINE_POINTS 个点，内存占用与活动时长无关。
+    """
+    def __init__(self, metrics=None):
+        self.points = 0
+        self.distance = 0.0
+        self.start = None
+        self.end = None
+        self.bbox = None
+        self._metrics = metrics or NULL_METRICS
+        self._last = None
+        self._stride = 1
+        self._sample_lat = np.empty(0)
+        self._sample_lon = np.empty(0)
+
+    def tee(self, chunks):
+        """逐块统计并原样产出 chunks"""
+        for chunk in chunks:
+            with self._metrics.timer('summary'):
+                self.add(chunk)
+            yield chunk
+
+    def add(self, chunk):
+        mask = chunk.valid_position_mask()
+        count = int(np.count_nonzero(mask))
+        if count == 0:
+            return
+        latitudes = chunk.latitude[mask]
+        longitudes = chunk.longitude[mask]
+        bbox = (latitudes.min(), longitudes.min(), latitudes.max(), longitudes.max())
+        if self.bbox is not None:
+            bbox = (min(bbox[0], self.bbox[0]), min(bbox[1], self.bbox[1]),
+                    max(bbox[2], self.bbox[2]), max(bbox[3], self.bbox[3]))
+        self.bbox = tuple(float(value) for value in bbox)
+
+        timestamps = chunk.timestamp[mask]
+        timestamps = timestamps[timestamps >= 0]
+        if len(timestamps):
+            start, end = int(timestamps.min()), int(timestamps.max())
+            self.start = start if self.start is None else min(self.start, start)
+            self.end = end if self.end is None else max(self.end, end)
+
+        # 距离包括上一块最后一个点到本块第一个点
+        if self._last is not None:
+            path_lat = np.concatenate(([self._last[0]], latitudes))
+            path_lon = np.concatenate(([self._last[1]], longitudes))
+        else:
+            path_lat, path_lon = latitudes, longitudes
+        self.distance += float(haversine(path_lat[:-1], path_lon[:-1], path_lat[1:], path_lon[1:]).sum())
+        self._last = (latitudes[-1], longitudes[-1])
+
+        keep = (self.points + np.arange(count)) % self._stride == 0
+        self._sample_lat = np.concatenate((self._sample_lat, latitudes[keep]))
+        self._sample_lon = np.concatenate((self._sample_lon, longitudes[keep]))
+        self.points += count
+        while len(self._sample_lat) > SAMPLE_LIMIT:
+            self._sample_lat = self._sample_lat[::2]
+            self._sample_lon = self._sample_lon[::2]
+            self._stride *= 2
+
+    def polyline(self):
+        """抽稀后的轨迹（含终点）的编码折线"""
+        latitudes, longitudes = self._sample_lat, self._sample_lon
+        if self.points and (self.points - 1) % self._stride:
+            latitudes = np.append(latitudes, self._last[0])
+            longitudes = np.append(longitudes, self._last[1])
+        if len(latitudes) > POLYLINE_POINTS:
+            x, y = project_to_meters(latitudes, longitudes)
+            keep = simplify_indices(x, y, max_points=POLYLINE_POINTS)
+            latitudes, longitudes = latitudes[keep], longitudes[keep]
+        return encode_polyline(latitudes, longitudes)
+
+    def as_dict(self):
+        """可在进程间传递的摘要，时间为Unix秒数；没有有效点时为None"""
+        if self.points == 0:
+            return None
+        with self._metrics.timer('summary'):
+            polyline = self.polyline()
+        return {
+            'min_lat': self.bbox[0], 'min_lon': self.bbox[1], 'max_lat': self.bbox[2], 'max_lon': self.bbox[3],
+            'start': None if self.start is None else self.start + FIT_EPOCH_UNIX,
+            'end': None if self.end is None else self.end + FIT_EPOCH_UNIX,
+            'points': self.points,
+            'distance': self.distance,
+            'polyline': polyline,
+        }
+
+
+def to_unix_time(value):
+    """把 datetime（无时区时视为UTC）、ISO格式日期字符串或数字转换为Unix秒数"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"无法识别的时间: {value}") from None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def index_path_for(output_folder_path):
+    """输出文件夹中索引文件的路径"""
+    return os.path.join(output_folder_path, INDEX_FILE_NAME)
+
+
+class ActivityIndex:
+    """活动摘要的SQLite索引
+
+    R-tree中的坐标以32位浮点数保存（SQLite会把范围向外取整），只用于快速缩小候选范围，
+    查询结果再按 activities 表中的精确数值过滤。空间和时间分成两个R-tree：放在同一个R-tree中时，
+    节点按时间分组后空间范围很大，只按区域查询要多读几十倍的节点。
+    """
+    def __init__(self, path):
+        self.path = path
+        self._pending = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS activities ("
+            " id INTEGER PRIMARY KEY,"
+            " source TEXT UNIQUE NOT NULL,"
+            " output TEXT NOT NULL,"
+            " start_time INTEGER,"
+            " end_time INTEGER,"
+            " points INTEGER NOT NULL,"
+            " distance REAL NOT NULL,"
+            " min_lat REAL NOT NULL, min_lon REAL NOT NULL, max_lat REAL NOT NULL, max_lon REAL NOT NULL,"
+            " polyline TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS activity_space USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+        )
+        # 没有时间的活动不加入，不会被按时间的查询选中
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS activity_time USING rtree(id, start_time, end_time)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def contains(self, fit_file_path):
+        return self._conn.execute("SELECT 1 FROM activities WHERE source = ?",
+                                  (self._key(fit_file_path),)).fetchone() is not None
+
+    def missing(self, jobs):
+        """返回源文件还没有索引记录的任务（如启用索引前已转换、被增量转换缓存跳过的文件）"""
+        indexed = {row[0] for row in self._conn.execute("SELECT source FROM activities")}
+        return [job for job in jobs if self._key(job[0]) not in indexed]
+
+    def record(self, result):
+        """记录一个转换结果的摘要；失败的文件从索引中移除"""
+        summary = result.info.get('summary') if result.success else None
+        if summary is None:
+            self.remove(result.fit_file_path)
+        else:
+            self.add(result.fit_file_path, result.gpx_file_path, summary)
+
+    def add(self, fit_file_path, gpx_file_path, summary):
+        """添加或替换一个活动的摘要（TrackSummary.as_dict() 的结果）"""
+        self._delete(self._key(fit_file_path))
+        cursor = self._conn.execute(
+            "INSERT INTO activities (source, output, start_time, end_time, points, distance,"
+            " min_lat, min_lon, max_lat, max_lon, polyline) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self._key(fit_file_path), os.path.abspath(gpx_file_path), summary['start'], summary['end'],
+             summary['points'], summary['distance'], summary['min_lat'], summary['min_lon'], summary['max_lat'],
+             summary['max_lon'], summary['polyline']),
+        )
+        self._conn.execute(
+            "INSERT INTO activity_space VALUES (?, ?, ?, ?, ?)",
+            (cursor.lastrowid, summary['min_lat'], summary['max_lat'], summary['min_lon'], summary['max_lon']),
+        )
+        if summary['start'] is not None:
+            self._conn.execute("INSERT INTO activity_time VALUES (?, ?, ?)",
+                               (cursor.lastrowid, summary['start'], summary['end']))
+        self._changed()
+
+    def remove(self, fit_file_path):
+        self._delete(self._key(fit_file_path))
+        self._changed()
+
+    def _delete(self, key):
+        row = self._conn.execute("SELECT id FROM activities WHERE source = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM activity_space WHERE id = ?", (row[0],))
+            self._conn.execute("DELETE FROM activity_time WHERE id = ?", (row[0],))
+            self._conn.execute("DELETE FROM activities WHERE id = ?", (row[0],))
+
+    def query(self, bbox=None, start=None, end=None, through=False, limit=None):
+        """查询活动，返回按开始时间排序的字典列表
+
+        bbox=(最小纬度, 最小经度, 最大纬度, 最大经度) 选出范围与之相交的活动；start/end（datetime、ISO日期字符串
+        或Unix秒数）选出时间与之重叠的活动。through 为True时再用抽稀轨迹确认活动确实经过 bbox。
+        """
+        start, end = to_unix_time(start), to_unix_time(end)
+        # 有区域条件时由空间R-tree选出候选，否则由时间R-tree选出，其余条件按精确数值过滤
+        conditions = []
+        params = []
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            source = "activity_space r JOIN activities a ON a.id = r.id"
+            conditions += ["r.max_lat >= ?", "r.min_lat <= ?", "r.max_lon >= ?", "r.min_lon <= ?",
+                           "a.max_lat >= ?", "a.min_lat <= ?", "a.max_lon >= ?", "a.min_lon <= ?"]
+            params += [min_lat, max_lat, min_lon, max_lon] * 2
+        elif start is not None or end is not None:
+            source = "activity_time r JOIN activities a ON a.id = r.id"
+            if start is not None:
+                conditions.append("r.end_time >= ?")
+                params.append(start)
+            if end is not None:
+                conditions.append("r.start_time <= ?")
+                params.append(end)
+        else:
+            source = "activities a"
+        if start is not None:
+            conditions.append("a.end_time >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("a.start_time <= ?")
+            params.append(end)
+        sql = (f"SELECT a.* FROM {source}"
+               + (" WHERE " + " AND ".join(conditions) if conditions else "")
+               + " ORDER BY a.start_time")
+        results = []
+        for row in self._conn.execute(sql, params):
+            activity = dict(row)
+            if through and bbox is not None and not polyline_intersects(*decode_polyline(activity['polyline']), bbox):
+                continue
+            results.append(activity)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0]
+
+    def _changed(self):
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self._conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+
+def format_time(seconds):
+    if seconds is None:
+        return "无时间"
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按区域和时间查询活动索引")
+    parser.add_argument("index_path", help=f"索引文件（转换时加 --index 生成的 {INDEX_FILE_NAME}），或其所在的输出文件夹")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"),
+                        help="经纬度范围")
+    parser.add_argument("--through", action="store_true", help="只返回轨迹确实经过 --bbox 范围的活动")
+    parser.add_argument("--start", help="开始时间（UTC），如 2024-03-01 或 2024-03-01T08:00:00")
+    parser.add_argument("--end", help="结束时间（UTC）")
+    parser.add_argument("--limit", type=int, help="最多返回的活动数")
+    args = parser.parse_args(argv)
+
+    path = args.index_path
+    if os.path.isdir(path):
+        path = index_path_for(path)
+    if not os.path.exists(path):
+        parser.error(f"索引文件不存在: {path}")
+    index = ActivityIndex(path)
+    try:
+        activities = index.query(args.bbox, args.start, args.end, args.through, args.limit)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        index.close()
+    for activity in activities:
+        print(f"{format_time(activity['start_time'])}  {activity['distance'] / 1000:8.2f} km  "
+              f"{activity['points']:>7} 点  {activity['output']}")
+    print(f"共 {len(activities)} 个活动")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
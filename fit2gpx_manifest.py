@@ -0,0 +1,238 @@
+"""增量转换缓存与转换日志
+
+在输出文件夹中用SQLite记录每个已转换源文件的大小、修改时间、内容哈希和转换设置。
+再次转换时，大小和修改时间都未变化的文件只需一次stat即可跳过；修改时间变化但大小相同的文件
+才重新计算内容哈希确认，因此重复运行的耗时只与变化的文件数量有关。
+
+每个转换结果先追加到同一文件夹中的转换日志（.fit2gpx_journal.jsonl，每行一个结果，只写入不fsync），
+程序被关闭或崩溃后再次打开时把日志补记到数据库，已完成的文件不会重新转换。每累计 COMMIT_INTERVAL 个结果
+统一fsync这批输出文件、提交数据库，再清空日志，避免逐个文件fsync的开销。记录中保存输出文件的大小，
+断电导致输出文件不完整时大小对不上，下次会重新转换。
+
+转换失败的文件记录在 failures 表中，可以只重试这些文件（命令行 --retry-failed）。
+"""
+import os
+import json
+import time
+import sqlite3
+
+from fit2gpx_core import content_hash, read_fit_data, release_fit_data
+
+MANIFEST_FILE_NAME = '.fit2gpx_manifest.sqlite'
+JOURNAL_FILE_NAME = '.fit2gpx_journal.jsonl'
+
+# 每累计多少条更新fsync输出文件并提交一次事务
+COMMIT_INTERVAL = 200
+
+
+def sync_files(paths):
+    """把文件内容和所在目录项（重命名）写入磁盘；不存在的文件忽略"""
+    directories = set()
+    # Windows 上只有可写的句柄才能刷新到磁盘，目录也不能打开
+    flags = os.O_RDWR if os.name == 'nt' else os.O_RDONLY
+    for path in paths:
+        try:
+            fd = os.open(path, flags | getattr(os, 'O_BINARY', 0))
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        directories.add(os.path.dirname(os.path.abspath(path)))
+    if os.name == 'nt':
+        return
+    for directory in directories:
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+class ConversionManifest:
+    """输出文件夹中的增量转换记录"""
+    def __init__(self, output_folder_path, settings):
+        self.path = os.path.join(output_folder_path, MANIFEST_FILE_NAME)
+        self.journal_path = os.path.join(output_folder_path, JOURNAL_FILE_NAME)
+        self.settings = json.dumps(settings, sort_keys=True)
+        self._pending = 0
+        self._unsynced = []
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " source TEXT PRIMARY KEY,"
+            " output TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " settings TEXT NOT NULL,"
+            " status TEXT,"
+            " points INTEGER,"
+            " output_size INTEGER)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        if 'output_size' not in columns:
+            # 旧版本的记录没有输出文件大小，跳过时不检查
+            self._conn.execute("ALTER TABLE entries ADD COLUMN output_size INTEGER")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS failures ("
+            " source TEXT PRIMARY KEY,"
+            " fit_path TEXT NOT NULL,"
+            " gpx_path TEXT NOT NULL,"
+            " error TEXT NOT NULL,"
+            " failed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._replay_journal()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def partition(self, jobs):
+        """把任务分为 (需要转换的任务, 未变化可跳过的任务)"""
+        entries = {
+            row[0]: row[1:]
+            for row in self._conn.execute(
+                "SELECT source, output, size, mtime_ns, hash, settings, output_size FROM entries")
+        }
+        to_convert = []
+        unchanged = []
+        for job in jobs:
+            fit_file_path, gpx_file_path = job
+            entry = entries.get(self._key(fit_file_path))
+            if entry is None or not self._is_unchanged(fit_file_path, gpx_file_path, entry):
+                to_convert.append(job)
+            else:
+                unchanged.append(job)
+        self.commit()
+        return to_convert, unchanged
+
+    def is_unchanged(self, job):
+        """判断单个任务自上次转换以来是否未变化（逐个处理文件时使用）"""
+        fit_file_path, gpx_file_path = job
+        entry = self._conn.execute(
+            "SELECT output, size, mtime_ns, hash, settings, output_size FROM entries WHERE source = ?",
+            (self._key(fit_file_path),),
+        ).fetchone()
+        return entry is not None and self._is_unchanged(fit_file_path, gpx_file_path, entry)
+
+    def _is_unchanged(self, fit_file_path, gpx_file_path, entry):
+        output, size, mtime_ns, file_hash, settings, output_size = entry
+        if settings != self.settings or output != self._key(gpx_file_path):
+            return False
+        try:
+            output_stat = os.stat(gpx_file_path)
+            stat = os.stat(fit_file_path)
+        except OSError:
+            return False
+        if output_size is not None and output_stat.st_size != output_size:
+            return False
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime_ns == mtime_ns:
+            return True
+
+        # 修改时间变了但大小相同（如文件被重新同步），用内容哈希确认
+        with open(fit_file_path, 'rb') as f:
+            data = read_fit_data(f, stat.st_size)
+        try:
+            if content_hash(data) != file_hash:
+                return False
+        finally:
+            release_fit_data(data)
+        self._conn.execute("UPDATE entries SET mtime_ns = ? WHERE source = ?",
+                           (stat.st_mtime_ns, self._key(fit_file_path)))
+        self._changed()
+        return True
+
+    def record(self, result):
+        """记录一个转换结果；失败的文件从记录中移除（下次会重新转换）并加入失败列表"""
+        paths = {'fit_path': os.path.abspath(result.fit_file_path), 'gpx_path': os.path.abspath(result.gpx_file_path)}
+        if result.success:
+            info = result.info
+            entry = {
+                **paths,
+                'size': info['source_size'], 'mtime_ns': info['source_mtime_ns'], 'hash': info['source_hash'],
+                'settings': self.settings, 'status': info.get('status'), 'points': info.get('points'),
+                'output_size': info.get('output_size'),
+            }
+        else:
+            entry = {**paths, 'error': result.error_msg, 'failed_at': time.time()}
+        # 先写日志：之后程序崩溃也能在下次打开时补记
+        self._journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._journal.flush()
+        self._apply(entry)
+        if result.success:
+            self._unsynced.append(result.gpx_file_path)
+        self._changed()
+
+    def _apply(self, entry):
+        key = self._key(entry['fit_path'])
+        if 'error' not in entry:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (source, output, size, mtime_ns, hash, settings, status, points,"
+                " output_size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, self._key(entry['gpx_path']), entry['size'], entry['mtime_ns'], entry['hash'],
+                 entry['settings'], entry['status'], entry['points'], entry['output_size']),
+            )
+            self._conn.execute("DELETE FROM failures WHERE source = ?", (key,))
+        else:
+            self._conn.execute("DELETE FROM entries WHERE source = ?", (key,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO failures (source, fit_path, gpx_path, error, failed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, entry['fit_path'], entry['gpx_path'], entry['error'], entry['failed_at']),
+            )
+
+    def _replay_journal(self):
+        """补记上次未正常结束时日志中的结果"""
+        try:
+            with open(self.journal_path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        outputs = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 崩溃时最后一行可能只写了一半
+                continue
+            self._apply(entry)
+            if 'error' not in entry:
+                outputs.append(entry['gpx_path'])
+        sync_files(outputs)
+        self._conn.commit()
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+
+    def failures(self):
+        """返回记录中转换失败的文件 [(FIT路径, GPX路径, 错误信息)]，按失败时间排序"""
+        return [tuple(row) for row in self._conn.execute(
+            "SELECT fit_path, gpx_path, error FROM failures ORDER BY failed_at")]
+
+    def _changed(self):
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        """fsync这批输出文件后提交，再清空日志（日志中的结果都已在数据库中）"""
+        sync_files(self._unsynced)
+        self._unsynced = []
+        self._conn.commit()
+        self._journal.seek(0)
+        self._journal.truncate()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self._journal.close()
+        self._conn.close()
@@ -0,0 +1,337 @@
+"""把同一设备在一段时间内拆成多个FIT文件的活动合并为一个GPX文件
+
+有的设备会把一次长时间的活动拆成多个FIT文件。合并分两步：
+1. 逐个扫描文件，取得设备（file_id中的厂商、产品、序列号）、第一个和最后一个轨迹点的时间，以及session/lap
+   的开始时间；同一设备、前后相距不超过 window 秒且时间不重叠的文件分为一组。
+2. 每组的文件各打开一个解码器，按时间戳做k路归并，边解码边写入同一个GPX文件；在session或lap开始处、
+   以及相邻两点相隔超过 gap 秒处开始新的轨迹段。合并多个文件时丢弃没有时间戳的记录。
+
+归并时每个文件只保留当前解码出的一块记录，内存占用取决于同时打开的文件数，与轨迹总长度无关。
+"""
+import os
+import heapq
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fit2gpx_core import (STATUS_OK, STATUS_TRUNCATED, FIT_HEADER_SIZES, check_fit_header, read_fit_data,
+                          release_fit_data, decode_fit_records, gpx_path_for, ignore_interrupt, ConversionOptions,
+                          ConversionResult)
+
+# 同一设备的两个文件相隔不超过多少秒时合并（前一个文件的最后一个点到后一个文件的第一个点）
+DEFAULT_MERGE_WINDOW = 3600.0
+# 相邻两点相隔超过多少秒时开始新的轨迹段
+DEFAULT_SPLIT_GAP = 300.0
+# 按哪种消息的开始时间分段：lap 每圈一段（新的session总是从新的一圈开始），session 每个运动项目一段，none 不按消息分段
+SPLIT_MODES = ('lap', 'session', 'none')
+DEFAULT_SPLIT = 'session'
+
+
+class FitSummary:
+    """单个FIT文件的扫描结果，可在进程间传递
+
+    start/end 为第一个和最后一个有效轨迹点的FIT时间戳，没有带时间的轨迹点时为None。
+    fallback 为True表示快速解码器无法处理该文件，合并时直接使用fitparse解码。
+    """
+    def __init__(self, fit_file_path, device=None, start=None, end=None, points=0, session_starts=(),
+                 lap_starts=(), fallback=False, error_msg=""):
+        self.fit_file_path = fit_file_path
+        self.device = device
+        self.start = start
+        self.end = end
+        self.points = points
+        self.session_starts = list(session_starts)
+        self.lap_starts = list(lap_starts)
+        self.fallback = fallback
+        self.error_msg = error_msg
+
+    @property
+    def success(self):
+        return not self.error_msg
+
+    def boundaries(self, split):
+        """按 split 方式分段时，新轨迹段开始的时间戳"""
+        if split == 'lap':
+            return self.lap_starts + self.session_starts
+        if split == 'session':
+            return self.session_starts
+        return []
+
+
+def _scan_points(decoder):
+    """统计有效轨迹点的数量和时间范围，不保留解码出的记录"""
+    start = end = None
+    points = 0
+    for chunk in decoder:
+        mask = chunk.valid_position_mask()
+        points += int(np.count_nonzero(mask))
+        timestamps = chunk.timestamp[mask]
+        timestamps = timestamps[timestamps >= 0]
+        if len(timestamps):
+            low, high = int(timestamps.min()), int(timestamps.max())
+            start = low if start is None else min(start, low)
+            end = high if end is None else max(end, high)
+    return start, end, points
+
+
+def scan_fit_file(fit_file_path):
+    """扫描FIT文件，返回 FitSummary；文件无法读取或没有有效轨迹点时 error_msg 不为空"""
+    from fit2gpx_decoder import FitparseRecordDecoder
+
+    try:
+        with open(fit_file_path, 'rb') as f:
+            data = read_fit_data(f, os.fstat(f.fileno()).st_size)
+    except Exception as e:
+        return FitSummary(fit_file_path, error_msg=f"文件验证失败: 文件访问错误: {str(e)}")
+    try:
+        is_valid, validation_msg, _ = check_fit_header(data[:max(FIT_HEADER_SIZES)], len(data))
+        if not is_valid:
+            return FitSummary(fit_file_path, error_msg=f"文件验证失败: {validation_msg}")
+        try:
+            (start, end, points), decoder = decode_fit_records(data, _scan_points, markers=True)
+            decode_error = None
+        except Exception as e:
+            decode_error = str(e)
+    finally:
+        release_fit_data(data)
+    if decode_error is not None:
+        return FitSummary(fit_file_path, error_msg=f"解析FIT文件记录时出错: {decode_error}")
+    if points == 0:
+        return FitSummary(fit_file_path, error_msg="未找到有效的轨迹点，无法生成GPX文件")
+    return FitSummary(fit_file_path, decoder.device, start, end, points, decoder.session_starts,
+                      decoder.lap_starts, isinstance(decoder, FitparseRecordDecoder))
+
+
+def group_summaries(summaries, window=DEFAULT_MERGE_WINDOW):
+    """把扫描成功的文件按设备和时间分组，返回分组列表，每组按开始时间排序，各组按第一个文件的开始时间排序
+
+    同一设备的文件按开始时间排列，依次接在某一组的最后一个文件之后：开始时间不早于该文件的结束时间
+    （最多共用一个时间点），且相隔不超过 window 秒；可接在多组之后时选结束最晚的一组。
+    与已有各组都重叠的文件（如同一活动的重复记录）另成一组，不会与其他文件交错归并成一条轨迹。
+    没有带时间的轨迹点的文件无法确定位置，各自单独成组。
+    """
+    by_device = {}
+    groups = []
+    for summary in summaries:
+        if summary.start is None:
+            groups.append([summary])
+        else:
+            by_device.setdefault(summary.device, []).append(summary)
+    for items in by_device.values():
+        items.sort(key=lambda summary: (summary.start, summary.fit_file_path))
+        device_groups = []
+        for summary in items:
+            candidates = [group for group in device_groups if 0 <= summary.start - group[-1].end <= window]
+            if candidates:
+                max(candidates, key=lambda group: group[-1].end).append(summary)
+            else:
+                device_groups.append([summary])
+        groups.extend(device_groups)
+    groups.sort(key=lambda group: (group[0].start is None, group[0].start or 0, group[0].fit_file_path))
+    return groups
+
+
+def merged_gpx_path(group, output_folder_path, suffix='.gpx'):
+    """分组的输出路径：单个文件与普通转换同名，多个文件以第一个文件命名并加 _merged 后缀"""
+    if len(group) == 1:
+        return gpx_path_for(group[0].fit_file_path, output_folder_path, suffix)
+    stem = os.path.splitext(os.path.basename(group[0].fit_file_path))[0]
+    return os.path.join(output_folder_path, stem + '_merged' + suffix)
+
+
+def merge_chunks(streams):
+    """按时间戳对多个 RecordChunk 流做k路归并，按时间顺序产出 RecordChunk 片段
+
+    堆中每个流只占一项（当前块中下一条记录的时间戳）。每次从时间最早的流中取出不晚于其他流下一条记录的
+    连续一段，整段用NumPy切片，不逐点比较；时间相同时先取排在前面的流。各流内部保持原有顺序。
+    没有时间戳的记录无法确定在合并后轨迹中的位置，直接丢弃。
+    """
+    iterators = [_timed_records(stream) for stream in streams]
+
+    def head(index):
+        """流中下一块非空记录对应的堆项，流已结束时为None"""
+        for chunk in iterators[index]:
+            if len(chunk):
+                return (int(chunk.timestamp[0]), index, chunk, 0)
+        return None
+
+    heap = [entry for entry in map(head, range(len(iterators))) if entry is not None]
+    heapq.heapify(heap)
+    while heap:
+        _, index, chunk, pos = heapq.heappop(heap)
+        timestamps = chunk.timestamp[pos:]
+        end = len(chunk)
+        if heap:
+            limit, next_index = heap[0][0], heap[0][1]
+            later = timestamps > limit if index < next_index else timestamps >= limit
+            if later.any():
+                end = pos + int(np.argmax(later))
+        yield chunk.select(slice(pos, end))
+        entry = (int(chunk.timestamp[end]), index, chunk, end) if end < len(chunk) else head(index)
+        if entry is not None:
+            heapq.heappush(heap, entry)
+
+
+def _timed_records(stream):
+    for chunk in stream:
+        timed = chunk.timestamp >= 0
+        if timed.all():
+            yield chunk
+        elif timed.any():
+            yield chunk.select(timed)
+
+
+def segment_starts(timestamps, previous, boundaries, gap):
+    """返回 timestamps 中应开始新轨迹段的点的下标
+
+    previous 为上一个已写入点的时间戳（还没有写入点时为None）。与前一个点之间跨过 boundaries 中的某个时间、
+    或相隔超过 gap 秒（gap 为None时不按间隔分段）时开始新的轨迹段；时间戳无效的点不分段。
+    """
+    if previous is None:
+        previous = -1
+    before = np.concatenate(([previous], timestamps[:-1]))
+    valid = (before >= 0) & (timestamps >= 0)
+    starts = np.zeros(len(timestamps), dtype=bool)
+    if gap is not None:
+        starts |= timestamps - before > gap
+    if len(boundaries):
+        starts |= np.searchsorted(boundaries, timestamps, 'right') > np.searchsorted(boundaries, before, 'right')
+    return np.nonzero(starts & valid)[0]
+
+
+def _valid_points(decoder):
+    for chunk in decoder:
+        mask = chunk.valid_position_mask()
+        if mask.all():
+            yield chunk
+        elif mask.any():
+            yield chunk.select(mask)
+
+
+def merge_group(group, gpx_file_path, options=None, split=DEFAULT_SPLIT, gap=DEFAULT_SPLIT_GAP):
+    """把一组文件按时间归并写入 gpx_file_path，返回转换信息字典
+
+    字典包含 status、points、input_points、records、segments（轨迹段数）和 sources（合并的源文件路径）。
+    """
+    from fit2gpx_decoder import RecordDecoder, FitparseRecordDecoder
+    from fit2gpx_gpx import GpxWriter
+
+    options = options or ConversionOptions()
+    boundaries = np.array(sorted({time for summary in group for time in summary.boundaries(split)}),
+                          dtype=np.int64)
+    datas = []
+    decoders = []
+    writer = GpxWriter(gpx_file_path, options.extensions, compression=options.compression,
+                       level=options.compression_level)
+    error = None
+    truncated = False
+    records = 0
+    try:
+        for summary in group:
+            with open(summary.fit_file_path, 'rb') as f:
+                datas.append(read_fit_data(f, os.fstat(f.fileno()).st_size))
+            decoder_class = FitparseRecordDecoder if summary.fallback else RecordDecoder
+            decoders.append(decoder_class(datas[-1], options.extensions))
+        previous = None
+        streams = [_valid_points(decoder) for decoder in decoders]
+        # 单个文件不需要归并，没有时间戳的点与普通转换一样保留
+        for chunk in merge_chunks(streams) if len(streams) > 1 else streams[0]:
+            timestamps = chunk.timestamp
+            start = 0
+            for index in segment_starts(timestamps, previous, boundaries, gap).tolist():
+                writer.write_chunk(chunk.select(slice(start, index)))
+                writer.start_segment()
+                start = index
+            writer.write_chunk(chunk.select(slice(start, None)) if start else chunk)
+            valid = timestamps[timestamps >= 0]
+            if len(valid):
+                previous = int(valid[-1])
+        writer.close()
+        truncated = any(decoder.truncated for decoder in decoders)
+        records = sum(decoder.record_count for decoder in decoders)
+    except Exception as e:
+        writer.discard()
+        error = str(e)
+    finally:
+        # 先释放解码器对数据的引用，内存映射才能关闭
+        decoders = None
+        for data in datas:
+            release_fit_data(data)
+    if error is not None:
+        # 在except块之外抛出，不保留原异常的回溯（其中的解码器引用着内存映射）
+        raise Exception(f"合并FIT文件时出错: {error}")
+    if writer.points == 0:
+        raise Exception("未找到有效的轨迹点，无法生成GPX文件")
+    return {
+        'status': STATUS_TRUNCATED if truncated else STATUS_OK,
+        'points': writer.points,
+        'input_points': writer.points,
+        'records': records,
+        'segments': writer.segments,
+        'sources': [summary.fit_file_path for summary in group],
+    }
+
+
+def merge_job(job, options=None, split=DEFAULT_SPLIT, gap=DEFAULT_SPLIT_GAP):
+    """合并 (分组, 输出路径) 任务，捕获异常并返回 ConversionResult（以组内第一个文件作为源文件）"""
+    group, gpx_file_path = job
+    fit_file_path = group[0].fit_file_path
+    try:
+        info = merge_group(group, gpx_file_path, options, split, gap)
+        return ConversionResult(fit_file_path, gpx_file_path, True, info=info)
+    except Exception as e:
+        return ConversionResult(fit_file_path, gpx_file_path, False, str(e))
+
+
+class MergeConverter:
+    """多文件合并引擎：先扫描全部文件并分组，再把每组合并为一个GPX文件
+
+    扫描和合并都在进程池中进行，每个进程同一时间只处理一组文件。
+    """
+    def __init__(self, workers=None, window=DEFAULT_MERGE_WINDOW, split=DEFAULT_SPLIT, gap=DEFAULT_SPLIT_GAP,
+                 options=None):
+        if window < 0:
+            raise ValueError(f"合并时间窗口不能小于0: {window}")
+        if split not in SPLIT_MODES:
+            raise ValueError(f"未知的分段方式: {split}")
+        if gap is not None and gap <= 0:
+            raise ValueError(f"分段时间间隔必须大于0: {gap}")
+        if options is not None and options.simplifies:
+            raise ValueError("合并模式不支持轨迹简化")
+        if options is not None and options.export_dir is not None:
+            raise ValueError("合并模式不支持按列导出")
+        if options is not None and options.summary:
+            raise ValueError("合并模式不支持活动索引")
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.window = window
+        self.split = split
+        self.gap = gap
+        self.options = options
+
+    def _map(self, function, items):
+        """按顺序产出 function(item) 的结果，任务多于一个时使用进程池"""
+        if self.workers == 1 or len(items) <= 1:
+            yield from map(function, items)
+            return
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(items)), initializer=ignore_interrupt) as executor:
+            yield from executor.map(function, items)
+
+    def scan(self, fit_file_paths):
+        """扫描文件，返回 (分组列表, 扫描失败的 FitSummary 列表)"""
+        summaries = list(self._map(scan_fit_file, list(fit_file_paths)))
+        failed = [summary for summary in summaries if not summary.success]
+        groups = group_summaries([summary for summary in summaries if summary.success], self.window)
+        return groups, failed
+
+    def run(self, groups, output_folder_path, on_result=None):
+        """合并每组文件，每完成一组调用一次 on_result(已完成数, 总数, 结果)，返回结果列表"""
+        suffix = (self.options or ConversionOptions()).gpx_suffix
+        jobs = [(group, merged_gpx_path(group, output_folder_path, suffix)) for group in groups]
+        merge = partial(merge_job, options=self.options, split=self.split, gap=self.gap)
+        results = []
+        for result in self._map(merge, jobs):
+            results.append(result)
+            if on_result is not None:
+                on_result(len(results), len(jobs), result)
+        return results
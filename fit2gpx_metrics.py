@@ -0,0 +1,209 @@
+"""转换过程的计时与计数
+
+每个文件在转换进程中用 StageMetrics 记录各阶段耗时（validate 读取并校验文件头、hash 内容哈希、
+decode 解码记录、export 按列导出、summary 计算活动摘要、simplify 轨迹简化、build 整理坐标和时间列、serialize 生成GPX文本、write 写入文件、
+compress 压缩输出时等待剩余部分压缩完成）
+和计数（读取的记录数、写入的点数、因经纬度为0或缺失而丢弃的点数、读写字节数、退回fitparse重新解码的次数等），
+随转换结果一起传回主进程，由 MetricsCollector 汇总并导出为JSON Lines或Prometheus文本文件。
+
+未启用时转换流程使用 NULL_METRICS，所有调用都是空操作，几乎没有额外开销。
+"""
+import os
+import json
+import time
+from datetime import datetime
+
+# 阶段的输出顺序
+STAGES = ('validate', 'hash', 'decode', 'export', 'summary', 'simplify', 'build', 'serialize', 'write', 'compress')
+
+# Prometheus指标的说明文字
+COUNTER_HELP = {
+    'records_read': 'FIT record messages read',
+    'points_written': 'Track points written to GPX files',
+    'points_dropped': 'Records dropped for missing or zero coordinates',
+    'points_simplified': 'Points removed by track simplification',
+    'bytes_read': 'Bytes of FIT input read',
+    'bytes_written': 'Bytes of GPX output written',
+    'decode_retries': 'Files re-decoded with fitparse after the fast decoder gave up',
+    'files_skipped': 'Files skipped because the output is up to date',
+    'rows_exported': 'Records written to columnar export files',
+}
+
+# 汇总日志中各阶段的中文名称
+STAGE_NAMES = {
+    'validate': '校验', 'hash': '哈希', 'decode': '解码', 'export': '导出', 'summary': '摘要', 'simplify': '简化',
+    'build': '整理', 'serialize': '生成文本', 'write': '写入', 'compress': '压缩',
+}
+
+
+class _Timer:
+    __slots__ = ('timers', 'stage', 'start')
+
+    def __init__(self, timers, stage):
+        self.timers = timers
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        self.timers[self.stage] = self.timers.get(self.stage, 0.0) + elapsed
+        return False
+
+
+class StageMetrics:
+    """单个文件的阶段耗时（秒）和计数，可在进程间传递"""
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+
+    def timer(self, stage):
+        """用于 with 语句，把代码块的耗时累加到 stage"""
+        return _Timer(self.timers, stage)
+
+    def timed(self, stage, iterable):
+        """逐个产出 iterable 的元素，把取出每个元素的耗时累加到 stage"""
+        timers = self.timers
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                # 解码出错时也记录已花费的时间
+                timers[stage] = timers.get(stage, 0.0) + time.perf_counter() - start
+            yield item
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        return {'timers': dict(self.timers), 'counters': dict(self.counters)}
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _NullMetrics:
+    """未启用计时时使用：所有方法都是空操作"""
+    __slots__ = ()
+    _timer = _NullTimer()
+
+    def timer(self, stage):
+        return self._timer
+
+    def timed(self, stage, iterable):
+        return iterable
+
+    def count(self, name, value=1):
+        pass
+
+    def as_dict(self):
+        return None
+
+
+NULL_METRICS = _NullMetrics()
+
+
+class MetricsCollector:
+    """在主进程中汇总各文件的转换指标
+
+    jsonl_path 不为None时，每个文件的指标追加为一行JSON；prometheus_path 不为None时，
+    flush() 把汇总结果写成Prometheus文本格式（可供node_exporter的textfile收集器读取）。
+    """
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.files = {}
+        self.timers = {}
+        self.counters = {}
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+
+    def add(self, result):
+        """记录一个 ConversionResult 的指标"""
+        status = result.status if result.success else 'failed'
+        self.files[status] = self.files.get(status, 0) + 1
+        metrics = result.metrics or {'timers': {}, 'counters': {}}
+        for stage, seconds in metrics['timers'].items():
+            self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+        for name, value in metrics['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self._jsonl is not None:
+            line = {
+                'time': datetime.now().isoformat(timespec='milliseconds'),
+                'file': result.fit_file_path,
+                'output': result.gpx_file_path,
+                'status': status,
+                'error': result.error_msg or None,
+                'timers': {stage: round(seconds, 6) for stage, seconds in metrics['timers'].items()},
+                'counters': metrics['counters'],
+            }
+            self._jsonl.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+    def count(self, name, value=1):
+        """记录不属于单个文件转换的计数，如跳过的文件"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """各阶段耗时和主要计数的一行中文摘要"""
+        stages = [stage for stage in STAGES if stage in self.timers]
+        parts = [f"{STAGE_NAMES[stage]} {self.timers[stage]:.3f}秒" for stage in stages]
+        text = "阶段耗时（各进程合计）：" + ("，".join(parts) if parts else "无")
+        counters = self.counters
+        text += (f"；读取 {counters.get('records_read', 0)} 条记录，写入 {counters.get('points_written', 0)} 个点，"
+                 f"丢弃无效坐标 {counters.get('points_dropped', 0)} 个点")
+        if counters.get('points_simplified'):
+            text += f"，简化去掉 {counters['points_simplified']} 个点"
+        if counters.get('rows_exported'):
+            text += f"，按列导出 {counters['rows_exported']} 条记录"
+        if counters.get('decode_retries'):
+            text += f"，{counters['decode_retries']} 个文件改用fitparse解码"
+        return text
+
+    def prometheus_text(self):
+        lines = [
+            '# HELP fit2gpx_files_total Files converted, by result',
+            '# TYPE fit2gpx_files_total counter',
+        ]
+        for status, value in sorted(self.files.items()):
+            lines.append(f'fit2gpx_files_total{{status="{status}"}} {value}')
+        lines += [
+            '# HELP fit2gpx_stage_seconds_total Time spent in each conversion stage, summed over workers',
+            '# TYPE fit2gpx_stage_seconds_total counter',
+        ]
+        for stage in STAGES:
+            if stage in self.timers:
+                lines.append(f'fit2gpx_stage_seconds_total{{stage="{stage}"}} {self.timers[stage]:.6f}')
+        for name, value in sorted(self.counters.items()):
+            metric = f'fit2gpx_{name}_total'
+            lines.append(f'# HELP {metric} {COUNTER_HELP.get(name, name)}')
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        """刷新JSON Lines文件，并重写Prometheus文本文件（先写临时文件再替换，读取方不会看到写了一半的内容）"""
+        if self._jsonl is not None:
+            self._jsonl.flush()
+        if self.prometheus_path:
+            temp_path = self.prometheus_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus_text())
+            os.replace(temp_path, self.prometheus_path)
+
+    def close(self):
+        self.flush()
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
@@ -0,0 +1,332 @@
+"""异步转换服务：在asyncio事件循环中驱动转换核心
+
+AsyncConverter 把 convert_job 放到进程池中执行，事件循环只负责调度：
+- 同时交给进程池的任务数不超过 max_in_flight，其余调用在信号量上等待；
+- 等待中的调用超过 max_waiting 时 convert() 立即抛出 ServiceBusy，由调用方稍后重试（背压）；
+- 取消等待中或尚未开始的任务会直接撤销；已在工作进程中运行的任务无法中断，调用方立即收到取消，
+  任务在后台完成后才释放名额，因此同时运行的任务数始终不超过上限。
+
+直接运行时启动一个只依赖标准库的HTTP服务，作为上传接口的本地替身：
+    python fit2gpx_service.py --port 8080 -j 4
+    curl --data-binary @活动.fit http://127.0.0.1:8080/convert -o 活动.gpx
+
+POST /convert 的请求体为FIT文件内容，成功时返回GPX（200），转换失败返回422，排队已满返回503（带 Retry-After），
+请求体过大返回413；GET /health 返回当前运行和等待的任务数。客户端在转换完成前断开连接时取消对应任务。
+每个连接只处理一个请求（响应带 Connection: close），同一连接上紧接着发送的后续请求（流水线）不会被处理。
+"""
+import os
+import sys
+import json
+import shutil
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from fit2gpx_core import EXTENSION_FIELDS, convert_job, gpx_path_for, ignore_interrupt, ConversionOptions
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+# 上传的FIT文件大小上限（字节）
+DEFAULT_MAX_BODY = 64 * 1024 * 1024
+# HTTP请求行和请求头的长度上限（字节）
+MAX_HEADER_SIZE = 16 * 1024
+
+
+class ServiceBusy(Exception):
+    """等待中的任务已达上限，调用方应稍后重试"""
+
+
+class AsyncConverter:
+    """在事件循环中使用的转换引擎
+
+    workers 为进程数；max_in_flight 为同时交给进程池的任务数（默认等于进程数）；max_waiting 为 convert() 等待名额的
+    调用数上限，超过时抛出 ServiceBusy，为None时不限。executor 可传入由调用方管理的执行器（如ThreadPoolExecutor），
+    为None时在第一次转换时创建进程池，close() 时关闭。
+    """
+    def __init__(self, workers=None, max_in_flight=None, max_waiting=None, options=None, metrics=False,
+                 executor=None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_in_flight = max(1, max_in_flight or self.workers)
+        if max_waiting is not None and max_waiting < 0:
+            raise ValueError(f"等待任务数上限不能小于0: {max_waiting}")
+        self.max_waiting = max_waiting
+        self.options = options
+        self.metrics = metrics
+        self.in_flight = 0
+        self.waiting = 0
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def convert(self, fit_file_path, gpx_file_path=None):
+        """转换一个文件，返回 ConversionResult；gpx_file_path 为None时输出到FIT文件所在文件夹"""
+        if gpx_file_path is None:
+            suffix = (self.options or ConversionOptions()).gpx_suffix
+            gpx_file_path = gpx_path_for(fit_file_path, os.path.dirname(fit_file_path), suffix)
+        if self.busy():
+            raise ServiceBusy(f"正在转换 {self.in_flight} 个文件，另有 {self.waiting} 个在等待")
+        return await self._convert((fit_file_path, gpx_file_path))
+
+    def busy(self):
+        """所有名额都在使用且等待的调用已达上限，此时 convert() 会抛出 ServiceBusy"""
+        return (self.max_waiting is not None and self.in_flight >= self.max_in_flight
+                and self.waiting >= self.max_waiting)
+
+    async def convert_many(self, jobs, ordered=False):
+        """转换一批 (FIT路径, GPX路径) 任务，按完成顺序（ordered=True时按提交顺序）异步产出 ConversionResult
+
+        最多 max_in_flight 个任务同时提交；调用方取走一个结果后才提交下一个任务，处理结果较慢时不会堆积
+        （不受 max_waiting 限制）。提前退出循环或被取消时，取消尚未完成的任务。
+        """
+        pending = deque() if ordered else set()
+        try:
+            for job in jobs:
+                task = asyncio.ensure_future(self._convert(job))
+                if ordered:
+                    pending.append(task)
+                    if len(pending) >= self.max_in_flight:
+                        yield await pending.popleft()
+                else:
+                    pending.add(task)
+                    if len(pending) >= self.max_in_flight:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            yield task.result()
+            if ordered:
+                while pending:
+                    yield await pending.popleft()
+            else:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def close(self):
+        """等待后台仍在运行的任务完成并关闭自己创建的进程池"""
+        if self._owns_executor and self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    async def _convert(self, job):
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            # 在事件循环中第一次使用时创建，信号量绑定到当前事件循环
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            if self._executor is None:
+                # 以spawn方式启动工作进程：fork出的进程会继承服务中已打开的连接，关闭连接后客户端仍收不到EOF
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=ignore_interrupt)
+            future = self._executor.submit(convert_job, job, self.options, self.metrics)
+        except BaseException:
+            self._release()
+            raise
+
+        def job_finished(_):
+            # 在进程池的管理线程中调用；任务真正结束（或被撤销）后才释放名额
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+        future.add_done_callback(job_finished)
+        # 调用方取消时 wrap_future 会撤销尚未开始的任务
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+
+class ConversionServer:
+    """上传接口的本地替身：接收FIT文件内容，返回转换后的GPX"""
+    def __init__(self, converter, work_dir, max_body=DEFAULT_MAX_BODY):
+        self.converter = converter
+        self.work_dir = work_dir
+        self.max_body = max_body
+        self._next_id = 0
+
+    async def handle(self, reader, writer):
+        try:
+            status, headers, body = await self._respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            status, headers, body = None, None, None
+        except Exception as e:
+            status, headers, body = json_response("500 Internal Server Error", {'error': str(e)})
+        try:
+            if status is not None:
+                head = [f"HTTP/1.1 {status}", f"Content-Length: {len(body)}", "Connection: close"]
+                head += [f"{name}: {value}" for name, value in headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _respond(self, reader):
+        """读取一个请求并处理，返回 (状态行, 响应头, 响应体)"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            return json_response("431 Request Header Fields Too Large", {'error': "请求头过长"})
+        lines = head.decode('latin-1').split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            return json_response("400 Bad Request", {'error': "无效的请求行"})
+        request_headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                request_headers[name.strip().lower()] = value.strip()
+        path = target.split("?", 1)[0]
+
+        if path == "/health":
+            if method != "GET":
+                return json_response("405 Method Not Allowed", {'error': "只支持GET"})
+            return json_response("200 OK", {'in_flight': self.converter.in_flight,
+                                            'waiting': self.converter.waiting})
+        if path != "/convert":
+            return json_response("404 Not Found", {'error': f"未知路径: {path}"})
+        if method != "POST":
+            return json_response("405 Method Not Allowed", {'error': "只支持POST"})
+        try:
+            length = int(request_headers['content-length'])
+        except (KeyError, ValueError):
+            return json_response("411 Length Required", {'error': "缺少 Content-Length"})
+        if length > self.max_body:
+            return json_response("413 Content Too Large", {'error': f"文件超过 {self.max_body} 字节"})
+        data = await reader.readexactly(length)
+        # 排队已满时不必先把上传的文件写入磁盘
+        if self.converter.busy():
+            return busy_response(self.converter)
+        return await self._convert_upload(reader, data)
+
+    async def _convert_upload(self, reader, data):
+        self._next_id += 1
+        job_dir = os.path.join(self.work_dir, str(self._next_id))
+        fit_path = os.path.join(job_dir, "upload.fit")
+        gpx_path = os.path.join(job_dir, "upload.gpx")
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, write_upload, fit_path, data)
+        try:
+            conversion = asyncio.ensure_future(self.converter.convert(fit_path, gpx_path))
+            disconnected = asyncio.ensure_future(client_disconnected(reader))
+            await asyncio.wait((conversion, disconnected), return_when=asyncio.FIRST_COMPLETED)
+            if not conversion.done() and disconnected.result():
+                conversion.cancel()
+                await asyncio.gather(conversion, return_exceptions=True)
+                return None, None, None
+            disconnected.cancel()
+            try:
+                # 客户端发来后续数据时仍在连接中，等待转换完成
+                result = await conversion
+            except ServiceBusy:
+                return busy_response(self.converter)
+            if not result.success:
+                return json_response("422 Unprocessable Content", {'error': result.error_msg})
+            body = await loop.run_in_executor(None, read_output, gpx_path)
+            return "200 OK", {'Content-Type': "application/gpx+xml", 'X-Points': str(result.points)}, body
+        finally:
+            # 已在工作进程中运行的被取消任务可能还在写入，删除失败时留给服务退出时清理
+            await loop.run_in_executor(None, shutil.rmtree, job_dir, True)
+
+
+async def client_disconnected(reader):
+    """等待客户端断开连接：读到EOF或连接出错时返回True，收到后续数据（流水线请求）时返回False"""
+    try:
+        return await reader.read(1) == b''
+    except ConnectionError:
+        return True
+
+
+def write_upload(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_output(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def busy_response(converter):
+    return json_response("503 Service Unavailable",
+                         {'error': f"正在转换 {converter.in_flight} 个文件，另有 {converter.waiting} 个在等待"},
+                         {'Retry-After': "1"})
+
+
+def json_response(status, payload, headers=None):
+    response_headers = {'Content-Type': "application/json; charset=utf-8"}
+    response_headers.update(headers or {})
+    return status, response_headers, json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+async def start_server(converter, work_dir, host=DEFAULT_HOST, port=DEFAULT_PORT, max_body=DEFAULT_MAX_BODY):
+    """启动HTTP服务，返回 asyncio.Server（port 为0时由系统分配端口）"""
+    server = ConversionServer(converter, work_dir, max_body)
+    return await asyncio.start_server(server.handle, host, port, limit=MAX_HEADER_SIZE)
+
+
+async def serve(args):
+    options = ConversionOptions(extensions=() if args.extensions is None else args.extensions or EXTENSION_FIELDS)
+    async with AsyncConverter(workers=args.workers, max_in_flight=args.max_in_flight, max_waiting=args.max_waiting,
+                              options=options) as converter:
+        with tempfile.TemporaryDirectory(prefix="fit2gpx_service_") as work_dir:
+            server = await start_server(converter, work_dir, args.host, args.port, args.max_body)
+            address = server.sockets[0].getsockname()
+            print(f"转换服务已启动: http://{address[0]}:{address[1]}/convert"
+                  f"（{converter.workers} 个进程，同时转换 {converter.max_in_flight} 个）", flush=True)
+            async with server:
+                await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FIT转GPX的异步HTTP转换服务（上传接口的本地替身）")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="进程数（默认为CPU核心数）")
+    parser.add_argument("--max-in-flight", type=int, help="同时转换的文件数（默认等于进程数）")
+    parser.add_argument("--max-waiting", type=int, default=64,
+                        help="等待转换的请求数上限，超过时返回503（默认64）")
+    parser.add_argument("--max-body", type=int, default=DEFAULT_MAX_BODY, help="上传文件大小上限（字节）")
+    parser.add_argument("--extensions", nargs="*", choices=EXTENSION_FIELDS, metavar="FIELD",
+                        help="在GPX扩展中输出传感器数据；不指定字段时输出全部")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    # 打包成可执行文件后，进程池的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    sys.exit(main())
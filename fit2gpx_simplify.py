@@ -0,0 +1,158 @@
+"""轨迹简化与重采样：位于记录解码和GPX写入之间的可选处理阶段
+
+支持三种方式，可组合使用，按以下顺序执行：
+1. 按固定时间间隔重采样（每个间隔保留第一个点）；
+2. Ramer–Douglas–Peucker 简化，tolerance 为以米为单位的距离容差；
+3. 最大点数限制，按RDP重要度保留最重要的点。
+
+RDP按层迭代：每一轮用NumPy同时处理所有待拆分的线段，每轮耗时与点数成正比，总耗时为点数×拆分树的深度。
+深度通常为对数级，但等角度的螺线等轨迹每次只能拆下几个点，深度随点数线性增长，耗时变为平方级。
+因此拆分超过 RDP_MAX_DEPTH 轮后，剩余的线段改为按下标从中间拆分（等间隔抽取），最多再需要 log2(n) 轮，
+总耗时为 O(n·(RDP_MAX_DEPTH + log n))。这部分拆分点的重要度仍取线段中的最大距离，简化结果的误差不超过容差，
+只是保留的点可能比标准RDP多一些。
+"""
+import numpy as np
+
+from fit2gpx_decoder import RecordChunk
+
+# 平均地球半径（米）
+EARTH_RADIUS = 6371008.8
+# 按最大距离拆分的最多轮数，之后按下标从中间拆分
+RDP_MAX_DEPTH = 64
+
+
+def project_to_meters(latitudes, longitudes):
+    """把经纬度投影为以米为单位的平面坐标（等距圆柱投影，适用于单条轨迹的范围）"""
+    lat = np.radians(latitudes)
+    # 跨越180度经线的轨迹先展开经度，避免出现一条横跨地球的线段
+    lon = np.unwrap(np.radians(longitudes))
+    x = lon * (EARTH_RADIUS * np.cos(np.mean(lat)))
+    y = lat * EARTH_RADIUS
+    return x, y
+
+
+def resample_indices(timestamps, interval):
+    """按固定时间间隔重采样，返回保留点的下标：每 interval 秒保留该时间段的第一个点，并保留终点
+
+    无效时间戳（-1）的点沿用前一个有效时间；整条轨迹都没有时间时不做重采样。
+    """
+    count = len(timestamps)
+    valid = timestamps >= 0
+    if count <= 2 or not valid.any():
+        return np.arange(count)
+    # 向前填充无效时间戳，开头的无效点归入第一个有效时间
+    positions = np.where(valid, np.arange(count), -1)
+    np.maximum.accumulate(positions, out=positions)
+    positions[positions < 0] = np.argmax(valid)
+    filled = timestamps[positions]
+
+    bucket = (filled - filled[0]) // interval
+    keep = np.empty(count, dtype=bool)
+    keep[0] = True
+    keep[1:] = bucket[1:] != bucket[:-1]
+    keep[-1] = True
+    return np.flatnonzero(keep)
+
+
+def rdp_importance(x, y, tolerance=0.0):
+    """计算每个点的RDP重要度：容差小于该值时此点会被保留
+
+    首尾两点为无穷大。重要度不超过其父拆分点的重要度，因此“重要度 > 容差”的点恰好是标准RDP的结果，
+    按重要度从大到小取前N个点即为N个点以内的最佳近似。只有最大距离超过 tolerance 的线段才会继续拆分，
+    未拆分的点重要度为0。拆分超过 RDP_MAX_DEPTH 轮后，拆分点改为线段中间的点（见模块说明）。
+    """
+    count = len(x)
+    importance = np.zeros(count)
+    if count == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+    if count <= 2:
+        return importance
+
+    # 待拆分的线段：起点、终点下标，以及其父拆分点的重要度
+    starts = np.array([0])
+    ends = np.array([count - 1])
+    limits = np.array([np.inf])
+    depth = 0
+    while len(starts):
+        lengths = ends - starts - 1
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        offsets = np.cumsum(lengths) - lengths
+        index = np.arange(len(segment)) - offsets[segment] + starts[segment] + 1
+
+        # 点到线段（而不是直线）的距离，首尾重合的环形线段也能正确处理
+        ax = x[starts][segment]
+        ay = y[starts][segment]
+        dx = x[ends][segment] - ax
+        dy = y[ends][segment] - ay
+        px = x[index] - ax
+        py = y[index] - ay
+        length2 = dx * dx + dy * dy
+        t = np.clip((px * dx + py * dy) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+        distance = np.hypot(px - t * dx, py - t * dy)
+
+        max_distance = np.maximum.reduceat(distance, offsets)
+        if depth < RDP_MAX_DEPTH:
+            # 每条线段中距离最大的点（相同时取第一个）
+            candidates = np.flatnonzero(distance == max_distance[segment])
+            candidate_segments = segment[candidates]
+            first = np.ones(len(candidates), dtype=bool)
+            first[1:] = candidate_segments[1:] != candidate_segments[:-1]
+            pivots = index[candidates[first]]
+        else:
+            pivots = (starts + ends) // 2
+        depth += 1
+
+        split = max_distance > tolerance
+        pivots = pivots[split]
+        pivot_importance = np.minimum(max_distance[split], limits[split])
+        importance[pivots] = pivot_importance
+
+        # 拆分为两条子线段，只保留中间还有点的线段
+        starts = np.concatenate([starts[split], pivots])
+        ends = np.concatenate([pivots, ends[split]])
+        limits = np.concatenate([pivot_importance, pivot_importance])
+        has_inner = ends - starts > 1
+        starts, ends, limits = starts[has_inner], ends[has_inner], limits[has_inner]
+    return importance
+
+
+def simplify_indices(x, y, tolerance=None, max_points=None):
+    """RDP简化并限制最大点数，返回按顺序排列的保留点下标"""
+    count = len(x)
+    if count <= 2 or (tolerance is None and (max_points is None or count <= max_points)):
+        return np.arange(count)
+    # 只给最大点数时，与首尾连线完全重合的点不必保留
+    tolerance = tolerance or 0.0
+    importance = rdp_importance(x, y, tolerance)
+    keep = np.flatnonzero(importance > tolerance)
+    if max_points is not None and len(keep) > max_points:
+        top = np.argpartition(-importance[keep], max_points - 1)[:max_points]
+        keep = np.sort(keep[top])
+    return keep
+
+
+class TrackSimplifier:
+    """把解码器产出的所有记录合并后简化，再作为一个RecordChunk交给写入器
+
+    只保留经纬度有效的点。合并后的数组只有几列数值，10万点也只占几MB内存。
+    处理后 input_points、output_points 为简化前后的点数。
+    """
+    def __init__(self, tolerance=None, interval=None, max_points=None):
+        self.tolerance = tolerance
+        self.interval = interval
+        self.max_points = max_points
+        self.input_points = 0
+        self.output_points = 0
+
+    def apply(self, chunks):
+        track = RecordChunk.concatenate([chunk.select(chunk.valid_position_mask()) for chunk in chunks])
+        self.input_points = len(track)
+        if self.interval:
+            track = track.select(resample_indices(track.timestamp, self.interval))
+        if len(track) > 2 and (self.tolerance is not None or self.max_points is not None):
+            x, y = project_to_meters(track.latitude, track.longitude)
+            track = track.select(simplify_indices(x, y, self.tolerance, self.max_points))
+        self.output_points = len(track)
+        if len(track):
+            yield track
@@ -0,0 +1,211 @@
+"""转换线程与Tk界面之间的消息通道
+
+转换线程（以及界面自身）只把日志、进度和状态放入队列，不直接调用 root.after；界面线程按固定间隔
+（默认每秒10次）取出队列中的全部消息，合并后一次性更新：日志一次插入，进度条和状态只显示最新值。
+上万个文件的批量转换也不会塞满Tk事件队列。
+
+日志窗口只保留最近 max_log_lines 行（环形缓冲），完整日志同时写入日志文件。
+"""
+import os
+import time
+import queue
+from collections import deque
+from datetime import datetime
+
+# 界面刷新间隔（毫秒）
+TICK_MS = 100
+# 日志窗口最多保留的行数
+MAX_LOG_LINES = 2000
+# 每次刷新最多处理的消息数，消息积压时分几次处理，避免界面卡顿
+MAX_EVENTS_PER_TICK = 20000
+# 计算转换速度时参考最近多少秒的进度
+RATE_WINDOW_SECONDS = 10.0
+
+
+def default_log_path():
+    """本次运行的完整日志文件路径：~/.fit2gpx/logs/fit2gpx_日期_时间.log"""
+    folder = os.path.join(os.path.expanduser('~'), '.fit2gpx', 'logs')
+    return os.path.join(folder, datetime.now().strftime('fit2gpx_%Y%m%d_%H%M%S.log'))
+
+
+def format_duration(seconds):
+    """把秒数格式化为 时:分:秒 或 分:秒"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressTracker:
+    """根据完成数量估算转换速度（文件/秒）和剩余时间"""
+    def __init__(self, total, start_time):
+        self.total = total
+        self.done = 0
+        self.start_time = start_time
+        # (时间, 完成数) 采样，用于计算最近一段时间的速度
+        self._samples = deque([(start_time, 0)])
+
+    def update(self, done, now):
+        self.done = done
+        # 每次刷新间隔内只保留一个采样点
+        if len(self._samples) > 1 and now - self._samples[-2][0] < TICK_MS / 1000:
+            self._samples[-1] = (now, done)
+        else:
+            self._samples.append((now, done))
+        while len(self._samples) > 2 and now - self._samples[1][0] > RATE_WINDOW_SECONDS:
+            self._samples.popleft()
+
+    def rate(self):
+        """最近一段时间的速度（文件/秒），尚无法估算时为None"""
+        (first_time, first_done), (last_time, last_done) = self._samples[0], self._samples[-1]
+        if last_time <= first_time or last_done <= first_done:
+            return None
+        return (last_done - first_done) / (last_time - first_time)
+
+    def eta(self):
+        """预计剩余秒数，尚无法估算时为None"""
+        rate = self.rate()
+        if rate is None:
+            return None
+        return (self.total - self.done) / rate
+
+    def describe(self):
+        text = f"{self.done}/{self.total}"
+        if self.total:
+            text += f"（{self.done / self.total:.1%}）"
+        rate = self.rate()
+        if rate is not None:
+            text += f"  {rate:.1f} 个文件/秒"
+            if self.done < self.total:
+                text += f"  预计剩余 {format_duration(self.eta())}"
+        return text
+
+
+class UiBridge:
+    """把任意线程产生的界面更新合并后在界面线程中定时刷新
+
+    log()、begin()、progress()、status()、call() 可在任意线程调用；消息按放入的顺序处理，
+    call() 放入的函数在它之前的日志和进度显示出来之后才执行（如转换完成后的提示框）。
+    """
+    def __init__(self, root, log_text, progress_var, status_var, log_path=None,
+                 max_log_lines=MAX_LOG_LINES, tick_ms=TICK_MS):
+        self.root = root
+        self.log_text = log_text
+        self.progress_var = progress_var
+        self.status_var = status_var
+        self.log_path = log_path
+        self.max_log_lines = max_log_lines
+        self.tick_ms = tick_ms
+        self._events = queue.SimpleQueue()
+        self._tracker = None
+        self._tracker_label = ""
+        self._log_file = None
+        self._trimmed = False
+        self.root.after(self.tick_ms, self._tick)
+
+    def log(self, message):
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self._events.put(('log', f"[{timestamp}] {message}\n"))
+
+    def begin(self, total, label):
+        """开始一批共 total 个文件的转换，状态栏显示 label 和进度、速度、剩余时间"""
+        self._events.put(('begin', total, label, time.monotonic()))
+
+    def progress(self, done):
+        self._events.put(('progress', done, time.monotonic()))
+
+    def status(self, text):
+        """设置状态栏文字，并结束当前的进度显示"""
+        self._events.put(('status', text))
+
+    def call(self, function):
+        """在界面线程中执行 function"""
+        self._events.put(('call', function))
+
+    def close(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    def _tick(self):
+        try:
+            self._process_events()
+        finally:
+            self.root.after(self.tick_ms, self._tick)
+
+    def _process_events(self):
+        lines = []
+        # 本次刷新要显示的进度条数值和状态文字，为None时不变
+        state = {'progress': None, 'status': None}
+        for _ in range(MAX_EVENTS_PER_TICK):
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == 'log':
+                lines.append(event[1])
+            elif kind == 'progress':
+                if self._tracker is not None:
+                    self._tracker.update(event[1], event[2])
+                    state['progress'] = self._tracker
+            elif kind == 'begin':
+                self._tracker = ProgressTracker(event[1], event[3])
+                self._tracker_label = event[2]
+                state['progress'] = self._tracker
+            elif kind == 'status':
+                # 结束进度显示：进度条保留最终数值，状态栏改为指定文字
+                if self._tracker is not None:
+                    state['progress'] = self._tracker
+                self._tracker = None
+                state['status'] = event[1]
+            elif kind == 'call':
+                # 先显示之前的日志和状态，再执行函数
+                self._apply(lines, state)
+                lines = []
+                state = {'progress': None, 'status': None}
+                event[1]()
+        self._apply(lines, state)
+
+    def _apply(self, lines, state):
+        if lines:
+            self._append_log(''.join(lines))
+        tracker = state['progress']
+        if tracker is not None:
+            self.progress_var.set(tracker.done / tracker.total * 100 if tracker.total else 100)
+        if state['status'] is not None:
+            self.status_var.set(state['status'])
+        elif tracker is not None:
+            self.status_var.set(f"{self._tracker_label} {tracker.describe()}")
+
+    def _append_log(self, text):
+        self._spill(text)
+        self.log_text.insert('end', text)
+        # 只保留最近 max_log_lines 行，较早的日志只保存在日志文件中
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        excess = line_count - self.max_log_lines
+        if excess > 0:
+            if not self._trimmed:
+                # 第一行固定为提示，之后删除其后最早的日志
+                self._trimmed = True
+                note = f"（日志窗口只显示最近 {self.max_log_lines} 行"
+                note += f"，完整日志见: {self.log_path}）\n" if self.log_path else "）\n"
+                self.log_text.insert('1.0', note)
+                excess += 1
+            self.log_text.delete('2.0', f'{excess + 2}.0')
+        self.log_text.see('end')
+
+    def _spill(self, text):
+        """把日志追加到日志文件；文件无法写入时只在窗口中显示"""
+        if not self.log_path:
+            return
+        try:
+            if self._log_file is None:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                self._log_file = open(self.log_path, 'a', encoding='utf-8')
+            self._log_file.write(text)
+            self._log_file.flush()
+        except OSError:
+            self.log_path = None
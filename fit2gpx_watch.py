@@ -0,0 +1,262 @@
+"""监视文件夹模式：持续将新增或修改的FIT文件转换为GPX
+
+安装了 watchdog 时使用系统文件事件（Linux为inotify，Windows为ReadDirectoryChangesW），
+否则退回到定期扫描文件夹。所有事件和转换结果都经由同一个队列交给主循环处理，
+没有待处理文件时主循环阻塞等待，空闲时几乎不占用CPU。
+
+手表同步过来的文件可能仍在写入，因此文件大小和修改时间需保持不变一段时间（防抖）后才转换；
+文件头声明的数据长度超过当前文件大小时，视为仍在写入，继续等待（最长 max_wait 秒）。
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fit2gpx_core import (MIN_FIT_FILE_SIZE, FIT_HEADER_SIZES, check_fit_header, is_fit_file_name,
+                          gpx_path_for, converter_settings, convert_job, ignore_interrupt, ConversionOptions)
+from fit2gpx_manifest import ConversionManifest
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# 文件保持不变多少秒后才转换
+DEFAULT_SETTLE_SECONDS = 2.0
+# 没有文件事件支持时的扫描间隔
+DEFAULT_POLL_INTERVAL = 5.0
+# 文件一直显示为不完整时，最多等待多少秒后仍然转换（保留已写入的部分）
+DEFAULT_MAX_WAIT = 120.0
+
+
+class _EventHandler(FileSystemEventHandler):
+    """把watchdog的文件事件转发到主循环队列"""
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.events.put(('changed', event.src_path))
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.events.put(('changed', event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.events.put(('changed', event.dest_path))
+
+
+class _PendingFile:
+    """等待写入完成的文件"""
+    __slots__ = ('size', 'mtime_ns', 'stable_since', 'first_seen')
+
+    def __init__(self, size, mtime_ns, now):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.stable_since = now
+        self.first_seen = now
+
+
+class FolderWatcher:
+    """监视输入文件夹并在有限的进程池中转换新增或修改的FIT文件"""
+    def __init__(self, folder_path, output_folder_path, workers=2, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, max_wait=DEFAULT_MAX_WAIT, use_events=True,
+                 options=None, metrics=None, log_message=print):
+        self.folder_path = folder_path
+        self.output_folder_path = output_folder_path
+        self.workers = max(1, workers)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.use_events = use_events and Observer is not None
+        self.options = options
+        self.gpx_suffix = (options or ConversionOptions()).gpx_suffix
+        # MetricsCollector，为None时不计时
+        self.metrics = metrics
+        self.log_message = log_message
+
+        # SimpleQueue.put 可重入，stop() 可以在主线程的信号处理函数中调用
+        self._events = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._pending = {}
+        self._ready = []
+        self._running = {}
+        self._snapshot = {}
+
+    def stop(self):
+        """请求停止监视（可从其他线程或信号处理函数中调用），正在转换的文件完成后 run() 返回"""
+        self._stop.set()
+        self._events.put(('stop', None))
+
+    def run(self):
+        """阻塞运行直到调用 stop()"""
+        os.makedirs(self.output_folder_path, exist_ok=True)
+        manifest = ConversionManifest(self.output_folder_path, converter_settings(self.options))
+        index = None
+        if self.options is not None and self.options.summary:
+            from fit2gpx_index import ActivityIndex, index_path_for
+            index = ActivityIndex(index_path_for(self.output_folder_path))
+        observer = None
+        if self.use_events:
+            observer = Observer()
+            observer.schedule(_EventHandler(self._events), self.folder_path, recursive=False)
+            observer.start()
+            self.log_message(f"开始监视文件夹（文件事件）: {self.folder_path}")
+        else:
+            self.log_message(f"开始监视文件夹（每 {self.poll_interval:g} 秒扫描一次）: {self.folder_path}")
+
+        # 启动时先处理文件夹中已有的文件
+        self._scan()
+        next_poll = time.monotonic() + self.poll_interval
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=ignore_interrupt) as executor:
+                while not self._stop.is_set():
+                    now = time.monotonic()
+                    if observer is None and now >= next_poll:
+                        self._scan()
+                        next_poll = now + self.poll_interval
+                    self._check_pending(now)
+                    self._submit_ready(executor, manifest, index)
+
+                    try:
+                        kind, item = self._events.get(timeout=self._next_timeout(now, next_poll, observer))
+                    except queue.Empty:
+                        continue
+                    if kind == 'changed':
+                        self._file_changed(item)
+                    elif kind == 'done':
+                        self._job_done(item, manifest, index)
+
+                # 等待正在转换的文件完成
+                for future in list(self._running):
+                    self._job_done(future, manifest, index)
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            manifest.close()
+            if index is not None:
+                index.close()
+            self.log_message("已停止监视")
+
+    def _next_timeout(self, now, next_poll, observer):
+        """计算下一次需要醒来的时间；没有待处理文件时无限等待事件"""
+        deadlines = []
+        if observer is None:
+            deadlines.append(next_poll)
+        for pending in self._pending.values():
+            deadlines.append(pending.stable_since + self.settle_seconds)
+        if not deadlines:
+            return None
+        return max(0.05, min(deadlines) - now)
+
+    def _scan(self):
+        """扫描文件夹，找出新增或大小、修改时间变化的FIT文件"""
+        snapshot = {}
+        try:
+            with os.scandir(self.folder_path) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_fit_file_name(entry.name):
+                        stat = entry.stat()
+                        snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            self.log_message(f"扫描文件夹失败: {str(e)}")
+            return
+        for path, signature in snapshot.items():
+            if self._snapshot.get(path) != signature:
+                self._file_changed(path)
+        self._snapshot = snapshot
+
+    def _file_changed(self, path):
+        if not is_fit_file_name(path):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # 文件已被删除或移走
+            self._pending.pop(path, None)
+            return
+        now = time.monotonic()
+        pending = self._pending.get(path)
+        if pending is None:
+            self._pending[path] = _PendingFile(stat.st_size, stat.st_mtime_ns, now)
+        elif (pending.size, pending.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            pending.size = stat.st_size
+            pending.mtime_ns = stat.st_mtime_ns
+            pending.stable_since = now
+
+    def _check_pending(self, now):
+        """把已保持不变足够久且看起来已写完的文件移入待转换列表"""
+        for path in list(self._pending):
+            pending = self._pending[path]
+            if now - pending.stable_since < self.settle_seconds:
+                continue
+            # 事件可能在文件写完前到达，这里再确认一次大小和修改时间
+            self._file_changed(path)
+            pending = self._pending.get(path)
+            if pending is None or now - pending.stable_since < self.settle_seconds:
+                continue
+            if not self._looks_complete(path, pending) and now - pending.first_seen < self.max_wait:
+                # 仍在写入中：重新计时，不要抢在写完之前转换（避免“文件过小”等验证失败）
+                pending.stable_since = now
+                continue
+            del self._pending[path]
+            if path not in self._ready:
+                self._ready.append(path)
+
+    @staticmethod
+    def _looks_complete(path, pending):
+        """文件已达到最小长度，且文件头声明的数据长度已全部写入"""
+        if pending.size < MIN_FIT_FILE_SIZE:
+            return False
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(max(FIT_HEADER_SIZES))
+        except OSError:
+            return False
+        is_valid, _, truncated = check_fit_header(header, pending.size)
+        # 文件头无效的文件不会因为继续等待而变好，直接交给转换去报告错误
+        return not is_valid or not truncated
+
+    def _submit_ready(self, executor, manifest, index=None):
+        """在不超过进程数的前提下提交待转换文件"""
+        running_paths = {job[0] for job in self._running.values()}
+        deferred = []
+        while self._ready and len(self._running) < self.workers:
+            fit_file_path = self._ready.pop(0)
+            if fit_file_path in running_paths:
+                # 同一文件的上一次转换尚未完成，完成后再处理
+                deferred.append(fit_file_path)
+                continue
+            job = (fit_file_path, gpx_path_for(fit_file_path, self.output_folder_path, self.gpx_suffix))
+            if manifest.is_unchanged(job) and (index is None or index.contains(fit_file_path)):
+                continue
+            future = executor.submit(convert_job, job, self.options, self.metrics is not None)
+            self._running[future] = job
+            running_paths.add(fit_file_path)
+            future.add_done_callback(lambda f: self._events.put(('done', f)))
+        self._ready.extend(deferred)
+
+    def _job_done(self, future, manifest, index=None):
+        if self._running.pop(future, None) is None:
+            return
+        result = future.result()
+        manifest.record(result)
+        manifest.commit()
+        if index is not None:
+            index.record(result)
+            index.commit()
+        if self.metrics is not None:
+            self.metrics.add(result)
+            self.metrics.flush()
+        fit_file = os.path.basename(result.fit_file_path)
+        if result.success:
+            self.log_message(f"已转换: {fit_file} -> {os.path.basename(result.gpx_file_path)}{result.reduction_note()}")
+        else:
+            self.log_message(f"转换失败 {fit_file}: {result.error_msg}")
@@ -0,0 +1,78 @@
+"""命令行入口：不导入界面库，批量转换和退出码
+
+运行: python -m unittest discover -s tests
+"""
+import io
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+from contextlib import redirect_stdout, redirect_stderr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_cli import main
+from benchmarks.fit_synth import write_fit
+
+
+class HeadlessImportTest(unittest.TestCase):
+    def test_cli_does_not_import_gui_libraries(self):
+        code = ("import sys, fit2gpx_cli; "
+                "print(sorted(m for m in ('tkinter', 'ttkbootstrap', 'PIL') if m in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                                stdout=subprocess.PIPE, text=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+
+class CliConversionTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self._temp_dir.name, 'in')
+        self.output_dir = os.path.join(self._temp_dir.name, 'out')
+        os.makedirs(self.input_dir)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def run_cli(self, *args):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            code = main([self.input_dir, '-o', self.output_dir, '-j', '1'] + list(args))
+        return code, output.getvalue()
+
+    def gpx_files(self):
+        return sorted(name for name in os.listdir(self.output_dir) if name.endswith('.gpx'))
+
+    def test_converts_folder(self):
+        write_fit(os.path.join(self.input_dir, 'a.fit'), 100)
+        write_fit(os.path.join(self.input_dir, 'b.fit'), 100, start_time=1000086400)
+        code, output = self.run_cli()
+        self.assertEqual(code, 0)
+        self.assertIn("成功 2 个，失败 0 个", output)
+        self.assertEqual(self.gpx_files(), ['a.gpx', 'b.gpx'])
+
+    def test_failed_file_sets_exit_code(self):
+        write_fit(os.path.join(self.input_dir, 'a.fit'), 100)
+        with open(os.path.join(self.input_dir, 'bad.fit'), 'wb') as f:
+            f.write(b'x' * 100)
+        code, output = self.run_cli()
+        self.assertEqual(code, 1)
+        self.assertIn("转换失败 bad.fit", output)
+        self.assertEqual(self.gpx_files(), ['a.gpx'])
+
+    def test_missing_input_folder(self):
+        os.rmdir(self.input_dir)
+        code, output = self.run_cli()
+        self.assertEqual(code, 2)
+        self.assertIn("输入文件夹无效", output)
+
+    def test_invalid_option_combination(self):
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as context:
+            self.run_cli('--merge', '--watch')
+        self.assertEqual(context.exception.code, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""单次转换：不输出扩展数据时与 fitparse + gpxpy 的结果逐字节相同，截断和损坏的文件
+
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import fitparse
+import gpxpy.gpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_core import STATUS_OK, STATUS_TRUNCATED, fit_to_gpx
+from benchmarks.fit_synth import build_fit, truncate_fit, corrupt_crc
+
+SEMICIRCLES_PER_DEGREE = (2**32) / 360.0
+
+
+def reference_points(fit_path):
+    """用fitparse逐条读取record，返回 (有经纬度的点列表, 是否读到文件末尾)，与原先的转换规则相同"""
+    points = []
+    try:
+        for record in fitparse.FitFile(fit_path).get_messages('record'):
+            values = {data.name: data.value for data in record}
+            latitude = values.get('position_lat')
+            longitude = values.get('position_long')
+            if not latitude or not longitude:
+                continue
+            timestamp = values.get('timestamp')
+            if isinstance(timestamp, int):
+                timestamp = datetime(1989, 12, 31, tzinfo=timezone.utc) + timedelta(seconds=timestamp)
+            points.append(gpxpy.gpx.GPXTrackPoint(latitude=latitude / SEMICIRCLES_PER_DEGREE,
+                                                  longitude=longitude / SEMICIRCLES_PER_DEGREE,
+                                                  elevation=values.get('altitude'), time=timestamp))
+    except fitparse.FitParseError:
+        return points, False
+    return points, True
+
+
+def reference_gpx(points):
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack()
+    gpx.tracks.append(track)
+    segment = gpxpy.gpx.GPXTrackSegment()
+    track.segments.append(segment)
+    segment.points.extend(points)
+    return gpx.to_xml()
+
+
+class ConvertTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.fit_path = os.path.join(self._temp_dir.name, 'activity.fit')
+        self.gpx_path = os.path.join(self._temp_dir.name, 'activity.gpx')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def convert(self, data):
+        with open(self.fit_path, 'wb') as f:
+            f.write(data)
+        return fit_to_gpx(self.fit_path, self.gpx_path)
+
+    def read_gpx(self):
+        with open(self.gpx_path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_matches_gpxpy(self):
+        variants = {
+            'plain': {},
+            'sensors': {'sensors': True},
+            'developer': {'developer_fields': True},
+            'compressed': {'compressed_timestamps': True},
+            'laps_and_pause': {'lap_records': 100, 'pause': (150, 600)},
+            'relative_time': {'start_time': 1000},
+        }
+        for name, kwargs in variants.items():
+            with self.subTest(variant=name):
+                info = self.convert(build_fit(600, **kwargs))
+                points, complete = reference_points(self.fit_path)
+                self.assertTrue(complete)
+                self.assertEqual(info['status'], STATUS_OK)
+                self.assertEqual(info['points'], len(points))
+                self.assertEqual(self.read_gpx(), reference_gpx(points))
+
+    def test_truncated_file_keeps_parsed_points(self):
+        info = self.convert(truncate_fit(build_fit(600)))
+        points, complete = reference_points(self.fit_path)
+        self.assertFalse(complete)
+        self.assertEqual(info['status'], STATUS_TRUNCATED)
+        self.assertEqual(info['points'], len(points))
+        self.assertEqual(self.read_gpx(), reference_gpx(points))
+
+    def test_corrupt_file_fails_without_output(self):
+        with self.assertRaisesRegex(Exception, "CRC"):
+            self.convert(corrupt_crc(build_fit(600)))
+        self.assertFalse(os.path.exists(self.gpx_path))
+        self.assertEqual(sorted(os.listdir(self._temp_dir.name)), ['activity.fit'])
+
+    def test_invalid_header_fails(self):
+        with self.assertRaisesRegex(Exception, "文件验证失败"):
+            self.convert(b'x' * 2000)
+        self.assertFalse(os.path.exists(self.gpx_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
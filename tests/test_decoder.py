@@ -0,0 +1,82 @@
+"""快速解码器与fitparse解码器的结果逐字段相同，无法处理的文件回退到fitparse
+
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_core import EXTENSION_FIELDS, decode_fit_records
+from fit2gpx_decoder import RecordChunk, RecordDecoder, FitparseRecordDecoder, UnsupportedFitError
+from benchmarks.fit_synth import build_fit, truncate_fit, corrupt_crc
+
+
+def decode(decoder_class, data, **kwargs):
+    decoder = decoder_class(data, EXTENSION_FIELDS, markers=True, **kwargs)
+    return RecordChunk.concatenate(list(decoder)), decoder
+
+
+class DecoderEqualityTest(unittest.TestCase):
+    def assertSameRecords(self, data, chunk_size=1000):
+        fast, fast_decoder = decode(RecordDecoder, data, chunk_size=chunk_size)
+        slow, slow_decoder = decode(FitparseRecordDecoder, data, chunk_size=chunk_size)
+        np.testing.assert_array_equal(fast.timestamp, slow.timestamp)
+        for name in ('latitude', 'longitude', 'altitude'):
+            np.testing.assert_array_equal(getattr(fast, name), getattr(slow, name), err_msg=name)
+        self.assertEqual(sorted(fast.sensors), sorted(slow.sensors))
+        for name in fast.sensors:
+            np.testing.assert_array_equal(fast.sensors[name], slow.sensors[name], err_msg=name)
+        for attribute in ('record_count', 'truncated', 'device', 'session_starts', 'lap_starts'):
+            self.assertEqual(getattr(fast_decoder, attribute), getattr(slow_decoder, attribute), attribute)
+        return fast, fast_decoder
+
+    def test_variants(self):
+        variants = {
+            'plain': {},
+            'sensors': {'sensors': True},
+            'developer': {'developer_fields': True},
+            'compressed_timestamps': {'compressed_timestamps': True},
+            'compressed_sensors': {'compressed_timestamps': True, 'sensors': True},
+            'laps_and_pause': {'lap_records': 120, 'pause': (200, 900)},
+            'no_positions': {'positions': False},
+        }
+        for name, kwargs in variants.items():
+            with self.subTest(variant=name):
+                chunk, decoder = self.assertSameRecords(build_fit(700, **kwargs), chunk_size=256)
+                self.assertEqual(len(chunk), 700)
+                self.assertFalse(decoder.truncated)
+
+    def test_truncated(self):
+        chunk, decoder = self.assertSameRecords(truncate_fit(build_fit(700, sensors=True)))
+        self.assertTrue(decoder.truncated)
+        self.assertGreater(len(chunk), 0)
+        self.assertLess(len(chunk), 700)
+
+    def test_chained_files(self):
+        data = build_fit(300) + build_fit(200, start_time=1000000400)
+        chunk, _ = self.assertSameRecords(data)
+        self.assertEqual(len(chunk), 500)
+
+
+class FallbackTest(unittest.TestCase):
+    def test_crc_error_is_unsupported_by_fast_decoder(self):
+        with self.assertRaises(UnsupportedFitError):
+            list(RecordDecoder(corrupt_crc(build_fit(100))))
+
+    def test_crc_error_falls_back_to_fitparse(self):
+        with self.assertRaisesRegex(Exception, "CRC"):
+            decode_fit_records(corrupt_crc(build_fit(100)), list)
+
+    def test_fast_decoder_used_for_supported_files(self):
+        chunks, decoder = decode_fit_records(build_fit(100, developer_fields=True), list)
+        self.assertIsInstance(decoder, RecordDecoder)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""按列导出：转换失败时不留下导出文件
+
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_core import ConversionOptions, fit_to_gpx
+from benchmarks.fit_synth import build_fit, corrupt_crc
+
+
+class ExportCleanupTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.temp_dir = self._temp_dir.name
+        self.export_dir = os.path.join(self.temp_dir, 'export')
+        self.options = ConversionOptions(export_dir=self.export_dir, export_format='csv')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def convert(self, name, data):
+        fit_path = os.path.join(self.temp_dir, name + '.fit')
+        with open(fit_path, 'wb') as f:
+            f.write(data)
+        gpx_path = os.path.join(self.temp_dir, name + '.gpx')
+        return fit_to_gpx(fit_path, gpx_path, self.options), gpx_path
+
+    def exported_files(self):
+        files = []
+        for folder, _, names in os.walk(self.export_dir):
+            files += [os.path.relpath(os.path.join(folder, name), self.export_dir) for name in names]
+        return sorted(files)
+
+    def test_exports_activity(self):
+        info, gpx_path = self.convert('ride', build_fit(100))
+        self.assertEqual(info['points'], 100)
+        self.assertTrue(os.path.exists(gpx_path))
+        self.assertEqual(self.exported_files(), [os.path.join('activity=ride', 'part-0.csv')])
+
+    def test_no_coordinates_leaves_no_export(self):
+        with self.assertRaisesRegex(Exception, "未找到有效的轨迹点"):
+            self.convert('indoor', build_fit(100, positions=False))
+        self.assertEqual(os.listdir(self.export_dir), [])
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['export', 'indoor.fit'])
+
+    def test_decode_error_leaves_no_export(self):
+        with self.assertRaises(Exception):
+            self.convert('broken', corrupt_crc(build_fit(100)))
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+    def test_failure_keeps_previous_export(self):
+        self.convert('ride', build_fit(100))
+        with self.assertRaisesRegex(Exception, "未找到有效的轨迹点"):
+            self.convert('ride', build_fit(100, positions=False))
+        self.assertEqual(self.exported_files(), [os.path.join('activity=ride', 'part-0.csv')])
+
+
+if __name__ == '__main__':
+    unittest.main()
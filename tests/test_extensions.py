@@ -0,0 +1,124 @@
+"""GPX扩展数据：按列生成的输出与逐点格式化的参照逐字节相同
+
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_decoder import RecordChunk
+from fit2gpx_gpx import (GPX_FOOTER, TEXT_BLOCK_POINTS, TRACKPOINT_EXTENSION_FIELDS, POWER_EXTENSION_FIELDS,
+                         GpxWriter, format_float, format_times, gpx_header)
+
+ALL_FIELDS = ('heart_rate', 'cadence', 'power', 'temperature', 'speed')
+
+
+def reference_trkpt(lat, lon, ele, time, values):
+    """逐点拼出一个 <trkpt>，values 为 字段名 -> 取值（NaN 为无值）"""
+    lines = [f'      <trkpt lat="{format_float(lat)}" lon="{format_float(lon)}">\n']
+    if not np.isnan(ele):
+        lines.append(f'        <ele>{format_float(ele)}</ele>\n')
+    if time is not None:
+        lines.append(f'        <time>{time}</time>\n')
+    extension_lines = []
+    for fields, indent, open_tag, close_tag in (
+            (TRACKPOINT_EXTENSION_FIELDS, ' ' * 12,
+             '          <gpxtpx:TrackPointExtension>\n', '          </gpxtpx:TrackPointExtension>\n'),
+            (POWER_EXTENSION_FIELDS, ' ' * 10, '', '')):
+        group = []
+        for name, element, fmt in fields:
+            value = values.get(name, np.nan)
+            if not np.isnan(value):
+                text = str(int(value)) if fmt == '%d' else format_float(float(value))
+                group.append(f'{indent}<{element}>{text}</{element}>\n')
+        if group:
+            extension_lines += [open_tag] + group + [close_tag]
+    if extension_lines:
+        lines += ['        <extensions>\n'] + extension_lines + ['        </extensions>\n']
+    lines.append('      </trkpt>\n')
+    return ''.join(lines)
+
+
+def reference_gpx(chunk, extensions):
+    times = format_times(chunk.timestamp)
+    points = []
+    for i in range(len(chunk)):
+        values = {name: chunk.sensors[name][i] for name in extensions}
+        points.append(reference_trkpt(chunk.latitude[i], chunk.longitude[i], chunk.altitude[i], times[i], values))
+    return gpx_header(extensions) + ''.join(points) + GPX_FOOTER
+
+
+def sensor_chunk(count, seed=0, gaps=0.0):
+    """带全部传感器字段的轨迹，gaps 为每个字段随机无值的比例"""
+    rng = np.random.default_rng(seed)
+    sensors = {
+        'heart_rate': rng.integers(60, 190, count).astype(np.float64),
+        'cadence': rng.integers(0, 120, count).astype(np.float64),
+        'power': rng.integers(0, 1500, count).astype(np.float64),
+        'temperature': rng.integers(-20, 40, count).astype(np.float64),
+        'speed': np.round(rng.uniform(0, 15, count), 3),
+    }
+    if gaps:
+        for values in sensors.values():
+            values[rng.random(count) < gaps] = np.nan
+    altitude = np.round(rng.uniform(0, 500, count), 1)
+    altitude[rng.random(count) < 0.1] = np.nan
+    return RecordChunk(np.arange(count, dtype=np.int64) + 1000000000,
+                       31.0 + np.cumsum(rng.uniform(0, 1e-4, count)),
+                       121.0 + np.cumsum(rng.uniform(0, 1e-4, count)),
+                       altitude, sensors)
+
+
+class ExtensionOutputTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.gpx_path = os.path.join(self._temp_dir.name, 'out.gpx')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def assertMatchesReference(self, chunk, extensions):
+        writer = GpxWriter(self.gpx_path, extensions)
+        writer.write_chunk(chunk)
+        writer.close()
+        with open(self.gpx_path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), reference_gpx(chunk, extensions))
+
+    def test_heart_rate_only(self):
+        self.assertMatchesReference(sensor_chunk(300), ('heart_rate',))
+
+    def test_power_only(self):
+        self.assertMatchesReference(sensor_chunk(300), ('power',))
+
+    def test_all_fields(self):
+        self.assertMatchesReference(sensor_chunk(TEXT_BLOCK_POINTS * 3 + 7), ALL_FIELDS)
+
+    def test_sparse_gaps(self):
+        for gaps in (0.05, 0.5, 0.95):
+            with self.subTest(gaps=gaps):
+                self.assertMatchesReference(sensor_chunk(600, seed=1, gaps=gaps), ALL_FIELDS)
+                self.assertMatchesReference(sensor_chunk(600, seed=2, gaps=gaps), ('heart_rate', 'power'))
+
+    def test_field_missing_in_whole_chunk(self):
+        chunk = sensor_chunk(200)
+        chunk.sensors['heart_rate'][:] = np.nan
+        chunk.sensors['power'][:] = np.nan
+        self.assertMatchesReference(chunk, ALL_FIELDS)
+        self.assertMatchesReference(chunk, ('heart_rate', 'power'))
+
+    def test_constant_and_wide_range_values(self):
+        chunk = sensor_chunk(200)
+        chunk.sensors['heart_rate'][:] = 120
+        chunk.sensors['power'][::2] = 65000
+        chunk.sensors['speed'][:3] = [1e-7, 0.0, 123456789.0]
+        self.assertMatchesReference(chunk, ALL_FIELDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
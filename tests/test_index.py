@@ -0,0 +1,167 @@
+"""活动索引：R-tree查询与逐个比较的结果相同，摘要和编码折线
+
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_core import ConversionOptions, convert_job
+from fit2gpx_decoder import RecordChunk
+from fit2gpx_index import (ActivityIndex, TrackSummary, decode_polyline, encode_polyline, haversine,
+                           polyline_intersects)
+from benchmarks.fit_synth import write_fit
+
+
+def make_summary(rng):
+    lat = rng.uniform(30.0, 32.0)
+    lon = rng.uniform(120.0, 122.0)
+    size = rng.uniform(0.001, 0.3)
+    latitudes = lat + np.linspace(0, size, 20)
+    longitudes = lon + np.linspace(0, size, 20) ** 2 / size
+    start = int(rng.integers(1700000000, 1700000000 + 365 * 86400))
+    return {
+        'min_lat': float(latitudes.min()), 'min_lon': float(longitudes.min()),
+        'max_lat': float(latitudes.max()), 'max_lon': float(longitudes.max()),
+        'start': start, 'end': start + int(rng.integers(600, 20000)),
+        'points': 20, 'distance': 1000.0,
+        'polyline': encode_polyline(latitudes, longitudes),
+    }
+
+
+def overlaps(summary, bbox=None, start=None, end=None):
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        if (summary['max_lat'] < min_lat or summary['min_lat'] > max_lat
+                or summary['max_lon'] < min_lon or summary['min_lon'] > max_lon):
+            return False
+    if start is not None and summary['end'] < start:
+        return False
+    if end is not None and summary['start'] > end:
+        return False
+    return True
+
+
+class ActivityIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.index = ActivityIndex(os.path.join(self._temp_dir.name, 'index.sqlite'))
+        rng = np.random.default_rng(0)
+        self.summaries = {}
+        for i in range(500):
+            path = os.path.join(self._temp_dir.name, f'{i}.fit')
+            self.summaries[os.path.abspath(path)] = make_summary(rng)
+            self.index.add(path, path[:-4] + '.gpx', self.summaries[os.path.abspath(path)])
+        self.index.commit()
+
+    def tearDown(self):
+        self.index.close()
+        self._temp_dir.cleanup()
+
+    def expected(self, **conditions):
+        return sorted(source for source, summary in self.summaries.items() if overlaps(summary, **conditions))
+
+    def sources(self, activities):
+        return sorted(activity['source'] for activity in activities)
+
+    def test_queries_match_brute_force(self):
+        rng = np.random.default_rng(1)
+        for _ in range(50):
+            lat, lon = rng.uniform(30.0, 32.0), rng.uniform(120.0, 122.0)
+            bbox = (lat, lon, lat + rng.uniform(0.01, 0.5), lon + rng.uniform(0.01, 0.5))
+            start = int(rng.integers(1700000000, 1700000000 + 365 * 86400))
+            end = start + int(rng.integers(3600, 30 * 86400))
+            for conditions in ({'bbox': bbox}, {'start': start, 'end': end}, {'start': start},
+                               {'end': end}, {'bbox': bbox, 'start': start, 'end': end}):
+                with self.subTest(**conditions):
+                    self.assertEqual(self.sources(self.index.query(**conditions)), self.expected(**conditions))
+
+    def test_results_sorted_by_start_time(self):
+        starts = [activity['start_time'] for activity in self.index.query()]
+        self.assertEqual(len(starts), 500)
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(len(self.index.query(limit=7)), 7)
+
+    def test_through_checks_polyline(self):
+        path = os.path.join(self._temp_dir.name, 'corner.fit')
+        # L形轨迹：范围覆盖右上角，但轨迹不经过那里
+        latitudes = np.array([10.0, 10.0, 11.0])
+        longitudes = np.array([10.0, 11.0, 11.0])
+        summary = {'min_lat': 10.0, 'min_lon': 10.0, 'max_lat': 11.0, 'max_lon': 11.0, 'start': 1, 'end': 2,
+                   'points': 3, 'distance': 0.0, 'polyline': encode_polyline(latitudes, longitudes)}
+        self.index.add(path, path, summary)
+        top_left = (10.8, 10.0, 11.0, 10.2)
+        self.assertEqual(len(self.index.query(bbox=top_left)), 1)
+        self.assertEqual(self.index.query(bbox=top_left, through=True), [])
+        self.assertEqual(len(self.index.query(bbox=(10.4, 10.9, 10.6, 11.1), through=True)), 1)
+
+    def test_replace_and_remove(self):
+        path = next(iter(self.summaries))
+        moved = dict(self.summaries[path], min_lat=-10.0, max_lat=-9.0, min_lon=-10.0, max_lon=-9.0)
+        self.index.add(path, path, moved)
+        self.assertEqual(self.index.count(), 500)
+        self.assertEqual(self.sources(self.index.query(bbox=(-11.0, -11.0, -8.0, -8.0))), [path])
+        self.index.remove(path)
+        self.assertEqual(self.index.count(), 499)
+        self.assertEqual(self.index.query(bbox=(-11.0, -11.0, -8.0, -8.0)), [])
+        self.assertFalse(self.index.contains(path))
+
+
+class SummaryTest(unittest.TestCase):
+    def test_polyline_round_trip(self):
+        latitudes = np.array([38.5, 40.7, 43.252])
+        longitudes = np.array([-120.2, -120.95, -126.453])
+        self.assertEqual(encode_polyline(latitudes, longitudes), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        decoded = decode_polyline(encode_polyline(latitudes, longitudes))
+        np.testing.assert_allclose(decoded, (latitudes, longitudes))
+
+    def test_polyline_intersects_segment_crossing(self):
+        self.assertTrue(polyline_intersects(np.array([0.0, 2.0]), np.array([0.0, 2.0]), (0.9, 0.9, 1.1, 1.1)))
+        self.assertFalse(polyline_intersects(np.array([0.0, 2.0]), np.array([0.0, 2.0]), (0.0, 1.5, 0.5, 2.0)))
+
+    def test_summary_across_chunks(self):
+        count = 5000
+        rng = np.random.default_rng(2)
+        latitudes = 31.0 + np.cumsum(rng.uniform(-1e-4, 1e-4, count))
+        longitudes = 121.0 + np.cumsum(rng.uniform(-1e-4, 1e-4, count))
+        timestamps = np.arange(count, dtype=np.int64) + 1000000000
+        latitudes[100:200] = np.nan
+        chunk = RecordChunk(timestamps, latitudes, longitudes, np.zeros(count))
+        summary = TrackSummary()
+        for start in range(0, count, 700):
+            summary.add(chunk.select(slice(start, start + 700)))
+        valid = ~np.isnan(latitudes)
+        lat, lon = latitudes[valid], longitudes[valid]
+        self.assertEqual(summary.points, count - 100)
+        self.assertEqual(summary.bbox, (lat.min(), lon.min(), lat.max(), lon.max()))
+        self.assertEqual((summary.start, summary.end), (1000000000, 1000000000 + count - 1))
+        self.assertAlmostEqual(summary.distance, haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum(), places=6)
+        polyline = decode_polyline(summary.polyline())
+        self.assertLessEqual(len(polyline[0]), 100)
+        # 抽稀轨迹保留起点和终点
+        np.testing.assert_allclose([polyline[0][0], polyline[0][-1]], [lat[0], lat[-1]], atol=1e-5)
+
+    def test_conversion_records_summary(self):
+        with tempfile.TemporaryDirectory() as folder:
+            fit_path = write_fit(os.path.join(folder, 'ride.fit'), 300)
+            result = convert_job((fit_path, os.path.join(folder, 'ride.gpx')), ConversionOptions(summary=True))
+            self.assertTrue(result.success)
+            index = ActivityIndex(os.path.join(folder, 'index.sqlite'))
+            try:
+                index.record(result)
+                activities = index.query(bbox=(30.0, 120.0, 33.0, 123.0))
+                self.assertEqual(len(activities), 1)
+                self.assertEqual(activities[0]['points'], 300)
+                self.assertEqual(activities[0]['end_time'] - activities[0]['start_time'], 299)
+            finally:
+                index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""增量转换缓存与转换日志：跳过未变化的文件、崩溃后恢复、分批fsync和只重试失败的文件
+
+运行: python -m unittest discover -s tests
+"""
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fit2gpx_manifest
+from fit2gpx_cli import main
+from fit2gpx_core import convert_job
+from fit2gpx_manifest import ConversionManifest
+from benchmarks.fit_synth import build_fit, write_fit
+
+SETTINGS = {'extensions': []}
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.folder = self._temp_dir.name
+        self.jobs = []
+        for i in range(3):
+            fit_path = write_fit(os.path.join(self.folder, f'{i}.fit'), 100, start_time=1000000000 + i * 86400)
+            self.jobs.append((fit_path, os.path.join(self.folder, f'{i}.gpx')))
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def convert_and_record(self, manifest, jobs):
+        for job in jobs:
+            manifest.record(convert_job(job))
+
+    def partition(self, settings=SETTINGS):
+        manifest = ConversionManifest(self.folder, settings)
+        try:
+            return manifest.partition(self.jobs)
+        finally:
+            manifest.close()
+
+    def test_unchanged_files_are_skipped(self):
+        manifest = ConversionManifest(self.folder, SETTINGS)
+        self.convert_and_record(manifest, self.jobs)
+        manifest.close()
+        self.assertEqual(self.partition(), ([], self.jobs))
+
+    def test_changes_are_detected(self):
+        manifest = ConversionManifest(self.folder, SETTINGS)
+        self.convert_and_record(manifest, self.jobs)
+        manifest.close()
+        # 修改时间变化但内容相同：按内容哈希确认未变化
+        stat = os.stat(self.jobs[0][0])
+        os.utime(self.jobs[0][0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        # 内容变化但大小相同
+        with open(self.jobs[1][0], 'wb') as f:
+            f.write(build_fit(100, start_time=1000050000))
+        # 输出文件不完整
+        with open(self.jobs[2][1], 'r+b') as f:
+            f.truncate(100)
+        self.assertEqual(self.partition(), (self.jobs[1:], self.jobs[:1]))
+        self.assertEqual(self.partition({'extensions': ['heart_rate']}), (self.jobs, []))
+
+    def test_missing_output_is_converted_again(self):
+        manifest = ConversionManifest(self.folder, SETTINGS)
+        self.convert_and_record(manifest, self.jobs)
+        manifest.close()
+        os.remove(self.jobs[0][1])
+        self.assertEqual(self.partition(), (self.jobs[:1], self.jobs[1:]))
+
+    def test_journal_is_replayed_after_crash(self):
+        manifest = ConversionManifest(self.folder, SETTINGS)
+        self.convert_and_record(manifest, self.jobs[:2])
+        # 模拟崩溃：数据库没有提交，日志中的最后一行只写了一半
+        manifest._journal.write('{"fit_path": "')
+        manifest._journal.close()
+        manifest._conn.close()
+        self.assertEqual(self.partition(), (self.jobs[2:], self.jobs[:2]))
+        with open(os.path.join(self.folder, fit2gpx_manifest.JOURNAL_FILE_NAME), encoding='utf-8') as f:
+            self.assertEqual(f.read(), '')
+
+    def test_outputs_are_synced_in_batches(self):
+        with mock.patch.object(fit2gpx_manifest, 'COMMIT_INTERVAL', 2), \
+                mock.patch.object(fit2gpx_manifest, 'sync_files') as sync_files:
+            manifest = ConversionManifest(self.folder, SETTINGS)
+            sync_files.reset_mock()
+            self.convert_and_record(manifest, self.jobs)
+            self.assertEqual([call.args[0] for call in sync_files.call_args_list],
+                             [[self.jobs[0][1], self.jobs[1][1]]])
+            manifest.close()
+            self.assertEqual(sync_files.call_args_list[-1].args[0], [self.jobs[2][1]])
+
+    def test_failures_are_recorded_until_success(self):
+        with open(self.jobs[0][0], 'wb') as f:
+            f.write(b'x' * 2000)
+        manifest = ConversionManifest(self.folder, SETTINGS)
+        self.convert_and_record(manifest, self.jobs)
+        failures = manifest.failures()
+        manifest.close()
+        self.assertEqual([failure[:2] for failure in failures], [self.jobs[0]])
+        self.assertIn("文件验证失败", failures[0][2])
+
+        write_fit(self.jobs[0][0], 100)
+        manifest = ConversionManifest(self.folder, SETTINGS)
+        self.convert_and_record(manifest, self.jobs[:1])
+        self.assertEqual(manifest.failures(), [])
+        manifest.close()
+
+
+class RetryFailedTest(unittest.TestCase):
+    def test_retry_failed_converts_only_failed_files(self):
+        with tempfile.TemporaryDirectory() as folder:
+            input_dir = os.path.join(folder, 'in')
+            output_dir = os.path.join(folder, 'out')
+            os.makedirs(input_dir)
+            write_fit(os.path.join(input_dir, 'good.fit'), 100)
+            bad_path = os.path.join(input_dir, 'bad.fit')
+            with open(bad_path, 'wb') as f:
+                f.write(b'x' * 2000)
+
+            def run(*args):
+                output = io.StringIO()
+                with redirect_stdout(output):
+                    code = main([input_dir, '-o', output_dir, '-j', '1'] + list(args))
+                return code, output.getvalue()
+
+            self.assertEqual(run()[0], 1)
+            write_fit(bad_path, 100, start_time=1000086400)
+            good_mtime = os.stat(os.path.join(output_dir, 'good.gpx')).st_mtime_ns
+            code, output = run('--retry-failed')
+            self.assertEqual(code, 0)
+            self.assertIn("重试之前失败的 1 个文件", output)
+            self.assertIn("已转换: bad.fit -> bad.gpx", output)
+            self.assertNotIn("good.fit", output)
+            self.assertEqual(os.stat(os.path.join(output_dir, 'good.gpx')).st_mtime_ns, good_mtime)
+            code, output = run('--retry-failed')
+            self.assertIn("重试之前失败的 0 个文件", output)
+
+
+if __name__ == '__main__':
+    unittest.main()
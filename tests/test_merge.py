@@ -0,0 +1,112 @@
+"""合并模式：分组规则和按时间的k路归并
+
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_decoder import RecordChunk
+from fit2gpx_merge import FitSummary, MergeConverter, group_summaries, merge_chunks
+from benchmarks.fit_synth import build_fit
+
+T = 1000000000
+
+
+def chunk(timestamps):
+    count = len(timestamps)
+    return RecordChunk.from_lists(timestamps, [31.0] * count, [121.0] * count, [10.0] * count)
+
+
+def merged_timestamps(streams):
+    return [int(t) for part in merge_chunks(streams) for t in part.timestamp]
+
+
+def names(groups):
+    return [[summary.fit_file_path for summary in group] for group in groups]
+
+
+class MergeChunksTest(unittest.TestCase):
+    def test_interleaves_by_timestamp(self):
+        streams = [[chunk([1, 4, 5]), chunk([9])], [chunk([2, 3]), chunk([6, 7, 8])]]
+        self.assertEqual(merged_timestamps(streams), list(range(1, 10)))
+
+    def test_equal_timestamps_keep_stream_order(self):
+        first = chunk([1, 2, 2])
+        second = chunk([2, 3])
+        second.altitude[:] = 20.0
+        parts = list(merge_chunks([[first], [second]]))
+        altitudes = [float(a) for part in parts for a in part.altitude]
+        self.assertEqual(altitudes, [10.0, 10.0, 10.0, 20.0, 20.0])
+
+    def test_untimed_records_are_dropped(self):
+        streams = [[chunk([-1, 5, 6])], [chunk([1, -1, 2]), chunk([-1, -1])]]
+        self.assertEqual(merged_timestamps(streams), [1, 2, 5, 6])
+
+    def test_skips_empty_chunks(self):
+        streams = [[chunk([]), chunk([3])], [], [chunk([1]), chunk([]), chunk([2])]]
+        self.assertEqual(merged_timestamps(streams), [1, 2, 3])
+
+
+class GroupSummariesTest(unittest.TestCase):
+    def test_consecutive_files_form_one_group(self):
+        summaries = [FitSummary('b', 'dev', 200, 300), FitSummary('a', 'dev', 100, 190),
+                     FitSummary('c', 'dev', 300, 400)]
+        self.assertEqual(names(group_summaries(summaries, window=60)), [['a', 'b', 'c']])
+
+    def test_window_and_device_separate_groups(self):
+        summaries = [FitSummary('a', 'dev', 100, 200), FitSummary('b', 'dev', 300, 400),
+                     FitSummary('c', 'other', 150, 250)]
+        self.assertEqual(names(group_summaries(summaries, window=60)), [['a'], ['c'], ['b']])
+
+    def test_overlapping_recording_is_not_merged(self):
+        summaries = [FitSummary('a', 'dev', 100, 200), FitSummary('copy', 'dev', 100, 200),
+                     FitSummary('b', 'dev', 210, 300)]
+        self.assertEqual(names(group_summaries(summaries, window=60)), [['a', 'b'], ['copy']])
+
+    def test_partial_overlap_starts_new_group(self):
+        summaries = [FitSummary('a', 'dev', 100, 200), FitSummary('b', 'dev', 150, 250)]
+        self.assertEqual(names(group_summaries(summaries, window=60)), [['a'], ['b']])
+
+    def test_untimed_files_are_separate(self):
+        summaries = [FitSummary('a', 'dev', 100, 200), FitSummary('x', 'dev')]
+        self.assertEqual(names(group_summaries(summaries, window=60)), [['a'], ['x']])
+
+
+class MergeConverterTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.temp_dir = self._temp_dir.name
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_merges_split_activity_and_keeps_duplicate_apart(self):
+        first = self.write('a1.fit', build_fit(300, start_time=T, serial_number=1))
+        second = self.write('a2.fit', build_fit(200, start_time=T + 400, serial_number=1))
+        duplicate = self.write('a1_copy.fit', build_fit(300, start_time=T, serial_number=1))
+        converter = MergeConverter(workers=1, window=600, gap=None)
+        groups, failed = converter.scan([first, second, duplicate])
+        self.assertEqual(failed, [])
+        self.assertEqual(names(groups), [[first, second], [duplicate]])
+
+        results = converter.run(groups, self.temp_dir)
+        self.assertTrue(all(result.success for result in results))
+        self.assertEqual([result.points for result in results], [500, 300])
+        self.assertEqual(results[0].info['segments'], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'a1_merged.gpx')))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'a1_copy.gpx')))
+
+
+if __name__ == '__main__':
+    unittest.main()
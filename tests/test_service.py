@@ -0,0 +1,164 @@
+"""转换服务：HTTP接口、背压，以及客户端断开时取消任务
+
+转换任务交给测试中可控制的执行器，任务何时开始、何时完成由测试决定。
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_service import AsyncConverter, ServiceBusy, start_server
+from benchmarks.fit_synth import build_fit
+
+
+class HeldExecutor:
+    """submit() 只返回尚未开始的Future，测试调用 run_all() 时才执行还没有执行或取消的任务"""
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, function, *args):
+        future = Future()
+        self.submitted.append((future, function, args))
+        return future
+
+    def run_all(self):
+        for future, function, args in self.submitted:
+            if not future.done() and future.set_running_or_notify_cancel():
+                future.set_result(function(*args))
+
+
+class GatedExecutor(ThreadPoolExecutor):
+    """任务在线程中运行，但要等 gate 打开后才开始转换"""
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.gate = threading.Event()
+
+    def submit(self, function, *args):
+        def run():
+            self.gate.wait(30)
+            return function(*args)
+        return super().submit(run)
+
+
+async def request(port, data, close_after_send=False):
+    """发送原始请求，返回 (状态码, 响应体)；close_after_send 为True时发送后立即断开"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(data)
+    await writer.drain()
+    if close_after_send:
+        writer.close()
+        await writer.wait_closed()
+        return None, None
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1]), body
+
+
+def convert_request(data, extra=b""):
+    return f"POST /convert HTTP/1.1\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data + extra
+
+
+class ServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.fit_data = build_fit(200)
+
+    async def asyncTearDown(self):
+        self._temp_dir.cleanup()
+
+    async def serve(self, converter, **kwargs):
+        server = await start_server(converter, self._temp_dir.name, port=0, **kwargs)
+        self.addAsyncCleanup(self.stop_server, server)
+        return server.sockets[0].getsockname()[1]
+
+    async def stop_server(self, server):
+        server.close()
+        await server.wait_closed()
+
+    async def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("等待超时")
+
+    async def test_converts_upload(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        port = await self.serve(AsyncConverter(workers=1, executor=executor))
+        status, body = await request(port, convert_request(self.fit_data))
+        self.assertEqual(status, 200)
+        self.assertTrue(body.startswith(b'<?xml'))
+        self.assertEqual(body.count(b'<trkpt '), 200)
+        status, _ = await request(port, convert_request(b'x' * 2000))
+        self.assertEqual(status, 422)
+
+    async def test_request_errors(self):
+        converter = AsyncConverter(workers=1, executor=HeldExecutor())
+        port = await self.serve(converter, max_body=1000)
+        self.assertEqual((await request(port, convert_request(b'x' * 2000)))[0], 413)
+        self.assertEqual((await request(port, b"GET /nowhere HTTP/1.1\r\n\r\n"))[0], 404)
+        self.assertEqual((await request(port, b"GET /convert HTTP/1.1\r\n\r\n"))[0], 405)
+        self.assertEqual((await request(port, b"POST /convert HTTP/1.1\r\n\r\n"))[0], 411)
+        status, body = await request(port, b"GET /health HTTP/1.1\r\n\r\n")
+        self.assertEqual((status, body), (200, b'{"in_flight": 0, "waiting": 0}'))
+
+    async def test_disconnect_cancels_waiting_job(self):
+        executor = HeldExecutor()
+        converter = AsyncConverter(workers=1, executor=executor)
+        port = await self.serve(converter)
+        await request(port, convert_request(self.fit_data), close_after_send=True)
+        await self.wait_for(lambda: executor.submitted and executor.submitted[0][0].cancelled())
+        await self.wait_for(lambda: converter.in_flight == 0)
+        # 任务目录已删除
+        await self.wait_for(lambda: os.listdir(self._temp_dir.name) == [])
+
+    async def test_pipelined_data_does_not_cancel(self):
+        executor = GatedExecutor()
+        self.addCleanup(executor.shutdown)
+        converter = AsyncConverter(workers=1, executor=executor)
+        port = await self.serve(converter)
+        pending = asyncio.ensure_future(
+            request(port, convert_request(self.fit_data, b"GET /health HTTP/1.1\r\n\r\n")))
+        await self.wait_for(lambda: converter.in_flight == 1)
+        await asyncio.sleep(0.1)
+        executor.gate.set()
+        status, body = await pending
+        self.assertEqual(status, 200)
+        self.assertEqual(body.count(b'<trkpt '), 200)
+
+    async def test_backpressure(self):
+        executor = HeldExecutor()
+        converter = AsyncConverter(workers=1, max_in_flight=1, max_waiting=1, executor=executor)
+        fit_path = os.path.join(self._temp_dir.name, 'a.fit')
+        with open(fit_path, 'wb') as f:
+            f.write(self.fit_data)
+        first = asyncio.ensure_future(converter.convert(fit_path, fit_path + '.1.gpx'))
+        second = asyncio.ensure_future(converter.convert(fit_path, fit_path + '.2.gpx'))
+        await self.wait_for(lambda: converter.in_flight == 1 and converter.waiting == 1)
+        self.assertTrue(converter.busy())
+        with self.assertRaises(ServiceBusy):
+            await converter.convert(fit_path)
+        port = await self.serve(converter)
+        status, _ = await request(port, convert_request(self.fit_data))
+        self.assertEqual(status, 503)
+
+        executor.run_all()
+        self.assertTrue((await first).success)
+        await self.wait_for(lambda: len(executor.submitted) == 2)
+        executor.run_all()
+        self.assertTrue((await second).success)
+        self.assertEqual((converter.in_flight, converter.waiting), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""轨迹简化与重采样：RDP结果、容差上限、最大点数和按时间间隔重采样
+
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fit2gpx_simplify
+from fit2gpx_decoder import RecordChunk
+from fit2gpx_simplify import TrackSimplifier, resample_indices, simplify_indices
+
+
+def segment_distance(x, y, start, end, index):
+    """点到线段（首尾两点之间）的距离"""
+    ax, ay = x[start], y[start]
+    dx, dy = x[end] - ax, y[end] - ay
+    px, py = x[index] - ax, y[index] - ay
+    length2 = dx * dx + dy * dy
+    t = np.clip((px * dx + py * dy) / (length2 if length2 > 0 else 1.0), 0.0, 1.0)
+    return np.hypot(px - t * dx, py - t * dy)
+
+
+def reference_rdp(x, y, tolerance):
+    """递归的标准RDP，返回保留点的下标"""
+    keep = {0, len(x) - 1}
+    stack = [(0, len(x) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = np.arange(start + 1, end)
+        distance = segment_distance(x, y, start, end, inner)
+        pivot = int(inner[np.argmax(distance)])
+        if distance.max() > tolerance:
+            keep.add(pivot)
+            stack += [(start, pivot), (pivot, end)]
+    return np.array(sorted(keep))
+
+
+def random_walk(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(0, 5, count)), np.cumsum(rng.normal(0, 5, count))
+
+
+def spiral(count):
+    angle = np.arange(count) * 0.05
+    radius = 1000.0 * 0.999 ** np.arange(count)
+    return radius * np.cos(angle), radius * np.sin(angle)
+
+
+class SimplifyTest(unittest.TestCase):
+    def assertWithinTolerance(self, x, y, keep, tolerance):
+        self.assertEqual(keep[0], 0)
+        self.assertEqual(keep[-1], len(x) - 1)
+        for start, end in zip(keep[:-1], keep[1:]):
+            if end - start > 1:
+                distance = segment_distance(x, y, start, end, np.arange(start + 1, end))
+                self.assertLessEqual(distance.max(), tolerance + 1e-9)
+
+    def test_matches_reference_rdp(self):
+        for seed in range(5):
+            x, y = random_walk(2000, seed)
+            for tolerance in (1.0, 10.0, 50.0):
+                with self.subTest(seed=seed, tolerance=tolerance):
+                    np.testing.assert_array_equal(simplify_indices(x, y, tolerance),
+                                                  reference_rdp(x, y, tolerance))
+
+    def test_error_bounded_by_tolerance(self):
+        for name, (x, y) in (('random_walk', random_walk(5000)), ('spiral', spiral(5000))):
+            for tolerance in (0.5, 5.0, 50.0):
+                with self.subTest(track=name, tolerance=tolerance):
+                    self.assertWithinTolerance(x, y, simplify_indices(x, y, tolerance), tolerance)
+
+    def test_error_bounded_after_depth_limit(self):
+        x, y = spiral(3000)
+        with mock.patch.object(fit2gpx_simplify, 'RDP_MAX_DEPTH', 3):
+            keep = simplify_indices(x, y, 2.0)
+        self.assertWithinTolerance(x, y, keep, 2.0)
+
+    def test_max_points(self):
+        x, y = random_walk(3000)
+        keep = simplify_indices(x, y, max_points=100)
+        self.assertLessEqual(len(keep), 100)
+        self.assertEqual((keep[0], keep[-1]), (0, 2999))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+        # 点数限制取重要度最高的点：与只按容差简化到不超过100个点的结果一致
+        importance = fit2gpx_simplify.rdp_importance(x, y)
+        threshold = np.sort(importance)[-100]
+        np.testing.assert_array_equal(keep, np.flatnonzero(importance >= threshold))
+
+    def test_collinear_points_removed(self):
+        x = np.arange(10.0)
+        np.testing.assert_array_equal(simplify_indices(x, 2 * x, max_points=5), [0, 9])
+
+
+class ResampleTest(unittest.TestCase):
+    def test_keeps_first_point_of_each_interval_and_last_point(self):
+        timestamps = np.array([0, 1, 2, 5, 6, 10, 11, 12])
+        np.testing.assert_array_equal(resample_indices(timestamps, 5), [0, 3, 5, 7])
+
+    def test_untimed_points_follow_previous_time(self):
+        timestamps = np.array([-1, 0, -1, 4, 5, -1, 9])
+        np.testing.assert_array_equal(resample_indices(timestamps, 5), [0, 4, 6])
+
+    def test_without_timestamps_keeps_all(self):
+        np.testing.assert_array_equal(resample_indices(np.full(5, -1), 5), np.arange(5))
+
+
+class TrackSimplifierTest(unittest.TestCase):
+    def test_drops_invalid_positions_and_counts_points(self):
+        count = 1000
+        latitude = 31.0 + np.arange(count) * 1e-5
+        longitude = 121.0 + np.arange(count) * 1e-5
+        latitude[::10] = np.nan
+        chunk = RecordChunk(np.arange(count, dtype=np.int64), latitude, longitude, np.zeros(count))
+        simplifier = TrackSimplifier(tolerance=1.0, interval=60)
+        tracks = list(simplifier.apply([chunk.select(slice(0, 500)), chunk.select(slice(500, None))]))
+        self.assertEqual(simplifier.input_points, 900)
+        self.assertEqual(len(tracks), 1)
+        self.assertEqual(simplifier.output_points, len(tracks[0]))
+        # 直线上按60秒重采样后只剩首尾两点
+        self.assertEqual(tracks[0].timestamp.tolist(), [1, 999])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""界面消息通道：按刷新间隔合并日志和进度，日志窗口只保留最近的行
+
+用简单的替身代替Tk控件，不需要图形界面环境。
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_uibridge import ProgressTracker, UiBridge, format_duration
+
+
+class FakeRoot:
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+
+    def tick(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class FakeText:
+    """只实现 UiBridge 用到的 Text 方法，位置均为 “行.列” 形式"""
+    def __init__(self):
+        self.lines = ['']
+        self.inserts = 0
+
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+
+    def insert(self, index, text):
+        self.inserts += 1
+        content = text + self.text if index == '1.0' else self.text + text
+        self.lines = content.split('\n')
+
+    def index(self, index):
+        assert index == 'end-1c'
+        return f"{len(self.lines)}.{len(self.lines[-1])}"
+
+    def delete(self, start, end):
+        first = int(start.split('.')[0]) - 1
+        last = int(end.split('.')[0]) - 1
+        del self.lines[first:last]
+
+    def see(self, index):
+        pass
+
+
+class FakeVar:
+    def __init__(self):
+        self.values = []
+
+    def set(self, value):
+        self.values.append(value)
+
+
+class UiBridgeTest(unittest.TestCase):
+    def setUp(self):
+        self.root = FakeRoot()
+        self.log_text = FakeText()
+        self.progress = FakeVar()
+        self.status = FakeVar()
+
+    def bridge(self, **kwargs):
+        return UiBridge(self.root, self.log_text, self.progress, self.status, **kwargs)
+
+    def logged_lines(self):
+        return [line.split('] ', 1)[1] for line in self.log_text.lines if '] ' in line]
+
+    def test_logs_from_threads_are_inserted_once_per_tick(self):
+        bridge = self.bridge()
+        threads = [threading.Thread(target=lambda n=n: [bridge.log(f"{n}-{i}") for i in range(500)])
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.log_text.inserts, 0)
+        self.root.tick()
+        self.assertEqual(self.log_text.inserts, 1)
+        self.assertEqual(len(self.logged_lines()), 2000)
+        # 之后继续定时刷新
+        self.assertEqual(len(self.root.callbacks), 1)
+
+    def test_progress_shows_latest_value(self):
+        bridge = self.bridge()
+        bridge.begin(200, "正在转换")
+        for done in range(1, 151):
+            bridge.progress(done)
+        self.root.tick()
+        self.assertEqual(self.progress.values, [75.0])
+        self.assertTrue(self.status.values[-1].startswith("正在转换 150/200（75.0%）"))
+        bridge.status("转换完成")
+        self.root.tick()
+        self.assertEqual(self.status.values[-1], "转换完成")
+        bridge.progress(200)
+        self.root.tick()
+        self.assertEqual(self.progress.values, [75.0, 75.0])
+
+    def test_call_runs_after_earlier_updates(self):
+        bridge = self.bridge()
+        seen = []
+        bridge.log("完成")
+        bridge.status("转换完成")
+        bridge.call(lambda: seen.append((self.logged_lines(), self.status.values[-1])))
+        bridge.log("之后")
+        self.root.tick()
+        self.assertEqual(seen, [(["完成"], "转换完成")])
+        self.assertEqual(self.logged_lines(), ["完成", "之后"])
+
+    def test_log_window_keeps_recent_lines_and_file_keeps_all(self):
+        with tempfile.TemporaryDirectory() as folder:
+            log_path = os.path.join(folder, 'logs', 'run.log')
+            bridge = self.bridge(log_path=log_path, max_log_lines=50)
+            for i in range(120):
+                bridge.log(f"第 {i} 行")
+            self.root.tick()
+            bridge.log("最后")
+            self.root.tick()
+            bridge.close()
+            with open(log_path, encoding='utf-8') as f:
+                file_lines = f.read().splitlines()
+        self.assertEqual(len(file_lines), 121)
+        self.assertIn("日志窗口只显示最近 50 行", self.log_text.lines[0])
+        # 提示行也计入窗口的行数
+        self.assertEqual(self.logged_lines(), [f"第 {i} 行" for i in range(72, 120)] + ["最后"])
+
+
+class ProgressTrackerTest(unittest.TestCase):
+    def test_rate_and_eta(self):
+        tracker = ProgressTracker(100, 0.0)
+        self.assertIsNone(tracker.rate())
+        tracker.update(10, 2.0)
+        tracker.update(20, 4.0)
+        self.assertAlmostEqual(tracker.rate(), 5.0)
+        self.assertAlmostEqual(tracker.eta(), 16.0)
+        self.assertIn("预计剩余 00:16", tracker.describe())
+
+    def test_rate_uses_recent_window(self):
+        tracker = ProgressTracker(1000, 0.0)
+        tracker.update(10, 10.0)
+        for second in range(11, 40):
+            tracker.update(10 + (second - 10) * 10, float(second))
+        self.assertAlmostEqual(tracker.rate(), 10.0)
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(75), "01:15")
+        self.assertEqual(format_duration(3725), "1:02:05")
+
+
+if __name__ == '__main__':
+    unittest.main()
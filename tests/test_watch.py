@@ -0,0 +1,110 @@
+"""监视文件夹模式：防抖、未写完文件的判断，以及新增文件的自动转换
+
+运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fit2gpx_watch import FolderWatcher
+from benchmarks.fit_synth import build_fit, truncate_fit
+
+
+class DebounceTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.folder = self._temp_dir.name
+        self.watcher = FolderWatcher(self.folder, self.folder, workers=1, settle_seconds=2.0, max_wait=30.0,
+                                     use_events=False, log_message=lambda message: None)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.watcher._file_changed(path)
+        return path
+
+    def check(self, seconds_later):
+        self.watcher._check_pending(time.monotonic() + seconds_later)
+        return list(self.watcher._ready)
+
+    def test_waits_for_settle_time(self):
+        path = self.write('a.fit', build_fit(100))
+        self.assertEqual(self.check(1.0), [])
+        self.assertEqual(self.check(2.5), [path])
+        self.assertEqual(self.watcher._pending, {})
+
+    def test_change_restarts_settle_time(self):
+        path = self.write('a.fit', truncate_fit(build_fit(100), 0.5))
+        pending = self.watcher._pending[path]
+        pending.stable_since -= 10
+        self.write('a.fit', build_fit(100))
+        self.assertEqual(self.check(1.0), [])
+        self.assertEqual(self.check(2.5), [path])
+
+    def test_incomplete_file_waits_until_max_wait(self):
+        path = self.write('a.fit', truncate_fit(build_fit(300)))
+        self.assertEqual(self.check(2.5), [])
+        self.assertIn(path, self.watcher._pending)
+        self.watcher._pending[path].first_seen -= 60
+        self.assertEqual(self.check(5.0), [path])
+
+    def test_too_small_file_is_incomplete(self):
+        path = self.write('a.fit', build_fit(100)[:20])
+        self.assertEqual(self.check(2.5), [])
+        self.assertIn(path, self.watcher._pending)
+
+    def test_invalid_header_is_passed_on(self):
+        path = self.write('a.fit', b'x' * 2000)
+        self.assertEqual(self.check(2.5), [path])
+
+    def test_deleted_file_is_forgotten(self):
+        path = self.write('a.fit', build_fit(100))
+        os.remove(path)
+        self.assertEqual(self.check(2.5), [])
+        self.assertEqual(self.watcher._pending, {})
+
+    def test_ignores_other_files(self):
+        path = os.path.join(self.folder, 'notes.txt')
+        with open(path, 'w') as f:
+            f.write('x')
+        self.watcher._file_changed(path)
+        self.assertEqual(self.watcher._pending, {})
+
+
+class WatchRunTest(unittest.TestCase):
+    def test_converts_new_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, 'out')
+            messages = []
+            watcher = FolderWatcher(folder, output, workers=1, settle_seconds=0.2, poll_interval=0.1,
+                                    use_events=False, log_message=messages.append)
+            thread = threading.Thread(target=watcher.run)
+            thread.start()
+            try:
+                with open(os.path.join(folder, 'ride.fit'), 'wb') as f:
+                    f.write(build_fit(200))
+                gpx_path = os.path.join(output, 'ride.gpx')
+                deadline = time.monotonic() + 30
+                while not os.path.exists(gpx_path) and time.monotonic() < deadline:
+                    time.sleep(0.05)
+            finally:
+                watcher.stop()
+                thread.join(30)
+            self.assertFalse(thread.is_alive())
+            self.assertTrue(os.path.exists(gpx_path))
+            self.assertIn("已转换: ride.fit -> ride.gpx", messages)
+            self.assertEqual(messages[-1], "已停止监视")
+
+
+if __name__ == '__main__':
+    unittest.main()